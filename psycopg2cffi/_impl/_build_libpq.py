@@ -299,6 +299,15 @@ extern int PQbackendPID(const PGconn *conn);
 // Command execution functions
 
 extern PGresult *PQexec(PGconn *conn, const char *query);
+extern PGresult *PQexecParams(PGconn *conn, const char *command,
+    int nParams, const Oid *paramTypes, const char * const *paramValues,
+    const int *paramLengths, const int *paramFormats, int resultFormat);
+extern PGresult *PQprepare(PGconn *conn, const char *stmtName,
+    const char *query, int nParams, const Oid *paramTypes);
+extern PGresult *PQexecPrepared(PGconn *conn, const char *stmtName,
+    int nParams, const char * const *paramValues,
+    const int *paramLengths, const int *paramFormats, int resultFormat);
+extern PGresult *PQdescribePrepared(PGconn *conn, const char *stmtName);
 extern /*ExecStatusType*/ int PQresultStatus(const PGresult *res);
 extern char *PQresultErrorMessage(const PGresult *res);
 extern char *PQresultErrorField(const PGresult *res, int fieldcode);
@@ -312,6 +321,7 @@ extern char *PQfname(const PGresult *res, int field_num);
 extern Oid PQftype(const PGresult *res, int field_num);
 extern int PQfsize(const PGresult *res, int field_num);
 extern int PQfmod(const PGresult *res, int field_num);
+extern int PQfformat(const PGresult *res, int field_num);
 extern int PQgetisnull(const PGresult *res, int tup_num, int field_num);
 extern int PQgetlength(const PGresult *res, int tup_num, int field_num);
 extern char *PQgetvalue(const PGresult *res, int tup_num, int field_num);
@@ -322,6 +332,32 @@ int PQEgetlong(int64_t *val, const PGresult *res, int tup_num, int field_num);
 int PQEgetint(int32_t *val, const PGresult *res, int tup_num, int field_num);
 int PQEgetfloat(float *val, const PGresult *res, int tup_num, int field_num);
 int PQEgetdouble(double *val, const PGresult *res, int tup_num, int field_num);
+int PQEgetlongs(int64_t *vals, const PGresult *res, int tup_num, int ntups, int field_num);
+int PQEgetints(int32_t *vals, const PGresult *res, int tup_num, int ntups, int field_num);
+int PQEgetfloats(float *vals, const PGresult *res, int tup_num, int ntups, int field_num);
+int PQEgetdoubles(double *vals, const PGresult *res, int tup_num, int ntups, int field_num);
+int PQEgetcolumn(void *vals, char *nulls, const PGresult *res, int tup_num, int ntups, int field_num, Oid oid);
+
+static int const PQE_CELL_VALUE;
+static int const PQE_CELL_INT;
+static int const PQE_CELL_FLOAT4;
+static int const PQE_CELL_FLOAT8;
+void PQEgetcells(const PGresult *res, int tup_num, int ntups, int nfields,
+    const int *kinds, char **vals, int *lengths, int64_t *ints, double *floats);
+
+static int const PQE_ARRAY_VALUE;
+static int const PQE_ARRAY_NULL;
+static int const PQE_ARRAY_OPEN;
+static int const PQE_ARRAY_CLOSE;
+int PQEparsearray(const char *s, size_t len, int *kinds, char *dst,
+    size_t *offsets, size_t *lengths);
+int PQEparsearraynumbers(const char *data, const int *kinds,
+    const size_t *offsets, int ntokens, int is_float,
+    int64_t *ints, double *floats);
+int PQEparsearrayitems(const char *data, const int *kinds,
+    const size_t *offsets, int ntokens, char typecode,
+    void *items, char *nulls);
+int PQEarraydims(const int *kinds, int ntokens, int *dims);
 
 // Retrieving other result information
 
@@ -335,6 +371,33 @@ if _config.libpq_version >= 0x090000:
     ffi.cdef('''
 // Escaping string for inclusion in sql commands
 extern char *PQescapeLiteral(PGconn *conn, const char *str, size_t len);
+
+// direct escaping of many strings - not part of libpq
+int PQEescapeliterals(PGconn *conn, const char *src, const size_t *lengths,
+    int n, char *dst, size_t *offsets);
+    ''')
+
+if _config.libpq_version >= 0x090200:
+    ffi.cdef('''
+// Retrieving query results row-by-row
+extern int PQsetSingleRowMode(PGconn *conn);
+static int const PGRES_SINGLE_TUPLE;
+    ''')
+
+if _config.libpq_version >= 0x0e0000:
+    ffi.cdef('''
+// Pipeline mode
+extern int PQenterPipelineMode(PGconn *conn);
+extern int PQexitPipelineMode(PGconn *conn);
+extern int PQpipelineSync(PGconn *conn);
+static int const PGRES_PIPELINE_SYNC;
+static int const PGRES_PIPELINE_ABORTED;
+    ''')
+
+if _config.libpq_version >= 0x110000:
+    ffi.cdef('''
+extern int PQsetChunkedRowsMode(PGconn *conn, int chunkSize);
+static int const PGRES_TUPLES_CHUNK;
     ''')
 
 ffi.cdef('''
@@ -351,9 +414,18 @@ extern unsigned char *PQescapeBytea(const unsigned char *from, size_t from_lengt
 extern unsigned char *PQunescapeBytea(const unsigned char *strtext,
     size_t *retbuflen);
 
+// direct bytea hex encoding - not part of libpq
+void PQEhexencode(const char *src, size_t len, char *dst);
+
 // Asynchronous Command Processing
 
 extern int PQsendQuery(PGconn *conn, const char *query);
+extern int PQsendQueryParams(PGconn *conn, const char *command,
+    int nParams, const Oid *paramTypes, const char * const *paramValues,
+    const int *paramLengths, const int *paramFormats, int resultFormat);
+extern int PQsendQueryPrepared(PGconn *conn, const char *stmtName,
+    int nParams, const char * const *paramValues,
+    const int *paramLengths, const int *paramFormats, int resultFormat);
 extern PGresult *PQgetResult(PGconn *conn);
 extern int PQconsumeInput(PGconn *conn);
 extern int PQisBusy(PGconn *conn);
@@ -406,9 +478,23 @@ C_SOURCE = '''
 #if (defined(_MSC_VER) && _MSC_VER < 1600)
     typedef __int32  int32_t;
     typedef __int64  int64_t;
+    typedef __int16  int16_t;
+    typedef unsigned __int32  uint32_t;
+    typedef unsigned __int64  uint64_t;
+    #define INT16_MIN (-32767 - 1)
+    #define INT16_MAX 32767
+    #define INT32_MIN (-2147483647 - 1)
+    #define INT32_MAX 2147483647
+    #define INT64_MIN (-9223372036854775807i64 - 1)
+    #define INT64_MAX 9223372036854775807i64
+    #define SCNd32 "d"
+    #define SCNd64 "I64d"
 #else
     #include <stdint.h>
+    #include <inttypes.h>
 #endif
+#include <stdlib.h>
+#include <string.h>
 #include <postgres_ext.h>
 #include <libpq-fe.h>
 
@@ -440,6 +526,497 @@ int PQEgetdouble(double *raw_res, const PGresult *res, int tup_num, int field_nu
     return 0;
 }
 
+/* Parse ntups values of a column starting from tup_num.
+ * Return the number of values parsed: less than ntups if a NULL is found. */
+#define PQE_GET_COLUMN(name, type, format) \
+int name(type *vals, const PGresult *res, int tup_num, int ntups, int field_num) { \
+    int i; \
+    for (i = 0; i < ntups; i++) { \
+        if (PQgetisnull(res, tup_num + i, field_num)) break; \
+        sscanf(PQgetvalue(res, tup_num + i, field_num), format, vals + i); \
+    } \
+    return i; \
+}
+
+PQE_GET_COLUMN(PQEgetlongs, int64_t, "%" SCNd64)
+PQE_GET_COLUMN(PQEgetints, int32_t, "%" SCNd32)
+PQE_GET_COLUMN(PQEgetfloats, float, "%f")
+PQE_GET_COLUMN(PQEgetdoubles, double, "%lf")
+
+/* How PQEgetcells() returns the cells of a column */
+#define CELL_VALUE 0    /* pointer to the value */
+#define CELL_INT 1      /* parsed into an int64 */
+#define CELL_FLOAT4 2   /* parsed into a float, as double */
+#define CELL_FLOAT8 3   /* parsed into a double */
+
+static int const PQE_CELL_VALUE = CELL_VALUE;
+static int const PQE_CELL_INT = CELL_INT;
+static int const PQE_CELL_FLOAT4 = CELL_FLOAT4;
+static int const PQE_CELL_FLOAT8 = CELL_FLOAT8;
+
+/* Extract the cells of ntups rows starting from tup_num in a single call.
+ *
+ * The arrays have an item for every cell, in row-major order. lengths is
+ * set to -1 for NULLs, else to the length of the value. Depending on the
+ * kind of its column, the value is stored in ints, in floats or its pointer
+ * in vals. */
+void PQEgetcells(const PGresult *res, int tup_num, int ntups, int nfields,
+    const int *kinds, char **vals, int *lengths, int64_t *ints, double *floats)
+{
+    int i, j, k;
+    float f;
+    char *val;
+
+    for (i = 0, k = 0; i < ntups; i++) {
+        for (j = 0; j < nfields; j++, k++) {
+            if (PQgetisnull(res, tup_num + i, j)) {
+                lengths[k] = -1;
+                continue;
+            }
+            val = PQgetvalue(res, tup_num + i, j);
+            lengths[k] = PQgetlength(res, tup_num + i, j);
+            switch (kinds[j]) {
+            case CELL_INT:
+                sscanf(val, "%" SCNd64, ints + k);
+                break;
+            case CELL_FLOAT4:
+                sscanf(val, "%f", &f);
+                floats[k] = f;
+                break;
+            case CELL_FLOAT8:
+                sscanf(val, "%lf", floats + k);
+                break;
+            default:
+                vals[k] = val;
+                break;
+            }
+        }
+    }
+}
+
+/* Days between 1970-01-01 and the given date of the proleptic Gregorian
+ * calendar */
+static int64_t pqe_days_from_civil(int64_t y, int64_t m, int64_t d)
+{
+    int64_t era, yoe, doy, doe;
+    y -= m <= 2;
+    era = (y >= 0 ? y : y - 399) / 400;
+    yoe = y - era * 400;
+    doy = (153 * (m + (m > 2 ? -3 : 9)) + 2) / 5 + d - 1;
+    doe = yoe * 365 + yoe / 4 - yoe / 100 + doy;
+    return era * 146097 + doe - 719468;
+}
+
+static const char *pqe_parse_digits(const char *s, int64_t *val)
+{
+    const char *start = s;
+    *val = 0;
+    while (*s >= '0' && *s <= '9') {
+        *val = *val * 10 + (*s++ - '0');
+    }
+    return s == start ? NULL : s;
+}
+
+/* Parse a date or timestamp in ISO format into days (if is_date) or
+ * microseconds since the Unix epoch. The timezone offset, if present, is
+ * subtracted. Infinity is mapped to the extreme int64 values. */
+static int pqe_parse_timestamp(const char *s, int is_date, int64_t *out)
+{
+    int64_t y, mo, d, h = 0, mi = 0, sec = 0, us = 0, off = 0, tmp;
+    int sign, ndigits;
+
+    if (!strcmp(s, "infinity")) { *out = INT64_MAX; return 0; }
+    if (!strcmp(s, "-infinity")) { *out = INT64_MIN + 1; return 0; }
+
+    if (!(s = pqe_parse_digits(s, &y)) || *s++ != '-') return -1;
+    if (!(s = pqe_parse_digits(s, &mo)) || *s++ != '-') return -1;
+    if (!(s = pqe_parse_digits(s, &d))) return -1;
+    if (*s == ' ' && s[1] >= '0' && s[1] <= '9') {
+        if (!(s = pqe_parse_digits(s + 1, &h)) || *s++ != ':') return -1;
+        if (!(s = pqe_parse_digits(s, &mi)) || *s++ != ':') return -1;
+        if (!(s = pqe_parse_digits(s, &sec))) return -1;
+        if (*s == '.') {
+            for (s++, ndigits = 0; *s >= '0' && *s <= '9'; s++, ndigits++) {
+                if (ndigits < 6) us = us * 10 + (*s - '0');
+            }
+            for (; ndigits < 6; ndigits++) us *= 10;
+        }
+    }
+    if (*s == '+' || *s == '-') {
+        sign = *s++ == '-' ? -1 : 1;
+        if (!(s = pqe_parse_digits(s, &tmp))) return -1;
+        off = tmp * 3600;
+        if (*s == ':') {
+            if (!(s = pqe_parse_digits(s + 1, &tmp))) return -1;
+            off += tmp * 60;
+            if (*s == ':') {
+                if (!(s = pqe_parse_digits(s + 1, &tmp))) return -1;
+                off += tmp;
+            }
+        }
+        off *= sign;
+    }
+    if (!strcmp(s, " BC")) {
+        y = 1 - y;
+        s += 3;
+    }
+    if (*s) return -1;
+
+    d = pqe_days_from_civil(y, mo, d);
+    if (is_date) {
+        *out = d;
+    }
+    else {
+        *out = (d * 86400 + h * 3600 + mi * 60 + sec - off) * 1000000 + us;
+    }
+    return 0;
+}
+
+static uint64_t pqe_read_be(const char *val, int size)
+{
+    const unsigned char *p = (const unsigned char *)val;
+    uint64_t rv = 0;
+    int i;
+    for (i = 0; i < size; i++) {
+        rv = (rv << 8) | p[i];
+    }
+    return rv;
+}
+
+/* Days and microseconds between 1970-01-01 and 2000-01-01 */
+#define PQE_EPOCH_DAYS 10957
+#define PQE_EPOCH_USECS 946684800000000LL
+
+/* Decode ntups values of a column of the fixed-size type oid (int2, int4,
+ * int8, float4, float8, bool, date, timestamp, timestamptz) starting from
+ * tup_num into the array vals, in text or binary format. Dates are
+ * converted into int64 days, timestamps into int64 microseconds since
+ * 1970-01-01. nulls[i] is set to 1 for NULL values.
+ *
+ * Return the number of NULLs, -1 if a value can't be parsed, -2 if the type
+ * is not supported. */
+int PQEgetcolumn(void *vals, char *nulls, const PGresult *res,
+        int tup_num, int ntups, int field_num, Oid oid)
+{
+    int i, nnulls = 0, binary = PQfformat(res, field_num) == 1;
+    const char *val;
+    uint64_t raw;
+    int64_t ts;
+    union { uint32_t i; float f; } f4;
+    union { uint64_t i; double f; } f8;
+
+    switch (oid) {
+    case 16: case 20: case 21: case 23: case 700: case 701:
+    case 1082: case 1114: case 1184:
+        break;
+    default:
+        return -2;
+    }
+
+    for (i = 0; i < ntups; i++) {
+        if (PQgetisnull(res, tup_num + i, field_num)) {
+            nulls[i] = 1;
+            nnulls++;
+            val = NULL;
+        }
+        else {
+            nulls[i] = 0;
+            val = PQgetvalue(res, tup_num + i, field_num);
+        }
+
+        switch (oid) {
+        case 21:
+            ((int16_t *)vals)[i] = !val ? 0 : binary
+                ? (int16_t)pqe_read_be(val, 2) : (int16_t)strtol(val, NULL, 10);
+            break;
+        case 23:
+            ((int32_t *)vals)[i] = !val ? 0 : binary
+                ? (int32_t)pqe_read_be(val, 4) : (int32_t)strtol(val, NULL, 10);
+            break;
+        case 20:
+            ((int64_t *)vals)[i] = !val ? 0 : binary
+                ? (int64_t)pqe_read_be(val, 8) : (int64_t)strtoll(val, NULL, 10);
+            break;
+        case 700:
+            if (val && binary) {
+                f4.i = (uint32_t)pqe_read_be(val, 4);
+            }
+            else {
+                f4.f = val ? (float)strtod(val, NULL) : 0;
+            }
+            ((float *)vals)[i] = f4.f;
+            break;
+        case 701:
+            if (val && binary) {
+                f8.i = pqe_read_be(val, 8);
+            }
+            else {
+                f8.f = val ? strtod(val, NULL) : 0;
+            }
+            ((double *)vals)[i] = f8.f;
+            break;
+        case 16:
+            ((char *)vals)[i] = val ? (binary ? *val != 0 : *val == 't') : 0;
+            break;
+        default:    /* date and timestamps */
+            ts = 0;
+            if (val && binary) {
+                if (oid == 1082) {
+                    raw = pqe_read_be(val, 4);
+                    ts = (int32_t)raw;
+                    if (ts == INT32_MAX) ts = INT64_MAX;
+                    else if (ts == INT32_MIN) ts = INT64_MIN + 1;
+                    else ts += PQE_EPOCH_DAYS;
+                }
+                else {
+                    ts = (int64_t)pqe_read_be(val, 8);
+                    if (ts == INT64_MIN) ts = INT64_MIN + 1;
+                    else if (ts != INT64_MAX) ts += PQE_EPOCH_USECS;
+                }
+            }
+            else if (val) {
+                if (pqe_parse_timestamp(val, oid == 1082, &ts) < 0) {
+                    return -1;
+                }
+            }
+            ((int64_t *)vals)[i] = ts;
+            break;
+        }
+    }
+    return nnulls;
+}
+
+/* The tokens of an array literal found by PQEparsearray() */
+#define ARRAY_VALUE 0   /* an element */
+#define ARRAY_NULL 1    /* an unquoted NULL element */
+#define ARRAY_OPEN 2    /* the start of a dimension */
+#define ARRAY_CLOSE 3   /* the end of a dimension */
+#define ARRAY_MAX_DIMS 16
+
+static int const PQE_ARRAY_VALUE = ARRAY_VALUE;
+static int const PQE_ARRAY_NULL = ARRAY_NULL;
+static int const PQE_ARRAY_OPEN = ARRAY_OPEN;
+static int const PQE_ARRAY_CLOSE = ARRAY_CLOSE;
+
+/* Split the array literal s of len bytes into its tokens.
+ * If kinds is NULL only count the tokens. Otherwise store the kind of every
+ * token in kinds and write the elements, unquoted and unescaped, into dst
+ * (len bytes), each one followed by a zero byte, with their offset in dst
+ * and their length in offsets and lengths.
+ * Return the number of tokens, -1 if the literal is malformed, -2 if it has
+ * too many dimensions, -3 if its braces are unbalanced. */
+int PQEparsearray(const char *s, size_t len, int *kinds, char *dst,
+        size_t *offsets, size_t *lengths) {
+    size_t i = 0, out = 0, start;
+    int n = 0, depth = 0, quoted, literal;
+    char c;
+
+    if (len < 2 || s[0] != '{' || s[len - 1] != '}') return -1;
+
+    while (i < len) {
+        c = s[i];
+        if (c == '{') {
+            if (depth == 0 && i > 0) return -3;
+            if (++depth > ARRAY_MAX_DIMS) return -2;
+            if (kinds) kinds[n] = ARRAY_OPEN;
+            n++;
+            i++;
+        }
+        else if (c == '}') {
+            if (depth-- == 0) return -3;
+            if (kinds) kinds[n] = ARRAY_CLOSE;
+            n++;
+            i++;
+        }
+        else if (c == ',' || c == ' ') {
+            i++;
+        }
+        else {
+            if (depth == 0) return -3;
+            start = out;
+            quoted = 0;
+            literal = 0;    /* quoted or escaped: can't be a NULL */
+            for (; i < len; i++) {
+                c = s[i];
+                if (c == '"') {
+                    quoted = !quoted;
+                    literal = 1;
+                }
+                else if (c == '\\\\') {
+                    if (++i >= len) return -1;
+                    if (kinds) dst[out] = s[i];
+                    out++;
+                    literal = 1;
+                }
+                else if (!quoted && (c == ',' || c == '}')) {
+                    break;
+                }
+                else {
+                    if (kinds) dst[out] = c;
+                    out++;
+                }
+            }
+            if (quoted) return -1;
+            if (kinds) {
+                dst[out] = '\\0';
+                offsets[n] = start;
+                lengths[n] = out - start;
+                kinds[n] = ARRAY_VALUE;
+                if (!literal && out - start == 4
+                        && (dst[start] | 0x20) == 'n'
+                        && (dst[start + 1] | 0x20) == 'u'
+                        && (dst[start + 2] | 0x20) == 'l'
+                        && (dst[start + 3] | 0x20) == 'l') {
+                    kinds[n] = ARRAY_NULL;
+                }
+            }
+            out++;
+            n++;
+        }
+    }
+    if (depth != 0) return -3;
+    return n;
+}
+
+/* Parse the zero-terminated number s into ival, or into fval if is_float.
+ * Return 0, or -1 if s is not a number in the expected format. */
+static int pqe_parse_number(const char *s, int is_float,
+        int64_t *ival, double *fval) {
+    char *end;
+    uint64_t val, limit;
+    int neg;
+
+    if (is_float) {
+        *fval = strtod(s, &end);
+        return (end == s || *end != '\\0') ? -1 : 0;
+    }
+    neg = (*s == '-');
+    if (neg) s++;
+    if (*s < '0' || *s > '9') return -1;
+    limit = neg ? (uint64_t)INT64_MAX + 1 : (uint64_t)INT64_MAX;
+    for (val = 0; *s >= '0' && *s <= '9'; s++) {
+        if (val > (limit - (uint64_t)(*s - '0')) / 10) return -1;
+        val = val * 10 + (uint64_t)(*s - '0');
+    }
+    if (*s != '\\0') return -1;
+    *ival = neg ? (int64_t)(0 - val) : (int64_t)val;
+    return 0;
+}
+
+/* Parse the elements found by PQEparsearray() into ints, or into floats if
+ * is_float is set. The items of the other tokens are set to 0.
+ * Return 0, or -1 if an element is not a number in the expected format. */
+int PQEparsearraynumbers(const char *data, const int *kinds,
+        const size_t *offsets, int ntokens, int is_float,
+        int64_t *ints, double *floats) {
+    int i;
+
+    for (i = 0; i < ntokens; i++) {
+        if (kinds[i] != ARRAY_VALUE) {
+            if (is_float) floats[i] = 0.0;
+            else ints[i] = 0;
+        }
+        else if (pqe_parse_number(data + offsets[i], is_float,
+                ints + i, floats + i) < 0) {
+            return -1;
+        }
+    }
+    return 0;
+}
+
+/* Parse the elements found by PQEparsearray() into items, an array of the
+ * C type of the array module typecode ('h', 'i', 'q', 'f' or 'd'), setting
+ * the NULLs to 0 and flagging them in nulls.
+ * Return the number of NULLs, or -1 if an element is not a number in the
+ * expected format or is out of the range of the type. */
+int PQEparsearrayitems(const char *data, const int *kinds,
+        const size_t *offsets, int ntokens, char typecode,
+        void *items, char *nulls) {
+    int is_float = (typecode == 'f' || typecode == 'd');
+    int i, n = 0, nnulls = 0;
+    int64_t ival = 0;
+    double fval = 0.0;
+
+    for (i = 0; i < ntokens; i++) {
+        if (kinds[i] == ARRAY_OPEN || kinds[i] == ARRAY_CLOSE) continue;
+        nulls[n] = (kinds[i] == ARRAY_NULL);
+        if (nulls[n]) {
+            ival = 0;
+            fval = 0.0;
+            nnulls++;
+        }
+        else if (pqe_parse_number(data + offsets[i], is_float,
+                &ival, &fval) < 0) {
+            return -1;
+        }
+        switch (typecode) {
+        case 'h':
+            if (ival < INT16_MIN || ival > INT16_MAX) return -1;
+            ((int16_t *)items)[n] = (int16_t)ival;
+            break;
+        case 'i':
+            if (ival < INT32_MIN || ival > INT32_MAX) return -1;
+            ((int32_t *)items)[n] = (int32_t)ival;
+            break;
+        case 'q':
+            ((int64_t *)items)[n] = ival;
+            break;
+        case 'f':
+            ((float *)items)[n] = (float)fval;
+            break;
+        default:
+            ((double *)items)[n] = fval;
+            break;
+        }
+        n++;
+    }
+    return nnulls;
+}
+
+/* Store the dimensions of the array tokenized by PQEparsearray() in dims,
+ * which must have room for 16 items. Return the number of dimensions, or -1
+ * if the array is not rectangular. */
+int PQEarraydims(const int *kinds, int ntokens, int *dims) {
+    int counts[ARRAY_MAX_DIMS];
+    int i, depth = 0, ndims = 0;
+
+    while (ndims < ntokens && kinds[ndims] == ARRAY_OPEN) ndims++;
+    for (i = 0; i < ndims; i++) dims[i] = -1;
+
+    for (i = 0; i < ntokens; i++) {
+        switch (kinds[i]) {
+        case ARRAY_OPEN:
+            if (depth >= ndims) return -1;
+            if (depth > 0) counts[depth - 1]++;
+            counts[depth++] = 0;
+            break;
+        case ARRAY_CLOSE:
+            depth--;
+            if (dims[depth] < 0) dims[depth] = counts[depth];
+            else if (dims[depth] != counts[depth]) return -1;
+            break;
+        default:
+            if (depth != ndims) return -1;
+            counts[depth - 1]++;
+            break;
+        }
+    }
+    return ndims;
+}
+
+/* Write the len bytes of src into dst as 2 * len hex digits, as in the
+ * bytea hex format. */
+void PQEhexencode(const char *src, size_t len, char *dst) {
+    static const char digits[] = "0123456789abcdef";
+    const unsigned char *s = (const unsigned char *)src;
+    const unsigned char *end = s + len;
+
+    while (s < end) {
+        *dst++ = digits[*s >> 4];
+        *dst++ = digits[*s++ & 0xf];
+    }
+}
+
 // Real names start with PG_DIAG_, but here we define our prefixes,
 // because some are defined and some are not depending on pg version.
 
@@ -460,7 +1037,37 @@ static int const LIBPQ_DIAG_CONSTRAINT_NAME = 'n';
 static int const LIBPQ_DIAG_SOURCE_FILE = 'F';
 static int const LIBPQ_DIAG_SOURCE_LINE = 'L';
 static int const LIBPQ_DIAG_SOURCE_FUNCTION = 'R';
-''' + '''
+'''
+
+if _config.libpq_version >= 0x090000:
+    C_SOURCE += '''
+/* Escape the n strings concatenated in src, with the given lengths, as
+ * PQescapeLiteral() does, writing the literals one after the other in dst,
+ * which must have room for 2 * strlen(src) + 4 * n chars. The offsets of the
+ * literals in dst and the end of the last one are stored in offsets (n + 1
+ * items). Return 0, or -1 if a string can't be escaped. */
+int PQEescapeliterals(PGconn *conn, const char *src, const size_t *lengths,
+        int n, char *dst, size_t *offsets) {
+    size_t out = 0, len;
+    char *lit;
+    int i;
+
+    for (i = 0; i < n; i++) {
+        offsets[i] = out;
+        lit = PQescapeLiteral(conn, src, lengths[i]);
+        if (!lit) return -1;
+        len = strlen(lit);
+        memcpy(dst + out, lit, len);
+        PQfreemem(lit);
+        out += len;
+        src += lengths[i];
+    }
+    offsets[n] = out;
+    return 0;
+}
+'''
+
+C_SOURCE += '''
 
 static int const _PG_VERSION = {libpq_version};
 '''.format(libpq_version=_config.libpq_version)
@@ -1,8 +1,10 @@
 from __future__ import unicode_literals
 
+import binascii
 import datetime
 import decimal
 import math
+import re
 import six
 from six.moves import xrange
 
@@ -11,7 +13,45 @@ from psycopg2cffi._impl.exceptions import ProgrammingError
 from psycopg2cffi.tz import LOCAL as TZ_LOCAL
 
 
-adapters = {}
+class _AdaptersMap(dict):
+    """The adapters registry: forget the resolved adapters when modified"""
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        _adapter_cache.clear()
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        _adapter_cache.clear()
+
+    def pop(self, *args):
+        _adapter_cache.clear()
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        _adapter_cache.clear()
+        return dict.popitem(self)
+
+    def setdefault(self, *args):
+        _adapter_cache.clear()
+        return dict.setdefault(self, *args)
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        _adapter_cache.clear()
+
+    def clear(self):
+        dict.clear(self)
+        _adapter_cache.clear()
+
+
+adapters = _AdaptersMap()
+
+# Adapters resolved by `_get_adapter()`, by (type, protocol), None if no
+# adapter is registered for the type or its bases. The cache is emptied when
+# full or when `adapters` is modified.
+_adapter_cache = {}
+_ADAPTER_CACHE_SIZE = 512
 
 # Adapters assept python objects and always return bytes, as described in
 # http://initd.org/psycopg/articles/2011/01/24/psycopg2-porting-python-3-report/
@@ -68,11 +108,15 @@ class Binary(_BaseAdapter):
         if self._wrapped is None:
             return b'NULL'
 
-        to_length = ffi.new('size_t *')
         _wrapped = self._wrapped
         if isinstance(_wrapped, six.text_type):
             _wrapped = ascii_to_bytes(_wrapped)
-        elif isinstance(_wrapped, _bytearray_types):
+
+        if self._conn and self._conn.server_version >= 90000:
+            return _quote_bytea_hex(_wrapped, self._conn)
+
+        to_length = ffi.new('size_t *')
+        if isinstance(_wrapped, _bytearray_types):
             _wrapped = six.binary_type(_wrapped)
         elif not six.PY3 and isinstance(_wrapped, buffer):
             _wrapped = bytes(_wrapped)
@@ -94,6 +138,35 @@ class Binary(_BaseAdapter):
         return b''.join([b"'", data,  b"'::bytea"])
 
 
+def _quote_bytea_hex(data, conn):
+    """Return the bytea literal of a buffer in hex format
+
+    Produce the same literal as PQescapeByteaConn() does for a server
+    supporting the hex format, encoding the buffer without copying it.
+
+    """
+    if not isinstance(data, six.binary_type):
+        try:
+            data = ffi.from_buffer(data)
+        except (TypeError, BufferError):
+            # e.g. non-contiguous memoryview
+            data = six.binary_type(data)
+    length = len(data)
+
+    if conn._get_equote():
+        prefix = b"E'\\\\x"
+    else:
+        prefix = b"'\\x"
+    suffix = b"'::bytea"
+    start = len(prefix)
+    end = start + 2 * length
+    dst = ffi.new('char[]', end + len(suffix))
+    ffi.memmove(dst, prefix, start)
+    libpq.PQEhexencode(data, length, dst + start)
+    ffi.memmove(dst + end, suffix, len(suffix))
+    return ffi.buffer(dst, end + len(suffix))[:]
+
+
 class Boolean(_BaseAdapter):
     def getquoted(self):
         return b'true' if self._wrapped else b'false'
@@ -267,28 +340,126 @@ class QuotedString(_BaseAdapter):
         return data
 
 
-def adapt(value, proto=ISQLQuote, alt=None):
-    """Return the adapter for the given value"""
-    obj_type = type(value)
+def _get_adapter(obj_type, proto=ISQLQuote):
+    """Return the adapter registered for the type or its bases, or None"""
+    key = (obj_type, proto)
     try:
-        return adapters[(obj_type, proto)](value)
+        return _adapter_cache[key]
     except KeyError:
+        pass
+
+    rv = adapters.get(key)
+    if rv is None:
         for subtype in obj_type.mro()[1:]:
-            try:
-                return adapters[(subtype, proto)](value)
-            except KeyError:
-                pass
+            rv = adapters.get((subtype, proto))
+            if rv is not None:
+                break
+
+    if len(_adapter_cache) >= _ADAPTER_CACHE_SIZE:
+        _adapter_cache.clear()
+    _adapter_cache[key] = rv
+    return rv
+
+
+def adapt(value, proto=ISQLQuote, alt=None):
+    """Return the adapter for the given value"""
+    adapter = _get_adapter(type(value), proto)
+    if adapter is not None:
+        return adapter(value)
 
     conform = getattr(value, '__conform__', None)
     if conform is not None:
         return conform(proto)
-    raise ProgrammingError("can't adapt type '%s'" % obj_type.__name__)
+    raise ProgrammingError("can't adapt type '%s'" % type(value).__name__)
+
+
+# Quoters return the same literal as the getquoted() method of some built-in
+# adapters without instantiating them. They are used for the objects whose
+# adapter resolves to one of these classes, so registering a different
+# adapter for a type disables them.
+
+def _quote_adapted(adapter, obj, conn):
+    adapter = adapter(obj)
+    adapter.prepare(conn)
+    return adapter.getquoted()
+
+
+def _quote_boolean(obj, conn):
+    return b'true' if obj else b'false'
+
+
+def _quote_int(obj, conn):
+    value = str(obj).encode('ascii')
+
+    # Prepend a space in front of negative numbers
+    if value[:1] == b'-':
+        return b' ' + value
+    return value
+
+
+def _quote_float(obj, conn):
+    n = float(obj)
+    if math.isnan(n) or math.isinf(n):
+        return Float(obj).getquoted()
+
+    value = repr(obj).encode('ascii')
+    if value[:1] == b'-':
+        return b' ' + value
+    return value
+
+
+# Bytes that PQescapeLiteral() treats specially: besides the backslash and
+# the terminator it validates the multibyte characters, which is only
+# skipped for strings encoded in UTF-8 by Python.
+_literal_special_re = re.compile(b'[\\\\\\x00]')
+_literal_special_ascii_re = re.compile(b'[\\\\\\x00\\x80-\\xff]')
+
+
+def _encode_literal(obj, conn):
+    """Encode a string for the connection
+
+    Return `(literal, True)` if the string could be quoted in Python, else
+    `(encoded string, False)`: the latter must be passed to PQescapeLiteral().
+
+    """
+    if isinstance(obj, six.text_type):
+        obj = obj.encode(conn._py_enc)
+        special = _literal_special_re if conn._py_enc == 'utf_8' \
+            else _literal_special_ascii_re
+    else:
+        special = _literal_special_ascii_re
+
+    if special.search(obj) is not None:
+        return obj, False
+    return b"'" + obj.replace(b"'", b"''") + b"'", True
+
+
+def _quote_string(obj, conn):
+    if conn is None or PG_VERSION < 0x090000:
+        return _quote_adapted(QuotedString, obj, conn)
+
+    data, quoted = _encode_literal(obj, conn)
+    if quoted:
+        return data
+    return _quote_adapted(QuotedString, data, conn)
+
+
+quoters = {
+    Boolean: _quote_boolean,
+    Int: _quote_int,
+    Long: _quote_int,
+    Float: _quote_float,
+    QuotedString: _quote_string,
+}
 
 
 def _getquoted(param, conn):
     """Helper method"""
     if param is None:
         return b'NULL'
+    quoter = quoters.get(_get_adapter(type(param)))
+    if quoter is not None:
+        return quoter(param, conn)
     if isinstance(param, _BaseAdapter):
         adapter = param
     else:
@@ -300,6 +471,200 @@ def _getquoted(param, conn):
     return adapter.getquoted()
 
 
+def _getquoted_deferred(param, conn, deferred):
+    """Like `_getquoted()`, but defer the strings needing PQescapeLiteral()
+
+    Such strings are appended, encoded, to `deferred`, and None is returned
+    in their place: they can be escaped all together by `_escape_literals()`.
+
+    """
+    if conn is not None and PG_VERSION >= 0x090000 and param is not None \
+            and quoters.get(_get_adapter(type(param))) is _quote_string:
+        data, quoted = _encode_literal(param, conn)
+        if quoted:
+            return data
+        deferred.append(data)
+        return None
+    return _getquoted(param, conn)
+
+
+def _escape_literals(strings, conn):
+    """Return the literals of many encoded strings, escaping them with
+    PQescapeLiteral() in a single call"""
+    n = len(strings)
+    src = b''.join(strings)
+    lengths = ffi.new('size_t[]', [len(s) for s in strings])
+    dst = ffi.new('char[]', 2 * len(src) + 4 * n + 1)
+    offsets = ffi.new('size_t[]', n + 1)
+    if libpq.PQEescapeliterals(
+            conn._pgconn, src, lengths, n, dst, offsets) < 0:
+        raise conn._create_exception()
+
+    offsets = list(offsets)
+    data = ffi.buffer(dst, offsets[n])[:]
+    return [data[offsets[i]:offsets[i + 1]] for i in xrange(n)]
+
+
+# Dumpers convert the objects wrapped by the built-in adapters into the
+# (oid, value, format) triples passed to the server out of the query string
+# when the parameters are bound server-side (see `cursor.server_binding`).
+# Objects whose adapter has no dumper are merged into the query as literals.
+
+_INT4_RANGE = (-2 ** 31, 2 ** 31 - 1)
+_INT8_RANGE = (-2 ** 63, 2 ** 63 - 1)
+
+
+def _dump_boolean(obj, conn):
+    return 16, b't' if obj else b'f', 0
+
+
+def _dump_int(obj, conn):
+    # Use the same type the server would give to the number as a literal
+    if _INT4_RANGE[0] <= obj <= _INT4_RANGE[1]:
+        oid = 23
+    elif _INT8_RANGE[0] <= obj <= _INT8_RANGE[1]:
+        oid = 20
+    else:
+        oid = 1700
+    return oid, ascii_to_bytes(str(obj)), 0
+
+
+def _dump_float(obj, conn):
+    n = float(obj)
+    if math.isnan(n):
+        return 701, b'NaN', 0
+    elif math.isinf(n):
+        return 701, b'Infinity' if n > 0 else b'-Infinity', 0
+    # A float literal is a numeric for the server
+    return 1700, ascii_to_bytes(repr(obj)), 0
+
+
+def _dump_decimal(obj, conn):
+    if obj.is_finite():
+        return 1700, ascii_to_bytes(str(obj)), 0
+    return 1700, b'NaN', 0
+
+
+def _dump_string(obj, conn):
+    if isinstance(obj, six.text_type):
+        obj = obj.encode(conn._py_enc)
+    # Unknown type, as a quoted literal
+    return 0, obj, 0
+
+
+def _dump_binary(obj, conn):
+    if isinstance(obj, six.text_type):
+        obj = ascii_to_bytes(obj)
+    return 17, obj, 1
+
+
+def _dump_datetime(obj, conn):
+    if isinstance(obj, datetime.timedelta):
+        return 1186, ascii_to_bytes('%d days %d.%06d seconds' % (
+            obj.days, obj.seconds, obj.microseconds)), 0
+    elif isinstance(obj, datetime.datetime):
+        oid = 1184 if obj.tzinfo is not None else 1114
+    elif isinstance(obj, datetime.time):
+        oid = 1266 if obj.tzinfo is not None else 1083
+    else:
+        oid = 1082
+    return oid, ascii_to_bytes(obj.isoformat()), 0
+
+
+_null_param = (0, None, 0)
+
+dumpers = {
+    Boolean: _dump_boolean,
+    Int: _dump_int,
+    Long: _dump_int,
+    Float: _dump_float,
+    Decimal: _dump_decimal,
+    QuotedString: _dump_string,
+    Binary: _dump_binary,
+    DateTime: _dump_datetime,
+}
+
+
+def _dump(param, conn):
+    """Return the (oid, value, format) triple to pass a parameter to the
+    server, or None if the parameter must be merged into the query.
+
+    """
+    if param is None:
+        return _null_param
+    if isinstance(param, _BaseAdapter):
+        adapter, obj = type(param), param._wrapped
+    else:
+        adapter, obj = _get_adapter(type(param)), param
+    dumper = dumpers.get(adapter)
+    if dumper is None:
+        return None
+    if obj is None:
+        return _null_param
+    return dumper(obj, conn)
+
+
+# COPY text format: NULL marker and special characters escaped in the values
+
+_copy_null = b'\\N'
+_copy_escape_re = re.compile(b'[\\\\\t\n\r]')
+_copy_escapes = {
+    b'\\': b'\\\\', b'\t': b'\\t', b'\n': b'\\n', b'\r': b'\\r'}
+
+
+def _copy_escape(m):
+    return _copy_escapes[m.group()]
+
+
+def _dump_copy(param, conn):
+    """Return a parameter as a value of a record in COPY text format
+
+    The value is converted by the same dumpers used to pass the parameters
+    to the server (see `_dump()`); lists are converted to array literals.
+
+    """
+    value = _dump_copy_text(param, conn)
+    if value is None:
+        return _copy_null
+    if _copy_escape_re.search(value) is not None:
+        value = _copy_escape_re.sub(_copy_escape, value)
+    return value
+
+
+def _dump_copy_text(param, conn):
+    """Return the text representation of a parameter, None if null"""
+    if isinstance(param, list):
+        return _dump_copy_array(param, conn)
+
+    dumped = _dump(param, conn)
+    if dumped is None:
+        raise ProgrammingError(
+            "can't adapt type '%s' for COPY" % type(param).__name__)
+
+    value = dumped[1]
+    if value is not None and dumped[2] == 1:
+        value = b'\\x' + binascii.hexlify(value)
+    return value
+
+
+_array_escape_re = re.compile(b'["\\\\]')
+
+
+def _dump_copy_array(param, conn):
+    items = []
+    for item in param:
+        if isinstance(item, list):
+            items.append(_dump_copy_array(item, conn))
+            continue
+        value = _dump_copy_text(item, conn)
+        if value is None:
+            items.append(b'NULL')
+        else:
+            items.append(
+                b'"' + _array_escape_re.sub(br'\\\g<0>', value) + b'"')
+    return b'{' + b','.join(items) + b'}'
+
+
 def ascii_to_bytes(s):
     ''' Convert ascii string to bytes
     '''
@@ -1,7 +1,9 @@
 from __future__ import unicode_literals
 
+import re
 import threading
 import weakref
+from collections import OrderedDict
 from functools import wraps
 import six
 
@@ -34,6 +36,14 @@ del k, v
 
 _green_callback = None
 
+# Prefix of a query sent together with the BEGIN of the transaction. The
+# newline leaves the query lines unchanged in the error messages: only the
+# line numbers must be corrected (see _hide_begin_prefix()).
+_begin_stmt = b'BEGIN;\n'
+
+# The line of the query reported in an error message and the caret below it
+_error_line_re = re.compile(r'^(\D*)(\d+)(: .*\n)( *)\^$', re.M)
+
 
 def check_closed(func):
     @wraps(func)
@@ -114,10 +124,27 @@ class Connection(object):
         self._autocommit = False
         self._pgconn = None
         self._equote = False
+        self._binary = False
+        self._server_binding = False
+        self._rewrite_inserts = False
         self._lock = threading.RLock()
         self.notices = []
         self.cursor_factory = None
 
+        # Server-side prepared statements: a query executed with the extended
+        # protocol is prepared after it has been executed prepare_threshold
+        # times (None disables preparing). At most prepared_max statements
+        # are kept, the least recently used are deallocated.
+        self.prepare_threshold = 5
+        self.prepared_max = 100
+        self._prepared = OrderedDict()      # (query, types) -> name
+        self._prepare_counts = OrderedDict()    # (query, types) -> count
+        self._prepared_stale = []   # names to deallocate
+        self._prepared_lost = False     # some may be gone on the server
+        self._prepared_seq = 0
+        self._prepared_hits = 0
+        self._prepared_misses = 0
+
         # The number of commits/rollbacks done so far
         self._mark = 0
 
@@ -137,6 +164,14 @@ class Connection(object):
         self._async_status = consts.ASYNC_DONE
         self._async_cursor = None
 
+        # Weak reference to the cursor receiving the rows of a query in
+        # streaming mode, if any
+        self._stream_cursor = None
+
+        # True if the transaction has started but BEGIN hasn't been sent yet:
+        # it is sent together with the first command of the transaction
+        self._begin_pending = False
+
         self_ref = weakref.ref(self)
         self._notice_callback = ffi.callback(
             'void(void *, const char *)',
@@ -213,8 +248,11 @@ class Connection(object):
     @check_async
     def reset(self):
         with self._lock:
+            self._begin_pending = False
+            self._invalidate_prepared()
             self._execute_command(
-                "ABORT; RESET ALL; SET SESSION AUTHORIZATION DEFAULT;")
+                b"ABORT; RESET ALL; SET SESSION AUTHORIZATION DEFAULT;")
+            self._deallocate_stale()
             self.status = consts.STATUS_READY
             self._mark += 1
             self._autocommit = False
@@ -223,6 +261,7 @@ class Connection(object):
     def _get_guc(self, name):
         """Return the value of a configuration parameter."""
         with self._lock:
+            self._drain_stream()
             query = 'SHOW %s' % name
 
             if _green_callback:
@@ -328,6 +367,60 @@ class Connection(object):
     def async_(self):
         return self._async
 
+    @property
+    def binary(self):
+        """Default for the `binary` attribute of the cursors.
+
+        If true the cursors created by the connection will ask the server to
+        return the results of their queries in binary format.
+
+        """
+        return self._binary
+
+    @binary.setter
+    def binary(self, value):
+        self._binary = bool(value)
+
+    @property
+    def server_binding(self):
+        """Default for the `server_binding` attribute of the cursors.
+
+        If true the cursors created by the connection will send the query
+        parameters to the server separately from the query string.
+
+        """
+        return self._server_binding
+
+    @server_binding.setter
+    def server_binding(self, value):
+        self._server_binding = bool(value)
+
+    @property
+    def rewrite_inserts(self):
+        """Default for the `rewrite_inserts` attribute of the cursors.
+
+        If true `executemany()` on the cursors created by the connection
+        folds the parameters of an ``INSERT ... VALUES`` statement into
+        multi-row ``VALUES`` lists.
+
+        """
+        return self._rewrite_inserts
+
+    @rewrite_inserts.setter
+    def rewrite_inserts(self, value):
+        self._rewrite_inserts = bool(value)
+
+    @property
+    def prepared_hits(self):
+        """Number of queries executed using a cached prepared statement."""
+        return self._prepared_hits
+
+    @property
+    def prepared_misses(self):
+        """Number of queries that could have used a prepared statement but
+        didn't find it in the cache."""
+        return self._prepared_misses
+
     @check_closed
     def get_backend_pid(self):
         return libpq.PQbackendPID(self._pgconn)
@@ -337,6 +430,8 @@ class Connection(object):
         return bytes_to_ascii(ffi.string(p)) if p != ffi.NULL else None
 
     def get_transaction_status(self):
+        if self._begin_pending:
+            return consts.TRANSACTION_STATUS_INTRANS
         return libpq.PQtransactionStatus(self._pgconn)
 
     def cursor(self, name=None, cursor_factory=None,
@@ -442,7 +537,7 @@ class Connection(object):
             raise exceptions.ProgrammingError(
                 "tpc_begin can't be called in autocommit mode")
 
-        self._begin_transaction()
+        self._begin_transaction(defer=True)
         self._tpc_xid = xid
 
     @check_closed
@@ -475,6 +570,7 @@ class Connection(object):
 
     def lobject(self, oid=0, mode='', new_oid=0, new_file=None,
                 lobject_factory=LargeObject):
+        self._drain_stream()
         obj = lobject_factory(self, oid, mode, new_oid, new_file)
         return obj
 
@@ -504,7 +600,7 @@ class Connection(object):
 
                 libpq.PQclear(curs._pgres)
 
-                curs._pgres = util.pq_get_last_result(self._pgconn)
+                curs._pgres = curs._get_results(self._pgconn)
                 try:
                     curs._pq_fetch()
                 finally:
@@ -652,17 +748,61 @@ class Connection(object):
         if self._cancel == ffi.NULL:
             raise exceptions.OperationalError("can't get cancellation key")
 
-    def _begin_transaction(self):
+    def _begin_transaction(self, defer=False):
+        """Start a transaction if needed
+
+        If `defer` is true BEGIN is not executed now but sent together with
+        the next command, saving a round trip. Otherwise make sure that the
+        BEGIN has been executed.
+
+        """
         if self.status == consts.STATUS_READY and not self._autocommit:
-            self._execute_command('BEGIN')
+            if defer:
+                self._begin_pending = True
+            else:
+                self._execute_command('BEGIN')
             self.status = consts.STATUS_BEGIN
+        elif not defer:
+            self._flush_begin()
+
+    def _flush_begin(self):
+        """Execute the BEGIN of the transaction if not sent yet"""
+        if self._begin_pending:
+            self._begin_pending = False
+            self._execute_command('BEGIN')
+
+    def _begin_prefix(self, query):
+        """Return the query prefixed by the BEGIN not sent yet, if any
+
+        The statements are sent together using the simple query protocol.
+        An empty query is returned unchanged, so that it is still reported
+        as such.
+
+        """
+        if not self._begin_pending or not query.strip(b' \t\r\n;'):
+            return query
+        self._begin_pending = False
+        return _begin_stmt + query
+
+    def _check_begin(self):
+        """Check if the BEGIN sent together with a command was executed
+
+        This is not the case if the command string couldn't be parsed: the
+        BEGIN will be sent again with the next command.
+
+        """
+        if self.status == consts.STATUS_BEGIN and \
+                libpq.PQtransactionStatus(self._pgconn) == libpq.PQTRANS_IDLE:
+            self._begin_pending = True
 
     def _execute_command(self, command):
         with self._lock:
+            self._drain_stream()
+            command = self._begin_prefix(ascii_to_bytes(command))
             if _green_callback:
                 pgres = self._execute_green(command)
             else:
-                pgres = libpq.PQexec(self._pgconn, ascii_to_bytes(command))
+                pgres = libpq.PQexec(self._pgconn, command)
 
             if not pgres:
                 raise self._create_exception()
@@ -676,6 +816,128 @@ class Connection(object):
                 if pgres:
                     libpq.PQclear(pgres)
 
+    def _get_prepared(self, key, query, params):
+        """Return the name of the statement to use to execute `query`
+
+        `key` identifies the query and the types of its parameters, `params`
+        is a `_ServerParams` instance. Return None if the query should be
+        executed without being prepared: this happens until the query has
+        been seen `prepare_threshold` times.
+
+        """
+        if self.prepare_threshold is None:
+            return None
+
+        name = self._prepared.pop(key, None)
+        if name is not None:
+            # Move the statement to the most recently used end
+            self._prepared[key] = name
+            self._prepared_hits += 1
+            return name
+
+        self._prepared_misses += 1
+        count = self._prepare_counts.pop(key, 0)
+        if count < self.prepare_threshold or libpq.PQtransactionStatus(
+                self._pgconn) == libpq.PQTRANS_INERROR:
+            self._prepare_counts[key] = count + 1
+            if len(self._prepare_counts) > self.prepared_max:
+                self._prepare_counts.popitem(last=False)
+            return None
+
+        self._prepared_seq += 1
+        name = ascii_to_bytes('_psycopg2cffi_%d' % self._prepared_seq)
+        pgres = libpq.PQprepare(
+            self._pgconn, name, query, params.nparams, params.types)
+        if not pgres:
+            raise self._create_exception()
+        if libpq.PQresultStatus(pgres) != libpq.PGRES_COMMAND_OK:
+            raise self._create_exception(pgres=pgres)
+        libpq.PQclear(pgres)
+
+        self._prepared[key] = name
+        if len(self._prepared) > self.prepared_max:
+            self._prepared_stale.append(self._prepared.popitem(last=False)[1])
+        self._deallocate_stale()
+        return name
+
+    def _invalidate_prepared(self, lost=False):
+        """Forget all the prepared statements.
+
+        The statements are deallocated the next time the connection is not
+        in a failed transaction. If `lost` is true some of them may have
+        been deallocated already on the server.
+
+        """
+        self._prepared_stale.extend(self._prepared.values())
+        self._prepared.clear()
+        self._prepare_counts.clear()
+        if lost:
+            self._prepared_lost = True
+
+    def _discard_prepared(self):
+        """Forget all the prepared statements, dropped on the server"""
+        self._prepared.clear()
+        self._prepare_counts.clear()
+        del self._prepared_stale[:]
+        self._prepared_lost = False
+
+    def _deallocate_stale(self):
+        """Deallocate the statements evicted from the cache
+
+        If some statements may be gone on the server only the existing ones
+        are deallocated, so that the command can't fail. A pending BEGIN is
+        not sent: the command doesn't need to be in the transaction.
+
+        """
+        if not self._prepared_stale:
+            return
+        names, self._prepared_stale = self._prepared_stale, []
+        if self._prepared_lost:
+            self._prepared_lost = False
+            pgres = self._exec_prepared_command(
+                b"SELECT name FROM pg_prepared_statements WHERE name IN ("
+                + b', '.join(b"'" + name + b"'" for name in names) + b")")
+            names = [ffi.string(libpq.PQgetvalue(pgres, i, 0))
+                for i in range(libpq.PQntuples(pgres))]
+            libpq.PQclear(pgres)
+            if not names:
+                return
+
+        libpq.PQclear(self._exec_prepared_command(b'; '.join(
+            b'DEALLOCATE ' + name for name in names)))
+
+    def _exec_prepared_command(self, command):
+        """Execute a command managing the prepared statements
+
+        Return the result of the command. Don't send the pending BEGIN.
+
+        """
+        pgres = libpq.PQexec(self._pgconn, command)
+        if not pgres:
+            raise self._create_exception()
+        if libpq.PQresultStatus(pgres) not in (
+                libpq.PGRES_COMMAND_OK, libpq.PGRES_TUPLES_OK):
+            raise self._create_exception(pgres=pgres)
+        return pgres
+
+    def _drain_stream(self):
+        """Discard the rows of a query being streamed, if any"""
+        if self._stream_cursor is None:
+            return
+
+        cursor = self._stream_cursor()
+        if cursor is not None:
+            cursor._stream_finish(ffi.NULL)
+            return
+
+        # The cursor is gone: nobody is interested in the results
+        self._stream_cursor = None
+        while True:
+            pgres = libpq.PQgetResult(self._pgconn)
+            if not pgres:
+                break
+            libpq.PQclear(pgres)
+
     def _execute_tpc_command(self, command, xid):
         cmd = b' '.join([
             ascii_to_bytes(command),
@@ -683,15 +945,23 @@ class Connection(object):
         self._execute_command(cmd)
         self._mark += 1
 
-    def _execute_green(self, query):
-        """Execute version for green threads"""
+    def _execute_green(self, query, send=None, get_result=None):
+        """Execute version for green threads
+
+        `send` is a function sending the query to the connection (by default
+        `PQsendQuery()`), `get_result` a function returning its result (by
+        default the last one).
+
+        """
         if self._async_cursor:
             raise exceptions.ProgrammingError(
                 "a single async query can be executed on the same connection")
 
         self._async_cursor = True
 
-        if not libpq.PQsendQuery(self._pgconn, ascii_to_bytes(query)):
+        if send is None:
+            send = libpq.PQsendQuery
+        if not send(self._pgconn, ascii_to_bytes(query)):
             self._async_cursor = None
             return
 
@@ -703,7 +973,9 @@ class Connection(object):
             self.close()
             raise
         else:
-            return util.pq_get_last_result(self._pgconn)
+            if get_result is None:
+                get_result = util.pq_get_last_result
+            return get_result(self._pgconn)
         finally:
             self._async_cursor = None
             self._async_status = consts.ASYNC_DONE
@@ -755,6 +1027,11 @@ class Connection(object):
             if self._autocommit or self.status != consts.STATUS_BEGIN:
                 return
             self._mark += 1
+            if self._begin_pending:
+                # Nothing was executed in the transaction
+                self._begin_pending = False
+                self.status = consts.STATUS_READY
+                return
             try:
                 self._execute_command('COMMIT')
             finally:
@@ -765,6 +1042,10 @@ class Connection(object):
             if self._autocommit or self.status != consts.STATUS_BEGIN:
                 return
             self._mark += 1
+            if self._begin_pending:
+                self._begin_pending = False
+                self.status = consts.STATUS_READY
+                return
             try:
                 self._execute_command('ROLLBACK')
             finally:
@@ -876,8 +1157,34 @@ class Connection(object):
         exc.cursor = cursor
         exc._pgres = pgres
 
+        if cursor is not None and cursor._query_offset and pgres:
+            self._hide_begin_prefix(exc, cursor._query_offset)
+
         return exc
 
+    def _hide_begin_prefix(self, exc, offset):
+        """Report the error position relative to the query executed
+
+        `offset` is the length of the BEGIN prefixed to the query sent.
+
+        """
+        if not libpq.PQresultErrorField(
+                exc._pgres, libpq.LIBPQ_DIAG_STATEMENT_POSITION):
+            return
+
+        exc._position_offset = offset
+
+        def fix_line(m):
+            lineno = str(int(m.group(2)) - 1)
+            spaces = len(m.group(4)) + len(lineno) - len(m.group(2))
+            return m.group(1) + lineno + m.group(3) + ' ' * spaces + '^'
+
+        if exc.pgerror:
+            exc.pgerror = _error_line_re.sub(fix_line, exc.pgerror, 1)
+        if exc.args and exc.args[0]:
+            exc.args = (_error_line_re.sub(fix_line, exc.args[0], 1),) \
+                + exc.args[1:]
+
     def _have_wait_callback(self):
         return bool(_green_callback)
 
@@ -1,9 +1,12 @@
 from __future__ import unicode_literals
 
+import re
 import sys
-from collections import namedtuple
+from array import array
+from collections import deque, namedtuple
 from functools import wraps
 from io import TextIOBase
+from itertools import chain, islice
 import weakref
 import six
 from six.moves import xrange
@@ -11,16 +14,36 @@ from six.moves import xrange
 from psycopg2cffi import tz
 from psycopg2cffi._impl import consts
 from psycopg2cffi._impl import exceptions
-from psycopg2cffi._impl.libpq import libpq, ffi
+from psycopg2cffi._impl.libpq import libpq, ffi, PG_VERSION
 from psycopg2cffi._impl import typecasts
+from psycopg2cffi._impl.typecasts import _array_typecode
 from psycopg2cffi._impl import util
-from psycopg2cffi._impl.adapters import _getquoted
+from psycopg2cffi._impl.pgcopy import BinaryCopyDecoder, BinaryCopyEncoder, \
+        TextCopyDecoder, TextCopyEncoder
+from psycopg2cffi._impl.adapters import _dump, _getquoted, ascii_to_bytes
+from psycopg2cffi._impl.adapters import _escape_literals, _getquoted_deferred
 from psycopg2cffi._impl.exceptions import InterfaceError, ProgrammingError
 
 
 is_32bits = sys.maxsize < 2**32
 
 
+def _join_columns(a, b):
+    """Concatenate two columns returned by `fetchcolumns()`"""
+    if isinstance(a, array) and isinstance(b, array) \
+            and a.typecode == b.typecode:
+        return a + b
+    return list(a) + list(b)
+
+
+def _join_numpy(numpy, a, b):
+    """Concatenate two arrays returned by `fetchnumpy()`"""
+    if isinstance(a, numpy.ma.MaskedArray) \
+            or isinstance(b, numpy.ma.MaskedArray):
+        return numpy.ma.concatenate([a, b])
+    return numpy.concatenate([a, b])
+
+
 def check_closed(func):
     """Check if the connection is closed and raise an error"""
     @wraps(func)
@@ -99,6 +122,17 @@ class Cursor(object):
         self._name = name.replace('"', '""') if name is not None else name
         self._withhold = False
         self._scrollable = None
+        self._binary = None
+        self._server_binding = None
+        self._rewrite_inserts = None
+        self._streaming = False
+        self._stream = False
+        self._stream_offset = 0
+        self._fetch_overrun = 0
+        self._multiple_results = False
+        self._results = []
+        self._begin_sent = False
+        self._query_offset = 0
         self._no_tuples = True
         self._rowcount = -1
         self._rownumber = 0
@@ -113,6 +147,7 @@ class Cursor(object):
         if self._pgres:
             libpq.PQclear(self._pgres)
             self._pgres = ffi.NULL
+        self._clear_results()
 
     def __enter__(self):
         return self
@@ -167,6 +202,8 @@ class Cursor(object):
         latter case to have the object return None instead of -1.
 
         """
+        if self._stream:
+            return -1
         return self._rowcount
 
     @check_closed
@@ -196,6 +233,10 @@ class Cursor(object):
         if self._name is not None:
             self._pq_execute('CLOSE "%s"' % self._name)
 
+        if self._stream:
+            self._stream_finish(ffi.NULL)
+
+        self._clear_results()
         self._closed = True
 
     @check_closed
@@ -240,8 +281,13 @@ class Cursor(object):
         if isinstance(query, six.text_type):
             query = query.encode(self._conn._py_enc)
 
+        params = None
         if parameters is not None:
-            self._query = _combine_cmd_params(query, parameters, conn)
+            if self.server_binding:
+                self._query, params = _server_cmd_params(
+                    query, parameters, conn)
+            else:
+                self._query = _combine_cmd_params(query, parameters, conn)
         else:
             self._query = query
 
@@ -249,7 +295,7 @@ class Cursor(object):
         if self._scrollable is not None:
             scroll = self._scrollable and "SCROLL " or "NO SCROLL "
 
-        conn._begin_transaction()
+        conn._begin_transaction(defer=True)
         self._clear_pgres()
 
         if self._name:
@@ -260,7 +306,12 @@ class Cursor(object):
                             "WITH" if self._withhold else "WITHOUT")) \
                 + self._query
 
-        self._pq_execute(self._query, conn._async)
+        if self._streaming and not self._name and not conn._async \
+                and not conn._have_wait_callback():
+            self._pq_execute_stream(self._query, params)
+        else:
+            self._pq_execute(self._query, conn._async, params,
+                prepare=not self._name)
 
     @check_closed
     @check_async
@@ -283,11 +334,34 @@ class Cursor(object):
 
         Return values are not defined.
 
+        Note: with libpq 14 and following, in a transaction, a query with a
+        single statement is executed in pipeline mode: the statements are
+        sent without waiting for the result of the previous ones.
+
+        If a statement fails, the `params_index` attribute of the exception
+        raised is the index of its parameters in `paramlist`, if known.
+
         """
+        if isinstance(query, six.text_type):
+            query = query.encode(self._conn._py_enc)
+
+        if self.rewrite_inserts and self._name is None:
+            insert = _split_insert(query)
+            if insert is not None:
+                return self._executemany_values(
+                    insert[0], insert[1], paramlist)
+
+        if self._can_pipeline(query):
+            return self._executemany_pipeline(query, paramlist)
+
         self._rowcount = -1
         rowcount = 0
-        for params in paramlist:
-            self.execute(query, params)
+        for i, params in enumerate(paramlist):
+            try:
+                self.execute(query, params)
+            except exceptions.Error as e:
+                e.params_index = i
+                raise
             if self.rowcount == -1:
                 rowcount = -1
             else:
@@ -305,11 +379,10 @@ class Cursor(object):
         .execute*() did not produce any result set or no call was issued yet.
 
         """
-        if self._name is not None:
-            self._pq_execute(
-                'FETCH FORWARD 1 FROM "%s"' % self._name)
+        if self._name is not None and self._rownumber >= self._rowcount:
+            self._fetch_forward(max(self.itersize, 1), 1)
 
-        if self._rownumber >= self._rowcount:
+        if self._rownumber >= self._rowcount and not self._stream_next():
             return None
 
         return self._build_row()
@@ -341,10 +414,18 @@ class Cursor(object):
         if size is None:
             size = self.arraysize
 
+        if self._stream:
+            return self._stream_rows(size if size >= 0 else None)
+
         if self._name is not None:
-            self._clear_pgres()
-            self._pq_execute(
-                'FETCH FORWARD %d FROM "%s"' % (size, self._name))
+            buffered = self._buffered_rows()
+            if size > buffered:
+                rows = self._build_rows(buffered) if buffered else []
+                self._fetch_forward(
+                    max(size - buffered, self.itersize), size - buffered)
+                rows.extend(self._build_rows(
+                    min(size - buffered, self._buffered_rows())))
+                return rows
 
         if size > self._rowcount - self._rownumber or size < 0:
             size = self._rowcount - self._rownumber
@@ -352,7 +433,7 @@ class Cursor(object):
         if size <= 0:
             return []
 
-        return [self._build_row() for _ in xrange(size)]
+        return self._build_rows(size)
 
     @check_closed
     @check_no_tuples
@@ -367,15 +448,128 @@ class Cursor(object):
         .execute*() did not produce any result set or no call was issued yet.
 
         """
+        if self._stream:
+            return self._stream_rows(None)
+
         if self._name is not None:
-            self._pq_execute('FETCH FORWARD ALL FROM "%s"' % self._name)
+            buffered = self._buffered_rows()
+            rows = self._build_rows(buffered) if buffered else []
+            self._fetch_forward(None, None)
+            rows.extend(self._build_rows(self._buffered_rows()))
+            return rows
 
         size = self._rowcount - self._rownumber
         if size <= 0:
             return []
 
-        return [self._build_row() for _ in xrange(size)]
+        return self._build_rows(size)
+
+    @check_closed
+    @check_no_tuples
+    def fetchcolumns(self, size=None):
+        """Fetch the next set of rows of a query result, returning a list
+        with a sequence of values for each column.
+
+        All the remaining rows are fetched if size is not specified. The
+        values of int2, int4, int8, float4 and float8 columns without NULL
+        are returned as `array.array`, the other columns as lists.
+
+        This is not part of the dbapi 2 standard, but a psycopg2cffi
+        extension.
+
+        """
+        buffered = self._buffered_rows()
+        if buffered and (size is None or size > buffered):
+            head = self.fetchcolumns(buffered)
+            tail = self.fetchcolumns(None if size is None else size - buffered)
+            return [_join_columns(a, b) for a, b in zip(head, tail)]
+
+        nrows = self._fetch_block(size)
+        columns = [self._build_column(i, self._rownumber, nrows)
+            for i in xrange(self._nfields)]
+        self._rownumber += nrows
+        return columns
 
+    @check_closed
+    @check_no_tuples
+    def fetchnumpy(self, size=None, structured=False):
+        """Fetch the next set of rows of a query result into NumPy arrays.
+
+        All the remaining rows are fetched if size is not specified. Return
+        a list with an array per column or, if `structured` is true, a
+        structured array with a field per column (the column names must be
+        unique).
+
+        int2, int4, int8, float4, float8, bool, date, timestamp and
+        timestamptz columns are decoded in C into arrays of the matching
+        dtype (timestamptz are converted to UTC, infinity is mapped to the
+        extreme values of datetime64). NULLs in these columns are reported
+        returning masked arrays. The other columns are returned as arrays of
+        Python objects, using None for NULL.
+
+        This is not part of the dbapi 2 standard, but a psycopg2cffi
+        extension.
+
+        """
+        import numpy
+
+        buffered = self._buffered_rows()
+        if buffered and (size is None or size > buffered):
+            head = self.fetchnumpy(buffered, structured)
+            tail = self.fetchnumpy(
+                None if size is None else size - buffered, structured)
+            if structured:
+                return _join_numpy(numpy, head, tail)
+            return [_join_numpy(numpy, a, b) for a, b in zip(head, tail)]
+
+        nrows = self._fetch_block(size)
+        data = []
+        masks = []
+        for i in xrange(self._nfields):
+            values, mask = self._build_numpy_column(
+                numpy, i, self._rownumber, nrows)
+            data.append(values)
+            masks.append(mask)
+        self._rownumber += nrows
+
+        if not structured:
+            return [values if mask is None
+                    else numpy.ma.MaskedArray(values, mask=mask)
+                for values, mask in zip(data, masks)]
+
+        dtype = [(col.name, values.dtype)
+            for col, values in zip(self._description, data)]
+        rv = numpy.empty(nrows, dtype=dtype)
+        for (name, _), values in zip(dtype, data):
+            rv[name] = values
+        if all(mask is None for mask in masks):
+            return rv
+
+        rvmask = numpy.zeros(nrows, dtype=[(name, bool) for name, _ in dtype])
+        for (name, _), mask in zip(dtype, masks):
+            if mask is not None:
+                rvmask[name] = mask
+        return numpy.ma.MaskedArray(rv, mask=rvmask)
+
+    def _fetch_block(self, size):
+        """Make the next `size` rows available and return their number
+
+        Fetch all the remaining rows if `size` is None.
+
+        """
+        if self._stream:
+            raise ProgrammingError(
+                "can't fetch by columns from a streaming cursor")
+
+        if self._name is not None and not self._buffered_rows():
+            self._fetch_forward(size, size)
+
+        nrows = self._rowcount - self._rownumber
+        if size is not None and 0 <= size < nrows:
+            nrows = size
+        return max(nrows, 0)
+
+    @check_closed
     def nextset(self):
         """This method will make the cursor skip to the next available set,
         discarding any remaining rows from the current set.
@@ -384,13 +578,24 @@ class Cursor(object):
         returns a true value and subsequent calls to the fetch methods will
         return rows from the next result set.
 
-        An Error (or subclass) exception is raised if the previous call to
-        .execute*() did not produce any result set or no call was issued yet.
+        ProgrammingError is raised if no query was executed yet. The results
+        of the statements not returning rows are sets too: they only have a
+        `statusmessage` and a `rowcount`.
 
-        Note: this method is not supported
+        Note: the results of all the statements of a query are only kept if
+        `multiple_results` is set, otherwise only the last one is available.
 
         """
-        raise NotImplementedError()
+        if self._query is None:
+            raise ProgrammingError("no query executed yet")
+        if not self._results:
+            return None
+
+        self._clear_pgres()
+        self._description = None
+        self._pgres = self._results.pop(0)
+        self._pq_fetch()
+        return True
 
     def cast(self, oid, s):
         """Convert a value from a PostgreSQL string to a Python object.
@@ -416,6 +621,13 @@ class Cursor(object):
 
         return _combine_cmd_params(query, vars, self._conn)
 
+    def _mogrify_many(self, query, varslist):
+        """Return the list of the querystrings with every vars in `varslist`
+        binded, as `mogrify()` would.
+
+        """
+        return _combine_cmd_params_many(query, varslist, self._conn)
+
     @check_closed
     @check_async
     def copy_from(self, file, table, sep='\t', null='\\N', size=8192,
@@ -423,11 +635,13 @@ class Cursor(object):
         """Reads data from a file-like object appending them to a database
         table (COPY table FROM file syntax).
 
-        The source file must have both read() and readline() method.
+        The source file must have both read() and readline() method. It can
+        also be an iterable of strings or bytes chunks.
 
         TODO: Improve error handling
 
         """
+        file = _copy_source(file)
         if columns:
             columns_str = '(%s)' % ','.join([column for column in columns])
         else:
@@ -447,6 +661,53 @@ class Cursor(object):
             self._copyfile = None
             self._copysize = None
 
+    @check_closed
+    @check_async
+    def copy_records(self, table, columns, rows, size=65536, binary=False):
+        """Append the records of an iterable of sequences to a database
+        table (COPY table FROM STDIN syntax).
+
+        The values of the records are converted in COPY text format by the
+        same adapters used by `execute()` with server-side binding; lists are
+        converted to arrays, None to NULL. The records are consumed while
+        they are sent to the server, in chunks of about `size` bytes.
+
+        `columns` is the list of the columns of the table the records values
+        are for, or None for all the table columns.
+
+        If `binary` is true the records are copied in binary format: the
+        values are packed according to the types of the columns, queried
+        before the copy. Only the built-in types and their arrays are
+        supported. Unlike in text format, timestamptz values must have a
+        time zone. A value not matching its column type raises DataError.
+
+        This is a psycopg2cffi extension to the DB API 2.0
+
+        """
+        if columns:
+            columns_str = '(%s)' % ','.join([column for column in columns])
+        else:
+            columns_str = ''
+
+        if binary:
+            names, oids = self._describe_query(util.ascii_to_bytes(
+                "SELECT %s FROM %s" % (
+                    ','.join(columns) if columns else '*', table)))
+            encoder = BinaryCopyEncoder(oids, self._conn, names)
+        else:
+            encoder = TextCopyEncoder(self._conn)
+
+        query = util.ascii_to_bytes("COPY %s%s FROM stdin%s" % (
+            table, columns_str, ' (FORMAT binary)' if binary else ''))
+
+        self._copysize = size
+        self._copyfile = _CopyRecords(rows, encoder)
+        try:
+            self._pq_execute(query)
+        finally:
+            self._copyfile = None
+            self._copysize = None
+
     @check_closed
     @check_async
     def copy_to(self, file, table, sep='\t', null='\\N', columns=None):
@@ -481,6 +742,7 @@ class Cursor(object):
         if not sql:
             return
 
+        file = _copy_source(file)
         if not hasattr(file, 'read') and not hasattr(file, 'write'):
             raise TypeError("file must be a readable file-like object for"
                 " COPY FROM; a writeable file-like object for COPY TO.")
@@ -493,6 +755,174 @@ class Cursor(object):
             self._copyfile = None
             self._copysize = None
 
+    @check_closed
+    @check_async
+    def copy_iter(self, sql, lines=False, decode=False):
+        """Execute a COPY TO STDOUT statement and return an iterator over
+        the data produced.
+
+        The iterator returns bytes chunks of up to 256KB, merging the data
+        received from the server. If `lines` is true it returns the data
+        as received instead, one item per row: a line in text and CSV
+        format, a record in binary format. If `decode` is true text data is
+        decoded with the connection encoding.
+
+        The statement is executed when the method is called; the connection
+        can't be used for other queries until the iterator is exhausted or
+        closed. Closing it early discards the rest of the data.
+
+        This is a psycopg2cffi extension to the DB API 2.0
+
+        """
+        if not sql:
+            raise ProgrammingError("can't execute an empty query")
+        if isinstance(sql, six.text_type):
+            sql = sql.encode(self._conn._py_enc)
+
+        self._copyfile = _copy_iter
+        try:
+            self._pq_execute(sql)
+        finally:
+            self._copyfile = None
+
+        if not self._pgres or \
+                libpq.PQresultStatus(self._pgres) != libpq.PGRES_COPY_OUT:
+            raise ProgrammingError(
+                "copy_iter() can only execute COPY TO STDOUT statements")
+        self._clear_pgres()
+
+        # Start the generator, so that the copy is terminated when it is
+        # closed or deleted even if it was never iterated
+        rv = self._iter_copy_out(lines, decode)
+        next(rv)
+        return rv
+
+    @check_closed
+    @check_async
+    def copy_rows(self, query, vars=None, binary=False):
+        """Execute a query as COPY (query) TO STDOUT and return an iterator
+        over its rows.
+
+        The rows are returned as tuples, with the values converted by the
+        typecasters of the cursor as for `execute()`: the types of the
+        columns are obtained describing the query before executing it.
+        Parameters are merged into the query client-side.
+
+        If `binary` is true the data is copied in binary format and the
+        values are converted by the binary typecasters (see `binary`).
+
+        As for `copy_iter()`, the connection can't be used for other queries
+        until the iterator is exhausted or closed.
+
+        This is a psycopg2cffi extension to the DB API 2.0
+
+        """
+        if isinstance(query, six.text_type):
+            query = query.encode(self._conn._py_enc)
+        if vars is not None:
+            query = _combine_cmd_params(query, vars, self._conn)
+        query = query.rstrip(b' \t\r\n;')
+        if not query:
+            raise ProgrammingError("can't execute an empty query")
+
+        oids = self._describe_query(query)[1]
+        if binary:
+            decoder = BinaryCopyDecoder(oids, self)
+            sql = b'COPY (' + query + b') TO STDOUT (FORMAT binary)'
+        else:
+            decoder = TextCopyDecoder(oids, self)
+            sql = b'COPY (' + query + b') TO STDOUT'
+
+        return self._iter_copy_rows(self.copy_iter(sql), decoder)
+
+    def _iter_copy_rows(self, chunks, decoder):
+        try:
+            for chunk in chunks:
+                for row in decoder.feed(chunk):
+                    yield row
+        finally:
+            chunks.close()
+
+    def _describe_query(self, query):
+        """Return the names and the oids of the columns returned by a query
+
+        The query is prepared as the unnamed statement and described,
+        without executing it: the state of the cursor is not changed.
+
+        """
+        conn = self._conn
+        pgconn = conn._pgconn
+        conn._drain_stream()
+        with conn._lock:
+            pgres = libpq.PQprepare(pgconn, b'', query, 0, ffi.NULL)
+            if pgres and libpq.PQresultStatus(pgres) == \
+                    libpq.PGRES_COMMAND_OK:
+                libpq.PQclear(pgres)
+                pgres = libpq.PQdescribePrepared(pgconn, b'')
+            if not pgres:
+                raise conn._create_exception()
+            if libpq.PQresultStatus(pgres) != libpq.PGRES_COMMAND_OK:
+                raise conn._create_exception(pgres=pgres)
+
+            nfields = libpq.PQnfields(pgres)
+            names = [ffi.string(libpq.PQfname(pgres, i)).decode(conn._py_enc)
+                for i in xrange(nfields)]
+            oids = [libpq.PQftype(pgres, i) for i in xrange(nfields)]
+            libpq.PQclear(pgres)
+
+        return names, oids
+
+    def _iter_copy_out(self, lines, decode):
+        pgconn = self._conn._pgconn
+        enc = self._conn._py_enc
+        buf = ffi.new('char **')
+        chunk = bytearray()
+        length = 1
+        try:
+            yield
+            while True:
+                length = libpq.PQgetCopyData(pgconn, buf, 0)
+                if length > 0:
+                    try:
+                        if lines:
+                            data = ffi.buffer(buf[0], length)[:]
+                        else:
+                            chunk += ffi.buffer(buf[0], length)
+                    finally:
+                        libpq.PQfreemem(buf[0])
+                    if lines:
+                        yield data.decode(enc) if decode else data
+                        continue
+
+                    if len(chunk) >= _COPY_MAX_CHUNK:
+                        data = bytes(chunk)
+                        yield data.decode(enc) if decode else data
+                        chunk = bytearray()
+                elif length == -2:
+                    self._pgres = libpq.PQgetResult(pgconn)
+                    raise self._conn._create_exception(cursor=self)
+                else:
+                    break
+
+            if chunk:
+                data = bytes(chunk)
+                yield data.decode(enc) if decode else data
+
+        finally:
+            if length > 0:
+                # Interrupted: discard the rest of the data
+                while True:
+                    length = libpq.PQgetCopyData(pgconn, buf, 0)
+                    if length <= 0:
+                        break
+                    libpq.PQfreemem(buf[0])
+
+            if length == -1:
+                self._pq_copy_end()
+            else:
+                for pgres in util.pq_get_results(pgconn):
+                    libpq.PQclear(pgres)
+
     @check_closed
     def setinputsizes(self, sizes):
         """This can be used before a call to .execute*() to predefine memory
@@ -543,7 +973,7 @@ class Cursor(object):
         This is an optional DB API extension.
 
         """
-        return self._rownumber
+        return self._stream_offset + self._rownumber
 
     @property
     def connection(self):
@@ -638,8 +1068,139 @@ class Cursor(object):
 
         self._scrollable = bool(value) if value is not None else None
 
+    @property
+    def binary(self):
+        """Whether the query results are requested in binary format.
+
+        Binary results are decoded by the typecasters in
+        `extensions.binary_types`, saving the parsing of the text
+        representation. The values of json, jsonb and xml, whose binary
+        format is their text, are converted by their text typecasters;
+        fetching non-NULL values of the other types without a binary
+        typecaster raises NotSupportedError. Queries are then sent using the
+        extended query protocol, which doesn't allow several statements in
+        the same query.
+
+        The default is the value of `connection.binary`.
+
+        This is a psycopg2cffi extension to the DB API 2.0
+
+        """
+        if self._binary is None:
+            return self._conn.binary
+        return self._binary
+
+    @binary.setter
+    def binary(self, value):
+        self._binary = bool(value) if value is not None else None
+
+    @property
+    def server_binding(self):
+        """Whether the query parameters are bound server-side.
+
+        If true, `execute()` replaces the placeholders with `$n` parameters
+        and sends the values separately from the query, instead of merging
+        them into the query string as escaped literals. Values of types
+        without a server-side representation (e.g. lists, tuples, or types
+        with a custom adapter) are still merged into the query.
+
+        The default is the value of `connection.server_binding`.
+
+        This is a psycopg2cffi extension to the DB API 2.0
+
+        """
+        if self._server_binding is None:
+            return self._conn.server_binding
+        return self._server_binding
+
+    @server_binding.setter
+    def server_binding(self, value):
+        self._server_binding = bool(value) if value is not None else None
+
+    @property
+    def rewrite_inserts(self):
+        """Whether `executemany()` folds inserts into multi-row statements.
+
+        If true and the query is an ``INSERT ... VALUES (...)`` statement
+        with no other clause after the ``VALUES`` list, `executemany()`
+        merges the parameters into the ``VALUES`` list of the query, once
+        per parameters set, and executes the resulting multi-row inserts in
+        pages limited in number of rows and size. `rowcount` is the total
+        number of rows inserted. The parameters are always merged into the
+        query client-side.
+
+        Each page is executed as a single statement: in autocommit mode an
+        error prevents all the rows of its page from being inserted.
+
+        The default is the value of `connection.rewrite_inserts`.
+
+        This is a psycopg2cffi extension to the DB API 2.0
+
+        """
+        if self._rewrite_inserts is None:
+            return self._conn.rewrite_inserts
+        return self._rewrite_inserts
+
+    @rewrite_inserts.setter
+    def rewrite_inserts(self, value):
+        self._rewrite_inserts = bool(value) if value is not None else None
+
+    @property
+    def streaming(self):
+        """Whether the rows of the queries are received while fetched.
+
+        In streaming mode `execute()` doesn't wait for the whole result of a
+        query: its rows are received from the server while they are fetched,
+        in libpq single-row mode (or chunks of `itersize` rows with libpq 17
+        and following), so that the memory used doesn't depend on the size
+        of the result. Only the rows of the first statement returning rows
+        are returned; `rowcount` is -1 until all of them have been fetched
+        and `scroll()` is not available.
+
+        Executing another command on the connection discards the rows not
+        fetched yet. The mode is ignored by named cursors and on asynchronous
+        and green connections.
+
+        This is a psycopg2cffi extension to the DB API 2.0
+
+        """
+        return self._streaming
+
+    @streaming.setter
+    def streaming(self, value):
+        if value and not _stream_statuses:
+            raise exceptions.NotSupportedError(
+                "streaming requires libpq 9.2 or following")
+        self._streaming = bool(value)
+
+    @property
+    def multiple_results(self):
+        """Whether the results of all the statements of a query are kept.
+
+        By default, when the query executed contains several statements, only
+        the result of the last one is available. If this attribute is set the
+        cursor returns the result of the first statement and `nextset()`
+        moves to the following ones, updating `description`, `rowcount` and
+        `statusmessage`. An error in any statement is raised by `execute()`.
+
+        The attribute is ignored by named and streaming cursors and if the
+        query is sent using the extended query protocol (e.g. with binary
+        results or server-side binding), which only allows one statement.
+
+        This is a psycopg2cffi extension to the DB API 2.0
+
+        """
+        return self._multiple_results
+
+    @multiple_results.setter
+    def multiple_results(self, value):
+        self._multiple_results = bool(value)
+
     @check_closed
     def scroll(self, value, mode='relative'):
+        if self._stream:
+            raise ProgrammingError("can't scroll a streaming cursor")
+
         if not self._name:
             if mode == 'relative':
                 new_pos = self._rownumber + value
@@ -661,35 +1222,271 @@ class Cursor(object):
             if self._mark != self._conn._mark and not self._withhold:
                 raise ProgrammingError("named cursor isn't valid anymore")
 
+            # The server position is past the rows read ahead: skip forward
+            # in the buffer if possible, otherwise discard it and MOVE.
+            buffered = self._buffered_rows()
+            if mode == 'relative' and 0 <= value <= buffered:
+                self._rownumber += value
+                return
+
             # This should also raise a ProgrammingError if the mode is
             # not absolute or relative. But mimic psycopg for now.
             if mode == 'absolute':
                 cmd = 'MOVE ABSOLUTE %d FROM "%s"' % (value, self._name)
             else:
-                cmd = 'MOVE %d FROM "%s"' % (value, self._name)
+                cmd = 'MOVE %d FROM "%s"' % (
+                    value - buffered - self._fetch_overrun, self._name)
+            self._clear_pgres()
             self._pq_execute(cmd)
+            self._rownumber = self._rowcount
+            self._fetch_overrun = 0
+
+    def _executemany_values(self, prefix, values, paramlist):
+        """Execute an insert for all the parameters, merged into multi-row
+        ``VALUES`` lists
+
+        `prefix` is the query up to the ``VALUES`` keyword, `values` the
+        ``VALUES`` list with the placeholders.
+
+        """
+        conn = self._conn
+        rowcount = 0
+        page = []
+        size = 0
+        paramlist = iter(paramlist)
+        while 1:
+            batch = list(islice(paramlist, _INSERT_PAGE_ROWS))
+            if not batch:
+                break
+            for value in _combine_cmd_params_many(values, batch, conn):
+                page.append(value)
+                size += len(value) + 1
+                if len(page) >= _INSERT_PAGE_ROWS \
+                        or size >= _INSERT_PAGE_SIZE:
+                    self.execute(prefix + b','.join(page))
+                    rowcount += self.rowcount
+                    page = []
+                    size = 0
+
+        if page:
+            self.execute(prefix + b','.join(page))
+            rowcount += self.rowcount
+
+        self._rowcount = rowcount
+
+    def _can_pipeline(self, query):
+        """Return True if `executemany()` can use the libpq pipeline mode"""
+        conn = self._conn
+        # The statements of a pipeline are sent with the extended query
+        # protocol, so the query can only contain one, and run in the same
+        # transaction, which is only equivalent outside of autocommit.
+        return (_have_pipeline and self._name is None
+            and not conn.autocommit and not conn._async
+            and not conn._have_wait_callback()
+            and b';' not in query.rstrip().rstrip(b';'))
+
+    def _executemany_pipeline(self, query, paramlist):
+        """Execute the query for all the parameters in libpq pipeline mode
+
+        The statements are sent without waiting for the results of the
+        previous ones: the results already received are read while sending,
+        the others after the pipeline sync.
+
+        """
+        # Don't start a transaction if there is nothing to execute
+        paramlist = iter(paramlist)
+        for params in paramlist:
+            paramlist = chain([params], paramlist)
+            break
+        else:
+            self._rowcount = 0
+            return
+
+        conn = self._conn
+        server_binding = self.server_binding
+        self._description = None
+        self._no_tuples = True
+        self._query_offset = 0
+        conn._begin_transaction(defer=True)
+
+        with conn._lock:
+            pgconn = conn._pgconn
+            conn._drain_stream()
+            self._clear_results()
+            self._clear_pgres()
+
+            if not libpq.PQenterPipelineMode(pgconn):
+                raise conn._create_exception(cursor=self)
+
+            reader = _PipelineReader(pgconn)
+            try:
+                exc_info = None
+                i = None
+                try:
+                    if conn._begin_pending:
+                        conn._begin_pending = False
+                        reader.queries.append(None)
+                        if not libpq.PQsendQueryParams(pgconn, b'BEGIN', 0,
+                                ffi.NULL, ffi.NULL, ffi.NULL, ffi.NULL, 0):
+                            raise conn._create_exception()
+
+                    for i, params in enumerate(paramlist):
+                        if server_binding:
+                            cmd, sparams = _server_cmd_params(
+                                query, params, conn)
+                        else:
+                            cmd = _combine_cmd_params(query, params, conn)
+                            sparams = None
+
+                        reader.queries.append(cmd)
+                        if not self._pq_send(pgconn, cmd,
+                                params=sparams or _no_server_params) \
+                                or not reader.read(False):
+                            raise conn._create_exception()
+                except BaseException:
+                    # Complete the pipeline anyway: an error from the
+                    # statements already sent takes precedence, as it would
+                    # have been raised before in a loop of execute().
+                    exc_info = sys.exc_info()
+                    if isinstance(exc_info[1], exceptions.Error):
+                        exc_info[1].params_index = i
+
+                synced = libpq.PQpipelineSync(pgconn) and reader.read(True)
+                libpq.PQexitPipelineMode(pgconn)
+                conn._process_notifies()
+
+                if reader.error:
+                    self._query = reader.error_query
+                    self._pgres, reader.error = reader.error, ffi.NULL
+                    try:
+                        self._pq_fetch()
+                    except exceptions.Error as e:
+                        e.params_index = reader.error_index
+                        raise
+                if exc_info is not None:
+                    six.reraise(*exc_info)
+                if not synced:
+                    raise conn._create_exception()
+
+                if reader.last:
+                    self._query = reader.last_query
+                    self._pgres, reader.last = reader.last, ffi.NULL
+                    self._pq_fetch()
+                self._rowcount = reader.rowcount
+
+            finally:
+                reader.close()
+
+    def _buffered_rows(self):
+        """Return the number of rows fetched by a named cursor not read yet"""
+        if self._name is None:
+            return 0
+        return max(self._rowcount - self._rownumber, 0)
+
+    def _fetch_forward(self, size, needed):
+        """Fetch the next `size` rows of a named cursor, all if None
+
+        `needed` is the number of rows requested by the caller. If they are
+        available but fewer than `size`, the server cursor is positioned
+        past the end while the caller isn't aware of it yet: remember it to
+        compute the relative moves in `scroll()`.
+
+        """
+        self._clear_pgres()
+        self._pq_execute('FETCH FORWARD %s FROM "%s"' % (
+            'ALL' if size is None else '%d' % size, self._name))
+        self._fetch_overrun = int(size is not None
+            and needed <= self._rowcount < size)
 
     def _clear_pgres(self):
         if self._pgres:
             libpq.PQclear(self._pgres)
             self._pgres = ffi.NULL
 
-    def _pq_execute(self, query, async_conn=False):
-        """Execute the query"""
+    def _clear_results(self):
+        """Discard the results kept for `nextset()`"""
+        while self._results:
+            libpq.PQclear(self._results.pop())
+
+    def _get_results(self, pgconn):
+        """Return the result of the query sent to the connection
+
+        If `multiple_results` is set keep the results of the following
+        statements for `nextset()`. Return the first error instead if any
+        statement failed, or the COPY result to process if any.
+
+        """
+        if not self._multiple_results or self._name is not None:
+            return util.pq_get_last_result(pgconn)
+
+        results = util.pq_get_results(pgconn)
+        if not results:
+            return ffi.NULL
+
+        # Drop the result of the BEGIN sent together with the query
+        if self._begin_sent and len(results) > 1 and \
+                libpq.PQresultStatus(results[0]) == libpq.PGRES_COMMAND_OK:
+            libpq.PQclear(results.pop(0))
+
+        # A COPY must be processed now, an error is raised by execute()
+        keep = None
+        if libpq.PQresultStatus(results[-1]) in (
+                libpq.PGRES_COPY_IN, libpq.PGRES_COPY_OUT):
+            keep = results[-1]
+        else:
+            for pgres in results:
+                if libpq.PQresultStatus(pgres) == libpq.PGRES_FATAL_ERROR:
+                    keep = pgres
+                    break
+
+        if keep is None:
+            self._results = results[1:]
+            return results[0]
+
+        for pgres in results:
+            if pgres != keep:
+                libpq.PQclear(pgres)
+        return keep
+
+    def _pq_execute(self, query, async_conn=False, params=None,
+            prepare=False):
+        """Execute the query
+
+        `params` is a `_ServerParams` instance with the parameters bound
+        server-side, if any. If `prepare` is true the query can be executed
+        using a prepared statement from the connection cache.
+
+        """
         with self._conn._lock:
             pgconn = self._conn._pgconn
+            self._conn._drain_stream()
+            self._clear_results()
 
             # Check the status of the connection
             if libpq.PQstatus(pgconn) != libpq.CONNECTION_OK:
                 raise self._conn._create_exception(cursor=self)
 
+            # COPY results have no tuples: don't bother with binary results
+            binary = self.binary and self._copyfile is None
+            self._query_offset = 0
+
             if not async_conn:
                 with self._conn._lock:
+                    self._begin_sent = False
                     if not self._conn._have_wait_callback():
-                        self._pgres = libpq.PQexec(
-                                pgconn, util.ascii_to_bytes(query))
+                        self._pgres = self._pq_exec(
+                                pgconn, util.ascii_to_bytes(query),
+                                binary, params, prepare)
                     else:
-                        self._pgres = self._conn._execute_green(query)
+                        if params is not None or binary:
+                            self._conn._flush_begin()
+                        self._pgres = self._conn._execute_green(
+                            query, lambda pgconn, query:
+                                self._pq_send(pgconn, query, binary, params),
+                            self._get_results)
+                    if self._begin_sent:
+                        self._begin_sent = False
+                        self._conn._check_begin()
                     if not self._pgres:
                         raise self._conn._create_exception(cursor=self)
                     self._conn._process_notifies()
@@ -697,7 +1494,7 @@ class Cursor(object):
 
             else:
                 with self._conn._lock:
-                    ret = libpq.PQsendQuery(pgconn, query)
+                    ret = self._pq_send(pgconn, query, binary, params)
                     if not ret:
 
                         # XXX: check if this is correct, seems like a hack.
@@ -719,6 +1516,264 @@ class Cursor(object):
                 self._conn._async_status = async_status
                 self._conn._async_cursor = weakref.ref(self)
 
+    def _pq_execute_stream(self, query, params=None):
+        """Execute the query in streaming mode
+
+        Receive only the first chunk of rows: the other ones are received by
+        `_stream_next()`.
+
+        """
+        conn = self._conn
+        with conn._lock:
+            pgconn = conn._pgconn
+            conn._drain_stream()
+
+            if libpq.PQstatus(pgconn) != libpq.CONNECTION_OK:
+                raise conn._create_exception(cursor=self)
+
+            self._begin_sent = False
+            self._query_offset = 0
+            if params is not None or self.binary:
+                conn._flush_begin()
+            if not self._pq_send(
+                    pgconn, util.ascii_to_bytes(query), self.binary, params):
+                raise conn._create_exception(cursor=self)
+
+            if PG_VERSION >= 0x110000:
+                libpq.PQsetChunkedRowsMode(pgconn, max(self.itersize, 1))
+            else:
+                libpq.PQsetSingleRowMode(pgconn)
+
+            # Skip the results of the statements not returning rows
+            pgres = libpq.PQgetResult(pgconn)
+            while pgres and \
+                    libpq.PQresultStatus(pgres) == libpq.PGRES_COMMAND_OK:
+                pgres_next = libpq.PQgetResult(pgconn)
+                if not pgres_next:
+                    break
+                libpq.PQclear(pgres)
+                pgres = pgres_next
+
+            if not pgres:
+                raise conn._create_exception()
+            conn._process_notifies()
+
+            self._pgres = pgres
+            status = libpq.PQresultStatus(pgres)
+            if status in _stream_statuses:
+                self._begin_sent = False
+                conn._stream_cursor = weakref.ref(self)
+                self._stream = True
+                self._statusmessage = None
+                self._rownumber = 0
+                self._rowcount = libpq.PQntuples(pgres)
+                self._pq_fetch_tuples()
+                return
+
+            # Not a stream of rows: consume the other results, if any, and
+            # handle the result normally, unless an error follows.
+            if status not in (libpq.PGRES_COPY_IN, libpq.PGRES_COPY_OUT):
+                while True:
+                    pgres = libpq.PQgetResult(pgconn)
+                    if not pgres:
+                        break
+                    if status != libpq.PGRES_FATAL_ERROR and \
+                            libpq.PQresultStatus(pgres) \
+                                == libpq.PGRES_FATAL_ERROR:
+                        self._clear_pgres()
+                        self._pgres = pgres
+                        status = libpq.PGRES_FATAL_ERROR
+                    else:
+                        libpq.PQclear(pgres)
+
+            if self._begin_sent:
+                self._begin_sent = False
+                conn._check_begin()
+
+        self._pq_fetch()
+
+    def _stream_next(self):
+        """Receive the next chunk of rows of a streamed query
+
+        Return False if there are no more rows.
+
+        """
+        if not self._stream:
+            return False
+
+        with self._conn._lock:
+            pgres = libpq.PQgetResult(self._conn._pgconn)
+            if pgres and libpq.PQresultStatus(pgres) in _stream_statuses:
+                self._stream_offset += self._rowcount
+                self._clear_pgres()
+                self._pgres = pgres
+                self._rownumber = 0
+                self._rowcount = libpq.PQntuples(pgres)
+                return True
+
+        self._stream_finish(pgres)
+        return False
+
+    def _stream_rows(self, size):
+        """Return up to `size` rows (all if None) of a streamed query"""
+        rows = []
+        while size is None or len(rows) < size:
+            count = self._rowcount - self._rownumber
+            if count <= 0:
+                if not self._stream_next():
+                    break
+                continue
+            if size is not None:
+                count = min(count, size - len(rows))
+            rows.extend(self._build_rows(count))
+        return rows
+
+    def _stream_finish(self, pgres):
+        """Consume the results left of a streamed query
+
+        `pgres` is the first result received which is not a chunk of rows,
+        or NULL. Raise the first error found in the results.
+
+        """
+        conn = self._conn
+        self._clear_pgres()
+        self._rownumber = self._rowcount = \
+            self._stream_offset + self._rowcount
+        self._stream_offset = 0
+        self._stream = False
+        conn._stream_cursor = None
+
+        error = None
+        with conn._lock:
+            while True:
+                if not pgres:
+                    pgres = libpq.PQgetResult(conn._pgconn)
+                    if not pgres:
+                        break
+
+                status = libpq.PQresultStatus(pgres)
+                if status == libpq.PGRES_FATAL_ERROR and error is None:
+                    error = pgres
+                else:
+                    if status == libpq.PGRES_TUPLES_OK and \
+                            self._statusmessage is None:
+                        self._statusmessage = util.bytes_to_ascii(
+                            ffi.string(libpq.PQcmdStatus(pgres)))
+                    libpq.PQclear(pgres)
+                    if status in (libpq.PGRES_COPY_IN, libpq.PGRES_COPY_OUT):
+                        break
+                pgres = ffi.NULL
+
+        if error is not None:
+            self._pgres = error
+            raise conn._create_exception(cursor=self)
+
+    def _pq_exec(self, pgconn, query, binary=False, params=None,
+            prepare=False):
+        """Execute the query and wait for its result"""
+        conn = self._conn
+        if params is None:
+            if not binary:
+                query = self._begin_query(query)
+                if self._multiple_results and self._name is None:
+                    if not libpq.PQsendQuery(pgconn, query):
+                        return ffi.NULL
+                    return self._get_results(pgconn)
+                return libpq.PQexec(pgconn, query)
+            params = _no_server_params
+
+        name = None
+        if prepare:
+            name = conn._get_prepared((query, params.oids), query, params)
+
+        if conn._begin_pending and _have_pipeline:
+            self._begin_sent = True
+            pgres = self._pq_exec_begin(pgconn, query, binary, params, name)
+        else:
+            conn._flush_begin()
+            if name is None:
+                return libpq.PQexecParams(
+                    pgconn, query, params.nparams, params.types,
+                    params.values, params.lengths, params.formats,
+                    int(binary))
+            pgres = libpq.PQexecPrepared(
+                pgconn, name, params.nparams, params.values,
+                params.lengths, params.formats, int(binary))
+
+        if name is not None and pgres:
+            if _is_stale_plan(pgres):
+                conn._invalidate_prepared()
+            elif _is_missing_statement(pgres):
+                conn._invalidate_prepared(lost=True)
+        return pgres
+
+    def _pq_exec_begin(self, pgconn, query, binary, params, name):
+        """Execute BEGIN and the query in pipeline mode, return its result
+
+        The query is executed using the prepared statement `name` if not
+        None. Return the first error if either command fails.
+
+        """
+        self._conn._begin_pending = False
+        if not libpq.PQenterPipelineMode(pgconn):
+            return ffi.NULL
+
+        results = []
+        try:
+            ok = libpq.PQsendQueryParams(pgconn, b'BEGIN', 0,
+                ffi.NULL, ffi.NULL, ffi.NULL, ffi.NULL, 0)
+            if ok and name is None:
+                ok = libpq.PQsendQueryParams(
+                    pgconn, query, params.nparams, params.types,
+                    params.values, params.lengths, params.formats,
+                    int(binary))
+            elif ok:
+                ok = libpq.PQsendQueryPrepared(
+                    pgconn, name, params.nparams, params.values,
+                    params.lengths, params.formats, int(binary))
+            ok = ok and libpq.PQpipelineSync(pgconn)
+
+            while ok:
+                pgres = libpq.PQgetResult(pgconn)
+                if not pgres:
+                    # End of the results of a command
+                    ok = libpq.PQstatus(pgconn) == libpq.CONNECTION_OK
+                elif libpq.PQresultStatus(pgres) == libpq.PGRES_PIPELINE_SYNC:
+                    libpq.PQclear(pgres)
+                    break
+                else:
+                    results.append(pgres)
+        finally:
+            libpq.PQexitPipelineMode(pgconn)
+
+        rv = ffi.NULL
+        for pgres in results:
+            if rv and libpq.PQresultStatus(rv) == libpq.PGRES_FATAL_ERROR:
+                libpq.PQclear(pgres)
+            else:
+                if rv:
+                    libpq.PQclear(rv)
+                rv = pgres
+        return rv
+
+    def _begin_query(self, query):
+        """Prefix the query with the BEGIN of the transaction if not sent"""
+        rv = self._conn._begin_prefix(query)
+        if rv is not query:
+            self._begin_sent = True
+            self._query_offset = len(rv) - len(query)
+        return rv
+
+    def _pq_send(self, pgconn, query, binary=False, params=None):
+        """Send the query without waiting for its result"""
+        if params is None:
+            if not binary:
+                return libpq.PQsendQuery(pgconn, self._begin_query(query))
+            params = _no_server_params
+        return libpq.PQsendQueryParams(
+            pgconn, query, params.nparams, params.types, params.values,
+            params.lengths, params.formats, int(binary))
+
     def _pq_fetch(self):
         pgstatus = libpq.PQresultStatus(self._pgres)
         if pgstatus != libpq.PGRES_FATAL_ERROR:
@@ -738,6 +1793,8 @@ class Cursor(object):
                 self._rowcount = int(rowcount)
             self._lastrowid = libpq.PQoidValue(self._pgres)
             self._clear_pgres()
+            if self._statusmessage in ('DISCARD ALL', 'DEALLOCATE ALL'):
+                self._conn._discard_prepared()
 
         elif pgstatus == libpq.PGRES_TUPLES_OK:
             self._rowcount = libpq.PQntuples(self._pgres)
@@ -763,6 +1820,7 @@ class Cursor(object):
             description = []
             casts = []
             fast_parsers = []
+            cell_kinds = []
             for i in xrange(self._nfields):
                 ftype = libpq.PQftype(self._pgres, i)
                 fsize = libpq.PQfsize(self._pgres, i)
@@ -784,7 +1842,11 @@ class Cursor(object):
                 else:
                     prec = scale = None
 
-                casts.append(self._get_cast(ftype))
+                binary = libpq.PQfformat(self._pgres, i) == 1
+                if binary:
+                    casts.append(self._get_binary_cast(ftype))
+                else:
+                    casts.append(self._get_cast(ftype))
                 description.append(Column(
                     name=ffi.string(libpq.PQfname(self._pgres, i))\
                             .decode(self._conn._py_enc),
@@ -797,71 +1859,176 @@ class Cursor(object):
                 ))
 
                 fast_parser = None
+                cell_kind = libpq.PQE_CELL_VALUE
                 if is_32bits:
                     # disable all fast parsers to avoid portability problems
                     pass
+                elif binary:
+                    # fast parsers only understand the text format
+                    pass
                 elif ftype == 21 or ftype == 23:
                     fast_parser = libpq.PQEgetint, ffi.new("int32_t*")
+                    cell_kind = libpq.PQE_CELL_INT
                 elif ftype == 20:
                     fast_parser = libpq.PQEgetlong, ffi.new("int64_t*")
+                    cell_kind = libpq.PQE_CELL_INT
                 elif ftype == 700:
                     fast_parser = libpq.PQEgetfloat, ffi.new("float*")
+                    cell_kind = libpq.PQE_CELL_FLOAT4
                 elif ftype == 701:
                     fast_parser = libpq.PQEgetdouble, ffi.new("double*")
+                    cell_kind = libpq.PQE_CELL_FLOAT8
                 fast_parsers.append(fast_parser)
+                cell_kinds.append(cell_kind)
 
 
             self._description = tuple(description)
             self._casts = casts
             self._fast_parsers = fast_parsers
+            self._cell_kinds = cell_kinds
 
     def _pq_fetch_copy_in(self):
+        """Send the data read from the copy file to a COPY FROM STDIN
+
+        Files with a `readinto()` method are read into a buffer reused for
+        the whole operation, whose size doubles, up to `_COPY_MAX_CHUNK`,
+        every time the file fills it. Other files are read by `size`.
+
+        """
         pgconn = self._conn._pgconn
-        size = self._copysize
-        error = 0
-        while True:
-            data = self._copyfile.read(size)
-            if isinstance(self._copyfile, TextIOBase):
-                data = data.encode(self._conn._py_enc)
+        copyfile = self._copyfile
+        if copyfile is _copy_iter:
+            self._pq_copy_abort()
+            raise ProgrammingError(
+                "copy_iter() can only execute COPY TO STDOUT statements")
 
-            if not data:
-                break
+        is_text = isinstance(copyfile, TextIOBase)
+        readinto = None if is_text else getattr(copyfile, 'readinto', None)
+        size = self._copysize
+        max_size = max(size, _COPY_MAX_CHUNK)
+        if readinto is not None:
+            chunk = bytearray(size)
 
-            res = libpq.PQputCopyData(pgconn, data, len(data))
-            if res <= 0:
-                error = 2
-                break
+        error = 0
+        try:
+            while True:
+                if readinto is not None:
+                    length = readinto(chunk)
+                    if not length:
+                        break
+                    res = libpq.PQputCopyData(
+                        pgconn, ffi.from_buffer(chunk), length)
+                else:
+                    data = copyfile.read(size)
+                    if isinstance(data, six.text_type):
+                        data = data.encode(self._conn._py_enc)
+                    if not data:
+                        break
+                    if not isinstance(data, six.binary_type):
+                        data = ffi.from_buffer(data)
+                    length = len(data)
+                    res = libpq.PQputCopyData(pgconn, data, length)
+
+                if res <= 0:
+                    error = 2
+                    break
+
+                if readinto is not None and length >= size < max_size:
+                    size = min(size * 2, max_size)
+                    chunk = bytearray(size)
+        except BaseException:
+            # Terminate the copy before propagating the error, or the
+            # connection would be left in COPY IN state
+            self._pq_copy_abort(b'error in .read() call')
+            raise
 
         errmsg = ffi.NULL
         if error == 2:
-            errmsg = 'error in PQputCopyData() call'
+            errmsg = b'error in PQputCopyData() call'
 
         libpq.PQputCopyEnd(pgconn, errmsg)
         self._clear_pgres()
-        util.pq_clear_async(self._conn)
+        self._pq_copy_end()
 
     def _pq_fetch_copy_out(self):
-        is_text = isinstance(self._copyfile, TextIOBase)
+        """Write the data of a COPY TO STDOUT to the copy file
+
+        The rows received are accumulated in a buffer reused for the whole
+        operation and written to binary files as a memoryview when it is
+        full: the file must not keep a reference to the data written.
+
+        """
         pgconn = self._conn._pgconn
+        copyfile = self._copyfile
+        if copyfile is _copy_iter:
+            # The data is consumed by the copy_iter() iterator
+            return
+        if isinstance(copyfile, TextIOBase):
+            enc = self._conn._py_enc
+
+            def write(data):
+                copyfile.write(bytes(data).decode(enc))
+        else:
+            write = copyfile.write
+
+        size = _COPY_MAX_CHUNK
+        chunk = bytearray(size)
+        view = memoryview(chunk)
+        dest = ffi.from_buffer(chunk)
+        pos = 0
+        buf = ffi.new('char **')
         while True:
-            buf = ffi.new('char **')
             length = libpq.PQgetCopyData(pgconn, buf, 0)
-
             if length > 0:
-                if buf[0] == ffi.NULL:
-                    return
-                value = ffi.buffer(buf[0], length)
-                if is_text:
-                    value = typecasts.parse_unicode(value[:], length, self)
-
-                self._copyfile.write(value)
+                if pos + length > size and pos:
+                    write(view[:pos])
+                    pos = 0
+                try:
+                    if length > size:
+                        write(ffi.buffer(buf[0], length))
+                    else:
+                        ffi.memmove(dest + pos, buf[0], length)
+                        pos += length
+                finally:
+                    libpq.PQfreemem(buf[0])
             elif length == -2:
                 raise self._conn._create_exception(cursor=self)
             else:
                 break
 
+        if pos:
+            write(view[:pos])
+
         self._clear_pgres()
-        util.pq_clear_async(self._conn)
+        self._pq_copy_end()
+
+    def _pq_copy_abort(self, errmsg=b'COPY aborted'):
+        """Terminate a COPY FROM STDIN with an error, discarding its result"""
+        pgconn = self._conn._pgconn
+        libpq.PQputCopyEnd(pgconn, errmsg)
+        self._clear_pgres()
+        for pgres in util.pq_get_results(pgconn):
+            libpq.PQclear(pgres)
+
+    def _pq_copy_end(self):
+        """Consume the results after a COPY, setting the rowcount"""
+        pgconn = self._conn._pgconn
+        error = False
+        while True:
+            pgres = libpq.PQgetResult(pgconn)
+            if not pgres:
+                break
+
+            status = libpq.PQresultStatus(pgres)
+            if status == libpq.PGRES_FATAL_ERROR:
+                error = True
+            elif status == libpq.PGRES_COMMAND_OK:
+                rowcount = ffi.string(libpq.PQcmdTuples(pgres))
+                self._rowcount = int(rowcount) if rowcount else -1
+            libpq.PQclear(pgres)
+
+        if error:
+            raise self._conn._create_exception()
 
     def _build_row(self):
         row_num = self._rownumber
@@ -898,6 +2065,123 @@ class Cursor(object):
             return tuple(row)
         return row
 
+    def _build_rows(self, nrows):
+        """Return a list with the next `nrows` rows
+
+        The cells are extracted from the result by blocks of rows, with a
+        single call to the C library per block.
+
+        """
+        rows = []
+        nfields = self._nfields
+        block = max(1, min(nrows, _BLOCK_CELLS // max(nfields, 1)))
+        ncells = block * nfields
+        vals = ffi.new('char *[]', ncells)
+        lengths = ffi.new('int[]', ncells)
+        ints = ffi.new('int64_t[]', ncells)
+        floats = ffi.new('double[]', ncells)
+
+        pgres = self._pgres
+        casts = self._casts
+        kinds = self._cell_kinds
+        c_kinds = ffi.new('int[]', kinds)
+        row_factory = self.row_factory
+        cell_value = libpq.PQE_CELL_VALUE
+        cell_int = libpq.PQE_CELL_INT
+
+        while nrows > 0:
+            count = min(block, nrows)
+            libpq.PQEgetcells(pgres, self._rownumber, count, nfields,
+                c_kinds, vals, lengths, ints, floats)
+            k = 0
+            for _ in xrange(count):
+                if row_factory:
+                    row = row_factory(self)
+                else:
+                    row = [None] * nfields
+
+                for i in xrange(nfields):
+                    length = lengths[k]
+                    if length < 0:
+                        row[i] = None
+                    else:
+                        kind = kinds[i]
+                        if kind == cell_value:
+                            val = ffi.buffer(vals[k], length)[:]
+                            row[i] = typecasts.typecast(
+                                casts[i], val, length, self)
+                        elif kind == cell_int:
+                            row[i] = ints[k]
+                        else:
+                            row[i] = floats[k]
+                    k += 1
+
+                self._rownumber += 1
+                rows.append(row if row_factory else tuple(row))
+
+            nrows -= count
+
+        return rows
+
+    def _build_column(self, col, row_num, nrows):
+        values = []
+        fast_parser = self._fast_parsers[col]
+        if fast_parser is not None:
+            typecode, ctype, get_column = \
+                _column_parsers[self._description[col].type_code]
+            data = array(typecode, [0]) * nrows
+            count = get_column(ffi.cast(ctype, ffi.from_buffer(data)),
+                self._pgres, row_num, nrows, col)
+            if count == nrows:
+                return data
+
+            # There are NULLs in the column: return a list instead
+            values = data[:count].tolist()
+            row_num += count
+            nrows -= count
+
+        pgres = self._pgres
+        cast = self._casts[col]
+        for row in xrange(row_num, row_num + nrows):
+            if libpq.PQgetisnull(pgres, row, col):
+                values.append(None)
+            elif fast_parser is not None:
+                p = fast_parser[1]
+                error = fast_parser[0](p, pgres, row, col)
+                values.append(None if error else p[0])
+            else:
+                length = libpq.PQgetlength(pgres, row, col)
+                val = ffi.buffer(libpq.PQgetvalue(pgres, row, col), length)[:]
+                values.append(typecasts.typecast(cast, val, length, self))
+
+        return values
+
+    def _build_numpy_column(self, numpy, col, row_num, nrows):
+        """Return the values of a column as NumPy array and the NULLs mask
+
+        The mask is None if the column has no NULL.
+
+        """
+        oid = self._description[col].type_code
+        if oid in _numpy_types:
+            dtype, view = _numpy_types[oid]
+            values = numpy.empty(nrows, dtype=dtype)
+            nulls = numpy.empty(nrows, dtype=numpy.uint8)
+            nnulls = libpq.PQEgetcolumn(
+                ffi.from_buffer(values), ffi.from_buffer(nulls),
+                self._pgres, row_num, nrows, col, oid)
+            if nnulls < 0:
+                raise InterfaceError(
+                    "can't parse the values of column %d" % col)
+            if view is not None:
+                values = values.view(view)
+            return values, nulls.view(bool) if nnulls else None
+
+        values = numpy.empty(nrows, dtype=object)
+        for i, value in enumerate(self._build_column(col, row_num, nrows)):
+            values[i] = value
+        return values, None
+
     def _get_cast(self, oid):
         try:
             return self._typecasts[oid]
@@ -910,33 +2194,217 @@ class Cursor(object):
                 except KeyError:
                     return typecasts.string_types[705]
 
+    def _get_binary_cast(self, oid):
+        try:
+            return typecasts.binary_types[oid]
+        except KeyError:
+            if oid in typecasts.binary_text_headers:
+                return typecasts.binary_text_type(oid, self._get_cast(oid))
+            return typecasts.binary_unsupported_type(oid)
+
+
+# Statuses of the results containing a chunk of the rows of a query, received
+# in streaming mode
+_stream_statuses = ()
+if PG_VERSION >= 0x090200:
+    _stream_statuses += (libpq.PGRES_SINGLE_TUPLE,)
+if PG_VERSION >= 0x110000:
+    _stream_statuses += (libpq.PGRES_TUPLES_CHUNK,)
+
+# Maximum number of cells extracted from a result at once by _build_rows()
+_BLOCK_CELLS = 10000
+
+# Array typecode, C type and function to parse a column of the types handled
+# by the fast parsers
+_column_parsers = {
+    21: ('i', 'int32_t *', libpq.PQEgetints),
+    23: ('i', 'int32_t *', libpq.PQEgetints),
+    20: (_array_typecode(8, 'ql'), 'int64_t *', libpq.PQEgetlongs),
+    700: ('f', 'float *', libpq.PQEgetfloats),
+    701: ('d', 'double *', libpq.PQEgetdoubles),
+}
+
+
+# dtype of the array filled by PQEgetcolumn() and dtype of the returned
+# view, for the types handled by fetchnumpy()
+_numpy_types = {
+    21: ('int16', None),
+    23: ('int32', None),
+    20: ('int64', None),
+    700: ('float32', None),
+    701: ('float64', None),
+    16: ('uint8', 'bool'),
+    1082: ('int64', 'datetime64[D]'),
+    1114: ('int64', 'datetime64[us]'),
+    1184: ('int64', 'datetime64[us]'),
+}
+
+
+# Marker for the copy file of a COPY TO STDOUT whose data is consumed by the
+# iterator returned by copy_iter()
+_copy_iter = object()
+
+
+def _copy_source(file):
+    """Wrap an iterable of data chunks into a readable object for COPY"""
+    if hasattr(file, 'read') or hasattr(file, 'write') \
+            or isinstance(file, (six.text_type, six.binary_type)) \
+            or not hasattr(file, '__iter__'):
+        return file
+    return _CopyChunks(file)
+
+
+class _CopyChunks(object):
+    """Read the chunks of an iterable as COPY data"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+
+    def read(self, size):
+        for chunk in self._chunks:
+            if chunk:
+                return chunk
+        return b''
+
+
+class _CopyRecords(object):
+    """Read the records of an iterable as COPY data, using an encoder from
+    the `pgcopy` module
 
-def _combine_cmd_params(cmd, params, conn):
-    """Combine the command string and params"""
+    """
 
-    if isinstance(cmd, six.text_type):
-        cmd = cmd.encode(conn._py_enc)
+    def __init__(self, rows, encoder):
+        self._rows = iter(rows)
+        self._encoder = encoder
+        self._header = encoder.header()
+
+    def read(self, size):
+        if self._rows is None:
+            return b''
+
+        encode = self._encoder.encode
+        chunks = [self._header]
+        self._header = b''
+        length = 0
+        for row in self._rows:
+            chunk = encode(row)
+            chunks.append(chunk)
+            length += len(chunk)
+            if length >= size:
+                break
+        else:
+            chunks.append(self._encoder.trailer())
+            self._rows = None
 
-    # Return when no argument binding is required.  Note that this method is
-    # not called from .execute() if `params` is None.
-    if b'%' not in cmd:
-        return cmd
+        return b''.join(chunks)
+
+
+# Maximum size of the chunks of data exchanged in COPY operations
+_COPY_MAX_CHUNK = 256 * 1024
+
+# Maximum number of parameters sets and size of the multi-row inserts
+# executed by executemany() if rewrite_inserts is set
+_INSERT_PAGE_ROWS = 1000
+_INSERT_PAGE_SIZE = 1024 * 1024
+
+_insert_re = re.compile(
+    br'\s*insert\s+into\s+[^%]+?\s+values\s*(?=\()', re.IGNORECASE)
+
+
+def _split_insert(cmd):
+    """Split an ``INSERT ... VALUES (...)`` command before its values
+
+    Return the parts of the command up to the ``VALUES`` keyword and the
+    ``VALUES`` list, or None if the command has a different form, e.g. if it
+    has other clauses after the ``VALUES`` list. Commands with comments,
+    dollar quotes or backslashes are not split.
+
+    """
+    m = _insert_re.match(cmd)
+    if m is None:
+        return None
+
+    values = cmd[m.end():].rstrip()
+    if values.endswith(b';'):
+        values = values[:-1].rstrip()
+    if b'--' in values or b'/*' in values or b'$' in values \
+            or b'\\' in values:
+        return None
+
+    # The VALUES list must only contain parenthesized groups
+    depth = 0
+    quote = None
+    for c in six.iterbytes(values):
+        if quote is not None:
+            if c == quote:
+                quote = None
+        elif c in _quote_chars:
+            quote = c
+        elif c == _open_par:
+            depth += 1
+        elif c == _close_par:
+            depth -= 1
+        elif depth == 0 and c not in _values_separators:
+            return None
+
+    if depth or quote is not None:
+        return None
+    return cmd[:m.end()], values
+
+
+_quote_chars = (ord(b"'"), ord(b'"'))
+_open_par = ord(b'(')
+_close_par = ord(b')')
+_values_separators = tuple(six.iterbytes(b', \t\r\n'))
 
+
+# Parsed commands, by command and connection encoding. The cache is emptied
+# when full, which is cheap and good enough for programs using a bounded set
+# of queries.
+_parse_cache = {}
+_PARSE_CACHE_SIZE = 512
+
+
+def _parse_cmd(cmd, conn):
+    """Split the command string on its placeholders
+
+    Return a tuple `(parts, keys, named)` where `parts` are the literal
+    fragments of the command, `keys` contains, for every placeholder between
+    two fragments, the parameter name or None for positional placeholders,
+    and `named` tells the argument format used (None if the command has no
+    placeholder).
+
+    The result is cached: the caller must not modify it.
+
+    """
+    key = (cmd, conn._py_enc if conn is not None else None)
+    try:
+        return _parse_cache[key]
+    except KeyError:
+        pass
+
+    rv = _parse_cmd_nocache(cmd, conn)
+    if len(_parse_cache) >= _PARSE_CACHE_SIZE:
+        _parse_cache.clear()
+    _parse_cache[key] = rv
+    return rv
+
+
+def _parse_cmd_nocache(cmd, conn):
     idx = 0
     next_start = 0
-    param_num = 0
-    n_arg_values = 0
-    arg_values = None
     named_args_format = None
     parts = []
+    keys = []
+    buf = []
 
     cmd_length = len(cmd)
     while idx < cmd_length:
 
         # Escape
         if cmd[idx:idx+2] == b'%%':
-            parts.append(cmd[next_start:idx])
-            parts.append(b'%')
+            buf.append(cmd[next_start:idx])
+            buf.append(b'%')
             idx += 1
             next_start = idx + 1
 
@@ -956,20 +2424,14 @@ def _combine_cmd_params(cmd, params, conn):
                 raise ProgrammingError(
                     "incomplete placeholder: '%(' without ')'")
 
-            key = cmd[idx + 2:end].decode(conn._py_enc)
-            if arg_values is None:
-                arg_values = {}
-            if key not in arg_values:
-                arg_values[key] = _getquoted(params[key], conn)
-            parts.append(cmd[next_start:idx])
-            if six.PY3 and isinstance(arg_values[key], six.text_type):
-                arg_values[key] = arg_values[key].encode(conn._py_enc)
-            parts.append(arg_values[key])
-            n_arg_values += 1
-            next_start = end + 2
-
             _check_format_char(cmd[end + 1], idx)
 
+            buf.append(cmd[next_start:idx])
+            parts.append(b''.join(buf))
+            buf = []
+            keys.append(cmd[idx + 2:end].decode(conn._py_enc))
+            next_start = end + 2
+
         # Indexed parameters
         elif cmd[idx:idx+1] == b'%':
 
@@ -981,27 +2443,273 @@ def _combine_cmd_params(cmd, params, conn):
 
             _check_format_char(cmd[idx + 1], idx)
 
-            value = _getquoted(params[param_num], conn)
-            if six.PY3 and isinstance(value, six.text_type):
-                value = value.encode(conn._py_enc)
-            n_arg_values += 1
-            parts.append(cmd[next_start:idx])
-            parts.append(value)
+            buf.append(cmd[next_start:idx])
+            parts.append(b''.join(buf))
+            buf = []
+            keys.append(None)
             next_start = idx + 2
 
-            param_num += 1
             idx += 1
 
         idx += 1
 
-    parts.append(cmd[next_start:cmd_length])
+    buf.append(cmd[next_start:cmd_length])
+    parts.append(b''.join(buf))
+
+    return tuple(parts), tuple(keys), named_args_format
+
+
+def _iter_cmd_params(cmd, params, conn, convert):
+    """Parse the command and yield its fragments and converted parameters
+
+    `convert(value)` is called once for each distinct parameter.
+
+    """
+    parts, keys, named = _parse_cmd(cmd, conn)
+
+    if named:
+        arg_values = {}
+        for i, key in enumerate(keys):
+            yield parts[i]
+            if key not in arg_values:
+                arg_values[key] = convert(params[key])
+            yield arg_values[key]
+
+    else:
+        for i in xrange(len(keys)):
+            yield parts[i]
+            yield convert(params[i])
 
-    if named_args_format is False:
-        if n_arg_values != len(params):
+        if named is False and len(keys) != len(params):
             raise TypeError(
                 "not all arguments converted during string formatting")
 
-    return b''.join(parts)
+    yield parts[-1]
+
+
+def _combine_cmd_params(cmd, params, conn):
+    """Combine the command string and params"""
+
+    if isinstance(cmd, six.text_type):
+        cmd = cmd.encode(conn._py_enc)
+
+    # Return when no argument binding is required.  Note that this method is
+    # not called from .execute() if `params` is None.
+    if b'%' not in cmd:
+        return cmd
+
+    def convert(param):
+        value = _getquoted(param, conn)
+        if six.PY3 and isinstance(value, six.text_type):
+            value = value.encode(conn._py_enc)
+        return value
+
+    return b''.join(_iter_cmd_params(cmd, params, conn, convert))
+
+
+def _combine_cmd_params_many(cmd, paramlist, conn):
+    """Combine the command string with every params in `paramlist`
+
+    Return the list of the combined commands. The strings that must be
+    escaped by libpq are escaped together in a single call.
+
+    """
+    if isinstance(cmd, six.text_type):
+        cmd = cmd.encode(conn._py_enc)
+
+    if b'%' not in cmd:
+        return [cmd] * len(paramlist)
+
+    deferred = []
+
+    def convert(param):
+        value = _getquoted_deferred(param, conn, deferred)
+        if value is None:
+            # Position of the literal, to be replaced once escaped
+            return len(deferred) - 1
+        if six.PY3 and isinstance(value, six.text_type):
+            value = value.encode(conn._py_enc)
+        return value
+
+    cmds = [list(_iter_cmd_params(cmd, params, conn, convert))
+        for params in paramlist]
+    if not deferred:
+        return [b''.join(parts) for parts in cmds]
+
+    literals = _escape_literals(deferred, conn)
+    return [b''.join([literals[p] if isinstance(p, int) else p
+            for p in parts])
+        for parts in cmds]
+
+
+class _ServerParams(object):
+    """Parameters to be passed to the server out of the query string"""
+
+    def __init__(self, params):
+        self.nparams = len(params)
+        self.oids = tuple(p[0] for p in params)
+        self.types = ffi.new('Oid[]', self.oids)
+        self.formats = ffi.new('int[]', [p[2] for p in params])
+        self.lengths = ffi.new('int[]', [
+            len(p[1]) if p[1] is not None else 0 for p in params])
+
+        # Keep the data alive as long as the pointers are in use
+        self._data = data = []
+        for p in params:
+            if p[1] is None:
+                data.append(ffi.NULL)
+            elif p[2]:
+                # binary data is passed with its length: no need to copy it
+                data.append(ffi.from_buffer(p[1]))
+            else:
+                data.append(ffi.new('char[]', p[1]))
+        self.values = ffi.new('char *[]', data)
+
+
+_no_server_params = _ServerParams([])
+
+
+_have_pipeline = PG_VERSION >= 0x0e0000
+
+
+class _PipelineReader(object):
+    """Read the results of the statements sent in pipeline mode"""
+
+    def __init__(self, pgconn):
+        self.pgconn = pgconn
+        self.queries = deque()  # the statements whose results are pending
+        self.rowcount = 0
+        self.last = ffi.NULL
+        self.last_query = None
+        self.error = ffi.NULL
+        self.error_query = None
+        self.error_index = None
+        self.index = 0          # the index of the statement being read
+
+    def read(self, block):
+        """Read the results available, or all of them up to the pipeline
+        sync if `block` is true.
+
+        Return False if the connection failed.
+
+        """
+        pgconn = self.pgconn
+        while True:
+            if not block:
+                if not self.queries:
+                    return True
+                if not libpq.PQconsumeInput(pgconn):
+                    return False
+                if libpq.PQisBusy(pgconn):
+                    return True
+
+            pgres = libpq.PQgetResult(pgconn)
+            if not pgres:
+                # End of the results of a statement
+                if not self.queries:
+                    return False
+                if self.queries.popleft() is not None:
+                    self.index += 1
+                continue
+
+            status = libpq.PQresultStatus(pgres)
+            if status == libpq.PGRES_PIPELINE_SYNC:
+                libpq.PQclear(pgres)
+                return True
+
+            elif status == libpq.PGRES_FATAL_ERROR and not self.error:
+                self.error = pgres
+                self.error_query = self.queries[0] if self.queries else None
+                if self.error_query is not None:
+                    self.error_index = self.index
+
+            elif self.queries and self.queries[0] is None:
+                # Result of the BEGIN sent before the statements
+                libpq.PQclear(pgres)
+
+            elif status in (libpq.PGRES_COMMAND_OK, libpq.PGRES_TUPLES_OK):
+                rowcount = ffi.string(libpq.PQcmdTuples(pgres))
+                if not rowcount:
+                    self.rowcount = -1
+                elif self.rowcount >= 0:
+                    self.rowcount += int(rowcount)
+
+                # Only keep the last command status: rows are discarded
+                if status == libpq.PGRES_COMMAND_OK:
+                    if self.last:
+                        libpq.PQclear(self.last)
+                    self.last = pgres
+                    self.last_query = self.queries[0]
+                else:
+                    libpq.PQclear(pgres)
+
+            else:
+                libpq.PQclear(pgres)
+
+    def close(self):
+        if self.last:
+            libpq.PQclear(self.last)
+            self.last = ffi.NULL
+        if self.error:
+            libpq.PQclear(self.error)
+            self.error = ffi.NULL
+
+
+def _is_stale_plan(pgres):
+    """Return True if the result is a "cached plan must not change result
+    type" error, raised if a prepared statement result changed after DDL.
+    """
+    if _error_code(pgres) != b'0A000':
+        return False
+    msg = libpq.PQresultErrorField(pgres, libpq.LIBPQ_DIAG_MESSAGE_PRIMARY)
+    return msg != ffi.NULL and \
+        ffi.string(msg) == b'cached plan must not change result type'
+
+
+def _is_missing_statement(pgres):
+    """Return True if the result is an "invalid SQL statement name" error,
+    raised if a prepared statement was deallocated behind our back.
+    """
+    return _error_code(pgres) == b'26000'
+
+
+def _error_code(pgres):
+    """Return the SQLSTATE of an error result, None if not an error"""
+    if libpq.PQresultStatus(pgres) != libpq.PGRES_FATAL_ERROR:
+        return None
+    code = libpq.PQresultErrorField(pgres, libpq.LIBPQ_DIAG_SQLSTATE)
+    return ffi.string(code) if code != ffi.NULL else None
+
+
+def _server_cmd_params(cmd, params, conn):
+    """Prepare the command and params for server-side binding
+
+    Return the command with the placeholders replaced by `$n` parameters and
+    a `_ServerParams` instance. Parameters that can't be passed out of the
+    query (e.g. without a dumper for their type) are merged into the command.
+
+    """
+    if isinstance(cmd, six.text_type):
+        cmd = cmd.encode(conn._py_enc)
+
+    if b'%' not in cmd:
+        return cmd, None
+
+    server_params = []
+
+    def convert(param):
+        dumped = _dump(param, conn)
+        if dumped is None:
+            value = _getquoted(param, conn)
+            if six.PY3 and isinstance(value, six.text_type):
+                value = value.encode(conn._py_enc)
+            return value
+
+        server_params.append(dumped)
+        return ascii_to_bytes('$%d' % len(server_params))
+
+    cmd = b''.join(_iter_cmd_params(cmd, params, conn, convert))
+    return cmd, _ServerParams(server_params) if server_params else None
 
 
 _s_ord = ord(b's')
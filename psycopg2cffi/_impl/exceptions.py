@@ -20,7 +20,9 @@ class Error(StandardError):
     pgerror = None
     pgcode = None
     cursor = None
+    params_index = None
     _pgres = None
+    _position_offset = 0
 
     @property
     def diag(self):
@@ -48,6 +50,7 @@ class Error(StandardError):
     def __setstate__(self, state):
         self.pgerror = state.get('pgerror')
         self.pgcode = state.get('pgcode')
+        self.params_index = state.get('params_index')
 
 
 class InterfaceError(Error):
@@ -126,7 +129,10 @@ class Diagnostics(object):
 
     @property
     def statement_position(self):
-        return self._get_field(libpq.LIBPQ_DIAG_STATEMENT_POSITION)
+        rv = self._get_field(libpq.LIBPQ_DIAG_STATEMENT_POSITION)
+        if rv is not None and self._exc._position_offset:
+            rv = str(int(rv) - self._exc._position_offset)
+        return rv
 
     @property
     def internal_position(self):
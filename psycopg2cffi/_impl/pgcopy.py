@@ -0,0 +1,500 @@
+from __future__ import unicode_literals
+
+import datetime
+import decimal
+import re
+import struct
+import uuid
+import six
+from six.moves import xrange
+
+from psycopg2cffi._impl import typecasts
+from psycopg2cffi._impl.adapters import _dump_copy
+from psycopg2cffi._impl.exceptions import DataError, ProgrammingError
+
+# Encoders and decoders of the data exchanged in COPY operations.
+#
+# The encoders convert sequences of Python objects into the records of a
+# COPY FROM STDIN, in text or binary format. The binary format (PGCOPY) is a
+# signature, a sequence of records made of the number of fields and of the
+# length and the value of each field in the binary wire format of their
+# type, and a trailer: see the COPY documentation for the details.
+
+_signature = b'PGCOPY\n\xff\r\n\x00'
+_binary_header = _signature + struct.pack('!ii', 0, 0)
+_binary_trailer = struct.pack('!h', -1)
+
+_pack_int2 = struct.Struct('!h').pack
+_pack_int4 = struct.Struct('!i').pack
+_pack_uint4 = struct.Struct('!I').pack
+_pack_int8 = struct.Struct('!q').pack
+_pack_float4 = struct.Struct('!f').pack
+_pack_float8 = struct.Struct('!d').pack
+_pack_numeric_head = struct.Struct('!hhHH').pack
+_pack_interval = struct.Struct('!qii').pack
+_pack_timetz = struct.Struct('!qi').pack
+_pack_array_head = struct.Struct('!iiI').pack
+_pack_array_dim = struct.Struct('!ii').pack
+_unpack_header = struct.Struct('!ii').unpack_from
+_unpack_int2_from = struct.Struct('!h').unpack_from
+_unpack_int4_from = struct.Struct('!i').unpack_from
+
+_null_length = _pack_int4(-1)
+
+_pg_epoch_date = datetime.date(2000, 1, 1)
+_pg_epoch_datetime = datetime.datetime(2000, 1, 1)
+
+
+class TextCopyEncoder(object):
+    """Encode sequences of Python objects as records in COPY text format"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def header(self):
+        return b''
+
+    def encode(self, row):
+        conn = self._conn
+        return b'\t'.join([_dump_copy(value, conn) for value in row]) + b'\n'
+
+    def trailer(self):
+        return b''
+
+
+class BinaryCopyEncoder(object):
+    """Encode sequences of Python objects as records in COPY binary format
+
+    `oids` are the types of the fields of the records: each value is packed
+    in the binary representation of its field type, so they must match the
+    types of the columns the records are copied to. `names`, if specified,
+    are the names of the fields, used in the error messages.
+
+    """
+
+    def __init__(self, oids, conn, names=None):
+        self._conn = conn
+        self._packers = [_get_packer(oid) for oid in oids]
+        self._names = names
+
+    def header(self):
+        return _binary_header
+
+    def encode(self, row):
+        packers = self._packers
+        if len(row) != len(packers):
+            raise ProgrammingError(
+                "expected %d values in the record, got %d"
+                % (len(packers), len(row)))
+
+        conn = self._conn
+        parts = [_pack_int2(len(packers))]
+        for i, (packer, value) in enumerate(zip(packers, row)):
+            if value is None:
+                parts.append(_null_length)
+            else:
+                try:
+                    data = packer(value, conn)
+                except _pack_errors as e:
+                    raise DataError("can't encode the value of %s: %s" % (
+                        'column "%s"' % self._names[i] if self._names
+                            else 'field %d' % (i + 1), e))
+                parts.append(_pack_int4(len(data)))
+                parts.append(data)
+        return b''.join(parts)
+
+    def trailer(self):
+        return _binary_trailer
+
+
+class TextCopyDecoder(object):
+    """Decode the records of a COPY TO STDOUT in text format
+
+    `oids` are the types of the fields of the records, used to choose the
+    typecasters of the values as for the results of a query executed by
+    `cursor`. The data can be fed in chunks of arbitrary size.
+
+    """
+
+    def __init__(self, oids, cursor):
+        self._converters = [_text_converter(cursor._get_cast(oid), cursor)
+            for oid in oids]
+        self._buffer = b''
+
+    def feed(self, data):
+        """Parse a chunk of COPY data and return the records completed"""
+        lines = (self._buffer + bytes(data)).split(b'\n')
+        self._buffer = lines.pop()
+
+        converters = self._converters
+        nfields = len(converters)
+        rows = []
+        for line in lines:
+            fields = line.split(b'\t')
+            if len(fields) != nfields:
+                raise DataError(
+                    "expected %d fields in the record, got %d"
+                    % (nfields, len(fields)))
+
+            if b'\\' not in line:
+                rows.append(tuple(
+                    [conv(value) for conv, value in zip(converters, fields)]))
+                continue
+
+            # Slow path for records with nulls or escaped characters
+            row = [None] * nfields
+            for i in xrange(nfields):
+                value = fields[i]
+                if b'\\' in value:
+                    if value == b'\\N':
+                        continue
+                    value = _copy_unescape_re.sub(_copy_unescape, value)
+                row[i] = converters[i](value)
+            rows.append(tuple(row))
+
+        return rows
+
+
+class BinaryCopyDecoder(object):
+    """Decode the records of a COPY TO STDOUT in binary format
+
+    `oids` are the types of the fields of the records, used to choose the
+    binary typecasters of the values, as for a cursor fetching results in
+    binary format. The data can be fed in chunks of arbitrary size; the
+    decoder can be used as the file of `cursor.copy_expert()`, collecting the
+    records as tuples in its `rows` attribute.
+
+    """
+
+    def __init__(self, oids, cursor):
+        self._casts = [cursor._get_binary_cast(oid) for oid in oids]
+        self._cursor = cursor
+        self._buffer = b''
+        self._header = False
+        self.rows = []
+        self.done = False
+
+    def write(self, data):
+        self.rows.extend(self.feed(data))
+
+    def feed(self, data):
+        """Parse a chunk of COPY data and return the records completed"""
+        buf = self._buffer + bytes(data) if self._buffer else bytes(data)
+        pos = 0
+        if not self._header:
+            pos = self._parse_header(buf)
+            if pos is None:
+                self._buffer = buf
+                return []
+
+        rows = []
+        casts = self._casts
+        cursor = self._cursor
+        typecast = typecasts.typecast
+        end = len(buf)
+        while not self.done and pos + 2 <= end:
+            nfields = _unpack_int2_from(buf, pos)[0]
+            if nfields == -1:
+                self.done = True
+                pos += 2
+                break
+            if nfields != len(casts):
+                raise DataError(
+                    "expected %d fields in the record, got %d"
+                    % (len(casts), nfields))
+
+            # Parse the record only if it was received entirely
+            row = [None] * nfields
+            fpos = pos + 2
+            for i in xrange(nfields):
+                if fpos + 4 > end:
+                    break
+                length = _unpack_int4_from(buf, fpos)[0]
+                fpos += 4
+                if length < 0:
+                    row[i] = typecast(casts[i], None, 0, cursor)
+                    continue
+                if fpos + length > end:
+                    break
+                row[i] = typecast(
+                    casts[i], buf[fpos:fpos + length], length, cursor)
+                fpos += length
+            else:
+                rows.append(tuple(row))
+                pos = fpos
+                continue
+            break
+
+        self._buffer = buf[pos:]
+        return rows
+
+    def _parse_header(self, buf):
+        """Parse the header of the data, return the position after it
+
+        Return None if the header was not received entirely.
+
+        """
+        size = len(_signature) + 8
+        if len(buf) < size:
+            return None
+        if buf[:len(_signature)] != _signature:
+            raise DataError("invalid COPY binary signature")
+        flags, ext = _unpack_header(buf, len(_signature))
+        if len(buf) < size + ext:
+            return None
+        self._header = True
+        return size + ext
+
+
+_copy_unescape_re = re.compile(b'\\\\(.)')
+_copy_unescapes = {
+    b'b': b'\b', b'f': b'\f', b'n': b'\n', b'r': b'\r', b't': b'\t',
+    b'v': b'\v'}
+
+
+def _copy_unescape(m):
+    c = m.group(1)
+    return _copy_unescapes.get(c, c)
+
+
+def _text_converter(cast, cursor):
+    """Return a function to convert a value with the typecaster `cast`"""
+    # Skip the typecaster machinery for the most common numeric types
+    if cast is typecasts.INTEGER or \
+            (six.PY3 and cast is typecasts.LONGINTEGER):
+        return int
+    elif cast is typecasts.FLOAT:
+        return float
+    elif six.PY3 and (cast is typecasts.STRING or cast is typecasts.UNICODE):
+        enc = cursor.connection._py_enc
+
+        def decode(value):
+            return value.decode(enc)
+
+        return decode
+
+    def convert(value):
+        return typecasts.typecast(cast, value, len(value), cursor)
+
+    return convert
+
+
+# Packers convert Python objects into the binary representation of the
+# PostgreSQL types, by type oid.
+
+def _pack_boolean(obj, conn):
+    return b'\x01' if obj else b'\x00'
+
+
+def _pack_oid(obj, conn):
+    return _pack_uint4(obj)
+
+
+def _pack_float4_obj(obj, conn):
+    return _pack_float4(float(obj))
+
+
+def _pack_float8_obj(obj, conn):
+    return _pack_float8(float(obj))
+
+
+def _pack_numeric(obj, conn):
+    """Pack a number as a numeric in base 10000 digits"""
+    if not isinstance(obj, decimal.Decimal):
+        obj = decimal.Decimal(repr(obj) if isinstance(obj, float) else obj)
+
+    sign, digits, exp = obj.as_tuple()
+    if exp in ('n', 'N'):
+        return _pack_numeric_head(0, 0, typecasts._NUMERIC_NAN, 0)
+    elif exp == 'F':
+        return _pack_numeric_head(0, 0,
+            typecasts._NUMERIC_NINF if sign else typecasts._NUMERIC_PINF, 0)
+
+    dscale = max(0, -exp)
+
+    # Pad the digits with zeros so that the exponent and the number of
+    # digits before it are multiple of 4
+    digits = list(digits) + [0] * (exp % 4)
+    exp -= exp % 4
+    digits = [0] * (-len(digits) % 4) + digits
+    weight = (len(digits) + exp) // 4 - 1
+
+    groups = [
+        digits[i] * 1000 + digits[i + 1] * 100 + digits[i + 2] * 10
+        + digits[i + 3] for i in xrange(0, len(digits), 4)]
+    while groups and groups[0] == 0:
+        del groups[0]
+        weight -= 1
+    while groups and groups[-1] == 0:
+        del groups[-1]
+    if not groups:
+        weight = 0
+
+    return _pack_numeric_head(
+        len(groups), weight, typecasts._NUMERIC_NEG if sign else 0, dscale) \
+        + struct.pack('!%dH' % len(groups), *groups)
+
+
+def _pack_date(obj, conn):
+    return _pack_int4((obj - _pg_epoch_date).days)
+
+
+def _micros(delta):
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def _pack_time(obj, conn):
+    return _pack_int8(
+        ((obj.hour * 60 + obj.minute) * 60 + obj.second) * 1000000
+        + obj.microsecond)
+
+
+def _pack_timetz_obj(obj, conn):
+    offset = obj.utcoffset()
+    return _pack_timetz(
+        ((obj.hour * 60 + obj.minute) * 60 + obj.second) * 1000000
+        + obj.microsecond,
+        -(offset.days * 86400 + offset.seconds) if offset else 0)
+
+
+def _pack_timestamp(obj, conn):
+    return _pack_int8(_micros(obj.replace(tzinfo=None) - _pg_epoch_datetime))
+
+
+def _pack_timestamptz(obj, conn):
+    # The server expects the timestamp in UTC. Naive values are rejected:
+    # the session TimeZone they are relative to in text format is unknown.
+    offset = obj.utcoffset()
+    if offset is None:
+        raise ValueError("timestamptz values must have a time zone")
+    return _pack_timestamp(obj - offset, conn)
+
+
+def _pack_interval_obj(obj, conn):
+    return _pack_interval(
+        (obj.seconds * 1000000) + obj.microseconds, obj.days, 0)
+
+
+def _pack_uuid(obj, conn):
+    if not isinstance(obj, uuid.UUID):
+        obj = uuid.UUID(obj)
+    return obj.bytes
+
+
+def _pack_bytea(obj, conn):
+    if isinstance(obj, memoryview):
+        return obj.tobytes()
+    if not isinstance(obj, (bytes, bytearray)):
+        raise TypeError(
+            "bytea values must be bytes, bytearray or memoryview, not %s"
+            % type(obj).__name__)
+    return bytes(obj)
+
+
+def _pack_text(obj, conn):
+    if isinstance(obj, six.text_type):
+        return obj.encode(conn._py_enc)
+    if not isinstance(obj, bytes):
+        raise TypeError(
+            "text values must be str or bytes, not %s" % type(obj).__name__)
+    return obj
+
+
+def _pack_int(pack):
+    def pack_int(obj, conn):
+        return pack(obj)
+    return pack_int
+
+
+def _pack_array(elem_oid):
+    """Return a packer for arrays of the type `elem_oid`"""
+    pack_item = _get_packer(elem_oid)
+
+    def pack_array(obj, conn):
+        if not obj:
+            return _pack_array_head(0, 0, elem_oid)
+
+        dims = []
+        sub = obj
+        while isinstance(sub, list):
+            dims.append(len(sub))
+            sub = sub[0] if sub else None
+
+        items = []
+        _flatten(obj, dims, 0, items)
+        parts = []
+        has_null = 0
+        for item in items:
+            if item is None:
+                parts.append(_null_length)
+                has_null = 1
+            else:
+                data = pack_item(item, conn)
+                parts.append(_pack_int4(len(data)))
+                parts.append(data)
+
+        return b''.join(
+            [_pack_array_head(len(dims), has_null, elem_oid)]
+            + [_pack_array_dim(dim, 1) for dim in dims]
+            + parts)
+
+    return pack_array
+
+
+# The errors raised by the packers on values of the wrong type or range
+_pack_errors = (DataError, TypeError, ValueError, AttributeError,
+    ArithmeticError, struct.error)
+
+
+def _flatten(obj, dims, level, items):
+    if not isinstance(obj, list) or len(obj) != dims[level]:
+        raise DataError(
+            "multidimensional arrays must have matching dimensions")
+    if level == len(dims) - 1:
+        items.extend(obj)
+    else:
+        for sub in obj:
+            _flatten(sub, dims, level + 1, items)
+
+
+packers = {
+    16: _pack_boolean,
+    21: _pack_int(_pack_int2),
+    23: _pack_int(_pack_int4),
+    20: _pack_int(_pack_int8),
+    26: _pack_oid,
+    700: _pack_float4_obj,
+    701: _pack_float8_obj,
+    1700: _pack_numeric,
+    1082: _pack_date,
+    1083: _pack_time,
+    1266: _pack_timetz_obj,
+    1114: _pack_timestamp,
+    1184: _pack_timestamptz,
+    1186: _pack_interval_obj,
+    2950: _pack_uuid,
+    17: _pack_bytea,
+}
+
+for _oid in (25, 1043, 1042, 19, 18, 114):
+    packers[_oid] = _pack_text
+
+# Array oids and their element oids
+array_oids = {
+    1000: 16, 1005: 21, 1007: 23, 1016: 20, 1028: 26, 1021: 700, 1022: 701,
+    1231: 1700, 1182: 1082, 1183: 1083, 1270: 1266, 1115: 1114, 1185: 1184,
+    1187: 1186, 2951: 2950, 1001: 17, 1009: 25, 1015: 1043, 1014: 1042,
+    1003: 19, 1002: 18, 199: 114,
+}
+
+
+def _get_packer(oid):
+    packer = packers.get(oid)
+    if packer is not None:
+        return packer
+    if oid in array_oids:
+        packer = packers[oid] = _pack_array(array_oids[oid])
+        return packer
+    raise ProgrammingError(
+        "can't encode values of the type with oid %s in COPY binary format"
+        % oid)
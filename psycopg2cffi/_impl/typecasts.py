@@ -3,12 +3,18 @@ from __future__ import unicode_literals
 import re
 import decimal
 import datetime
+import operator
+import struct
+import uuid
+from array import array
+from functools import reduce
 from time import localtime
 import six
+from six.moves import xrange
 
 from psycopg2cffi._impl.libpq import libpq, ffi
 from psycopg2cffi._impl.adapters import bytes_to_ascii, ascii_to_bytes
-from psycopg2cffi._impl.exceptions import DataError
+from psycopg2cffi._impl.exceptions import DataError, NotSupportedError
 
 # Typecasters accept bytes and return python objects.
 # This only applies to our internal typecasers - user-defined ones
@@ -62,8 +68,20 @@ def new_type(values, name, castobj, accept_unicode=True):
     return Type(name, values, py_caster=castobj, accept_unicode=accept_unicode)
 
 
-def new_array_type(values, name, baseobj):
-    caster = parse_array(baseobj)
+def new_array_type(values, name, baseobj, container=None):
+    """Create a typecaster for arrays of the type `baseobj`
+
+    If `container` is 'array' or 'numpy', the arrays of numbers (int2[],
+    int4[], int8[], float4[] and float8[], which `values` must all refer to)
+    are returned as `array.array` or NumPy arrays of the matching item type
+    rather than as lists: see `parse_numeric_array`. This is a psycopg2cffi
+    extension.
+
+    """
+    if container is None:
+        caster = parse_array(baseobj)
+    else:
+        caster = parse_numeric_array(values, container, parse_array(baseobj))
     return Type(name, values, caster=caster)
 
 
@@ -139,6 +157,38 @@ def parse_boolean(value, length, cursor):
     return value[:1] == b"t" if value is not None else None
 
 
+_ARRAY_VALUE = libpq.PQE_ARRAY_VALUE
+_ARRAY_NULL = libpq.PQE_ARRAY_NULL
+_ARRAY_OPEN = libpq.PQE_ARRAY_OPEN
+_ARRAY_CLOSE = libpq.PQE_ARRAY_CLOSE
+
+_array_errors = {
+    -1: "malformed array",
+    -2: "excessive array dimensions",
+    -3: "unbalanced braces in array",
+}
+
+
+def _tokenize_array(value):
+    """Split an array literal with PQEparsearray()
+
+    Return the number of tokens and the arrays of their kinds, of the
+    unescaped elements, and of their offsets and lengths.
+
+    """
+    # A first pass counts the tokens, a second one stores them
+    ntokens = libpq.PQEparsearray(
+        value, len(value), ffi.NULL, ffi.NULL, ffi.NULL, ffi.NULL)
+    if ntokens < 0:
+        raise DataError(_array_errors[ntokens])
+    kinds = ffi.new('int[]', ntokens)
+    dst = ffi.new('char[]', len(value))
+    offsets = ffi.new('size_t[]', ntokens)
+    lengths = ffi.new('size_t[]', ntokens)
+    libpq.PQEparsearray(value, len(value), kinds, dst, offsets, lengths)
+    return ntokens, kinds, dst, offsets, lengths
+
+
 class parse_array(object):
     """Parse an array of a items using an configurable caster for the items
 
@@ -158,65 +208,173 @@ class parse_array(object):
         if value is None:
             return None
 
-        s = value
-        if not (len(s) >= 2 and  s[:1] == b"{" and s[-1:] == b"}"):
-            raise DataError("malformed array")
-
-        i = 1
-        array = []
-        stack = [array]
-        value_length = len(s) - 1
-        while i < value_length:
-            si = s[i:i+1]
-            if si == b'{':
+        ntokens, kinds, dst, offsets, lengths = _tokenize_array(value)
+        items = self._parse_numbers(kinds, dst, offsets, ntokens)
+        kinds = list(kinds)
+        if items is None:
+            data = ffi.buffer(dst, len(value))[:]
+            offsets = list(offsets)
+            lengths = list(lengths)
+            caster = self._caster
+            items = [
+                caster.cast(data[offsets[i]:offsets[i] + lengths[i]],
+                    cursor, lengths[i])
+                if kind == _ARRAY_VALUE else
+                caster.cast(None, cursor, 0) if kind == _ARRAY_NULL else None
+                for i, kind in enumerate(kinds)]
+        elif _ARRAY_NULL in kinds:
+            items = [item if kind != _ARRAY_NULL else None
+                for item, kind in zip(items, kinds)]
+
+        # Single dimension: all the tokens but the braces
+        if kinds.count(_ARRAY_OPEN) == 1:
+            return items[1:-1]
+
+        stack = [[]]
+        for item, kind in zip(items, kinds):
+            if kind == _ARRAY_OPEN:
                 sub_array = []
-                array.append(sub_array)
+                stack[-1].append(sub_array)
                 stack.append(sub_array)
-                if len(stack) > 16:
-                    raise DataError("excessive array dimensions")
-
-                array = sub_array
-                i += 1
-            elif si == b'}':
+            elif kind == _ARRAY_CLOSE:
                 stack.pop()
-                if not stack:
-                    raise DataError("unbalanced braces in array")
-                array = stack[-1]
-                i += 1
-            elif si in b', ':
-                i += 1
             else:
-                # Number of quotes, this will always be 0 or 2 (int vs str)
-                quotes = 0
-
-                # Whether or not the next char should be escaped
-                escape_char = False
-
-                buf = []
-                while i < value_length:
-                    si = s[i:i+1]
-                    if not escape_char:
-                        if si == b'"':
-                            quotes += 1
-                        elif si == b'\\':
-                            escape_char = True
-                        elif quotes % 2 == 0 and (si == b'}' or si == b','):
-                            break
-                        else:
-                            buf.append(si)
-                    else:
-                        escape_char = False
-                        buf.append(si)
-
-                    i += 1
-
-                str_buf = b''.join(buf)
-                if len(str_buf) == 4 and str_buf.lower() == b'null':
-                    val = typecast(self._caster, None, 0, cursor)
-                else:
-                    val = typecast(self._caster, str_buf, len(str_buf), cursor)
-                array.append(val)
-        return stack[-1]
+                stack[-1].append(item)
+        return stack[0][0]
+
+    def _parse_numbers(self, kinds, dst, offsets, ntokens):
+        """Parse the elements of the built-in numeric types in C
+
+        Return the list of the numbers (with 0 in place of the other tokens)
+        or None if the elements are not numbers or can't be parsed in C.
+
+        """
+        caster = self._caster
+        if getattr(caster, 'py_caster', True) is not None:
+            return None
+        if caster.caster in (parse_integer, parse_longinteger):
+            vals = ffi.new('int64_t[]', ntokens)
+            if libpq.PQEparsearraynumbers(
+                    dst, kinds, offsets, ntokens, 0, vals, ffi.NULL) < 0:
+                return None
+        elif caster.caster is parse_float:
+            vals = ffi.new('double[]', ntokens)
+            if libpq.PQEparsearraynumbers(
+                    dst, kinds, offsets, ntokens, 1, ffi.NULL, vals) < 0:
+                return None
+        else:
+            return None
+        return list(vals)
+
+    __call__ = cast
+
+
+def _array_typecode(size, codes):
+    """Return the first of the array typecodes with items of the given size"""
+    for code in codes:
+        try:
+            if array(code).itemsize == size:
+                return code
+        except ValueError:  # 'q' is not available on Python 2
+            pass
+
+
+# Item type of the arrays returned by `parse_numeric_array`, by array oid:
+# C type (as array typecode), `array.array` typecode, NumPy dtype
+_numeric_arrays = {
+    1005: ('h', 'h', 'int16'),
+    1007: ('i', _array_typecode(4, 'il'), 'int32'),
+    1016: ('q', _array_typecode(8, 'ql'), 'int64'),
+    1021: ('f', 'f', 'float32'),
+    1022: ('d', 'd', 'float64'),
+}
+
+
+class parse_numeric_array(object):
+    """Parse an array of numbers into an `array.array` or a NumPy array
+
+    The numbers are parsed in C straight into the array memory. In 'numpy'
+    mode multidimensional arrays are returned with their shape and arrays
+    containing NULLs are returned as masked arrays. In 'array' mode
+    multidimensional arrays are returned as nested lists of arrays and
+    arrays containing NULLs are parsed by `fallback`.
+
+    """
+    def __init__(self, values, container, fallback):
+        if container not in ('array', 'numpy'):
+            raise ValueError("bad array container: %r" % (container,))
+        types = set(_numeric_arrays.get(oid) for oid in values)
+        if len(types) != 1 or None in types:
+            raise ValueError(
+                "the %r container requires arrays of a single numeric type"
+                % container)
+
+        self._ctype, self._typecode, self._dtype = types.pop()
+        self._numpy = container == 'numpy'
+        self._fallback = fallback
+
+    def cast(self, value, length, cursor):
+        if value is None:
+            return None
+
+        ntokens, kinds, dst, offsets, lengths = _tokenize_array(value)
+        dims = ffi.new('int[]', 16)
+        ndims = libpq.PQEarraydims(kinds, ntokens, dims)
+        if ndims < 0:
+            raise DataError("multidimensional arrays must have sub-arrays "
+                "with matching dimensions")
+        shape = [dims[i] for i in xrange(ndims)]
+        nitems = reduce(operator.mul, shape, 1)
+
+        if self._numpy:
+            import numpy
+            items = numpy.zeros(nitems, dtype=self._dtype)
+        else:
+            items = array(self._typecode, [0]) * nitems
+        nulls = ffi.new('char[]', nitems)
+        if nitems:
+            nnulls = libpq.PQEparsearrayitems(dst, kinds, offsets, ntokens,
+                self._ctype.encode('ascii'), ffi.from_buffer(items), nulls)
+            if nnulls < 0:
+                nnulls = self._parse_items(
+                    items, nulls, ntokens, kinds, dst, offsets, lengths)
+        else:
+            nnulls = 0
+
+        if self._numpy:
+            items = items.reshape(shape)
+            if nnulls:
+                mask = numpy.frombuffer(ffi.buffer(nulls, nitems),
+                    dtype='uint8').astype(bool).reshape(shape)
+                items = numpy.ma.MaskedArray(items, mask=mask)
+            return items
+
+        if nnulls:
+            return self._fallback.cast(value, length, cursor)
+        for size in shape[:0:-1]:
+            items = [items[i:i + size] for i in xrange(0, len(items), size)]
+        return items
+
+    def _parse_items(self, items, nulls, ntokens, kinds, dst, offsets,
+            lengths):
+        """Parse the array items in Python, e.g. if C can't parse a float in
+        the current locale. Return the number of NULLs."""
+        data = ffi.buffer(dst)[:]
+        conv = float if self._ctype in 'fd' else int
+        nnulls = 0
+        j = 0
+        for i in xrange(ntokens):
+            kind = kinds[i]
+            if kind == _ARRAY_VALUE:
+                items[j] = conv(data[offsets[i]:offsets[i] + lengths[i]])
+                nulls[j] = b'\x00'
+                j += 1
+            elif kind == _ARRAY_NULL:
+                items[j] = 0
+                nulls[j] = b'\x01'
+                nnulls += 1
+                j += 1
+        return nnulls
 
     __call__ = cast
 
@@ -441,3 +599,357 @@ TIMEARRAY = _default_type(
 UNICODE = Type('UNICODE', [19, 18, 25, 1042, 1043], parse_unicode)
 UNICODEARRAY = Type('UNICODEARRAY', [1002, 1003, 1009, 1014, 1015],
     parse_array(UNICODE))
+
+
+# Binary typecasters.
+#
+# These are used instead of the string typecasters above when a query is
+# executed asking for results in binary format (see `cursor.binary`). They
+# accept the raw bytes sent by the server in the PostgreSQL binary wire
+# format.
+
+_unpack_int2 = struct.Struct('!h').unpack
+_unpack_int4 = struct.Struct('!i').unpack
+_unpack_int4_from = struct.Struct('!i').unpack_from
+_unpack_uint4 = struct.Struct('!I').unpack
+_unpack_int8 = struct.Struct('!q').unpack
+_unpack_float4 = struct.Struct('!f').unpack
+_unpack_float8 = struct.Struct('!d').unpack
+_unpack_numeric_head = struct.Struct('!hhHH').unpack_from
+_unpack_interval = struct.Struct('!qii').unpack
+_unpack_timetz = struct.Struct('!qi').unpack
+_unpack_array_head = struct.Struct('!iiI').unpack_from
+_unpack_array_dim = struct.Struct('!ii').unpack_from
+
+_pg_epoch_date = datetime.date(2000, 1, 1)
+_pg_epoch_datetime = datetime.datetime(2000, 1, 1)
+
+_INT4_MAX = 2 ** 31 - 1
+_INT4_MIN = -2 ** 31
+_INT8_MAX = 2 ** 63 - 1
+_INT8_MIN = -2 ** 63
+
+_NUMERIC_NEG = 0x4000
+_NUMERIC_NAN = 0xC000
+_NUMERIC_PINF = 0xD000
+_NUMERIC_NINF = 0xF000
+
+
+def parse_binary_int2(value, length, cursor):
+    return _unpack_int2(value)[0] if value is not None else None
+
+
+def parse_binary_int4(value, length, cursor):
+    return _unpack_int4(value)[0] if value is not None else None
+
+
+def parse_binary_int8(value, length, cursor):
+    return _unpack_int8(value)[0] if value is not None else None
+
+
+def parse_binary_oid(value, length, cursor):
+    return _unpack_uint4(value)[0] if value is not None else None
+
+
+def parse_binary_float4(value, length, cursor):
+    return _unpack_float4(value)[0] if value is not None else None
+
+
+def parse_binary_float8(value, length, cursor):
+    return _unpack_float8(value)[0] if value is not None else None
+
+
+def parse_binary_boolean(value, length, cursor):
+    return value[:1] != b'\x00' if value is not None else None
+
+
+def parse_binary_bytea(value, length, cursor):
+    if value is None:
+        return None
+    return memoryview(value) if six.PY3 else buffer(value)
+
+
+def parse_binary_numeric(value, length, cursor):
+    """Typecast a numeric in binary format to a `decimal.Decimal`.
+
+    The value is a sequence of base 10000 digits preceded by a header
+    containing the number of digits, the weight of the first digit, the sign
+    and the display scale.
+
+    """
+    if value is None:
+        return None
+
+    ndigits, weight, sign, dscale = _unpack_numeric_head(value)
+    if sign == _NUMERIC_NAN:
+        return decimal.Decimal('NaN')
+    elif sign == _NUMERIC_PINF:
+        return decimal.Decimal('Infinity')
+    elif sign == _NUMERIC_NINF:
+        return decimal.Decimal('-Infinity')
+
+    digits = struct.unpack_from('!%dh' % ndigits, value, 8)
+    n = 0
+    for digit in digits:
+        n = n * 10000 + digit
+
+    # Align the exponent with the display scale, so that the value has the
+    # same number of decimal digits of the text representation.
+    exp = (weight - ndigits + 1) * 4
+    if -exp > dscale:
+        n //= 10 ** (-exp - dscale)
+    elif -exp < dscale:
+        n *= 10 ** (dscale + exp)
+
+    return decimal.Decimal((
+        1 if sign == _NUMERIC_NEG else 0,
+        tuple(int(d) for d in str(n)),
+        -dscale))
+
+
+def parse_binary_date(value, length, cursor):
+    if value is None:
+        return None
+
+    days = _unpack_int4(value)[0]
+    if days == _INT4_MAX:
+        return datetime.date.max
+    elif days == _INT4_MIN:
+        return datetime.date.min
+
+    try:
+        return _pg_epoch_date + datetime.timedelta(days)
+    except OverflowError:
+        raise ValueError('BC dates not supported')
+
+
+def _parse_binary_timestamp(value):
+    micros = _unpack_int8(value)[0]
+    if micros == _INT8_MAX:
+        return datetime.datetime.max
+    elif micros == _INT8_MIN:
+        return datetime.datetime.min
+
+    try:
+        return _pg_epoch_datetime + datetime.timedelta(microseconds=micros)
+    except OverflowError:
+        raise ValueError('BC dates not supported')
+
+
+def parse_binary_timestamp(value, length, cursor):
+    if value is None:
+        return None
+    return _parse_binary_timestamp(value)
+
+
+def parse_binary_timestamptz(value, length, cursor):
+    """Typecast a timestamptz in binary format.
+
+    The server sends the timestamp in UTC, so the value returned has a zero
+    offset from UTC (instead of the session time zone offset returned by the
+    text format). It is naive if the cursor has no `tzinfo_factory`.
+
+    """
+    if value is None:
+        return None
+    rv = _parse_binary_timestamp(value)
+    if cursor.tzinfo_factory is not None and \
+            rv is not datetime.datetime.max and \
+            rv is not datetime.datetime.min:
+        rv = rv.replace(tzinfo=cursor.tzinfo_factory(0))
+    return rv
+
+
+def parse_binary_time(value, length, cursor):
+    if value is None:
+        return None
+    secs, micros = divmod(_unpack_int8(value)[0], 1000000)
+    mins, secs = divmod(secs, 60)
+    hours, mins = divmod(mins, 60)
+    return datetime.time(hours, mins, secs, micros)
+
+
+def parse_binary_timetz(value, length, cursor):
+    """Typecast a timetz in binary format.
+
+    As for the text format, the time has a tzinfo from the cursor
+    `tzinfo_factory` if not None, with the offset rounded to the minute.
+
+    """
+    if value is None:
+        return None
+    micros, zone = _unpack_timetz(value)
+    tzinfo = None
+    if cursor.tzinfo_factory is not None:
+        # The zone is in seconds west of UTC
+        tz_min, tz_sec = divmod(abs(zone), 60)
+        if tz_sec >= 30:
+            tz_min += 1
+        tzinfo = cursor.tzinfo_factory(-tz_min if zone > 0 else tz_min)
+    secs, micros = divmod(micros, 1000000)
+    mins, secs = divmod(secs, 60)
+    hours, mins = divmod(mins, 60)
+    return datetime.time(hours, mins, secs, micros, tzinfo)
+
+
+def parse_binary_interval(value, length, cursor):
+    """Typecast an interval in binary format to a datetime.timedelta.
+
+    As for the text format, months are converted to 30 days and years to 365
+    days.
+
+    """
+    if value is None:
+        return None
+
+    micros, days, months = _unpack_interval(value)
+    sign = -1 if months < 0 else 1
+    years, months = divmod(abs(months), 12)
+    days += sign * (years * 365 + months * 30)
+    return datetime.timedelta(days, 0, micros)
+
+
+def parse_binary_uuid(value, length, cursor):
+    if value is None:
+        return None
+    return uuid.UUID(bytes=bytes(value))
+
+
+def parse_binary_unicode(value, length, cursor):
+    if value is None:
+        return None
+    return value.decode(cursor._conn._py_enc)
+
+
+if six.PY3:
+    parse_binary_string = parse_binary_unicode
+else:
+    def parse_binary_string(value, length, cursor):
+        return value
+
+
+# Types whose binary format is their text representation, after a header:
+# their values are converted by the text typecasters (see binary_text_type()).
+binary_text_headers = {
+    114: b'',       # json
+    142: b'',       # xml
+    705: b'',       # unknown
+    3802: b'\x01',  # jsonb, format version 1
+}
+
+
+def binary_text_type(oid, caster):
+    """Return a binary typecaster for the type `oid`, in binary_text_headers
+
+    The values are converted by the text typecaster `caster`, so that the
+    typecasters registered for the type are used as in text format.
+
+    """
+    header = binary_text_headers[oid]
+    size = len(header)
+
+    def parse_binary_text(value, length, cursor):
+        if value is None:
+            return typecast(caster, None, 0, cursor)
+        if value[:size] != header:
+            raise NotSupportedError(
+                "unsupported binary format for the type with oid %s" % oid)
+        return typecast(caster, value[size:], length - size, cursor)
+
+    return Type('BINARYTEXT', [oid], parse_binary_text)
+
+
+def binary_unsupported_type(oid):
+    """Return a binary typecaster for the type `oid` without one
+
+    Converting a value raises NotSupportedError: only NULLs can be fetched.
+
+    """
+    def parse_binary_unsupported(value, length, cursor):
+        if value is None:
+            return None
+        raise NotSupportedError(
+            "can't decode values of the type with oid %s in binary format: "
+            "use a text format cursor" % oid)
+
+    return Type('BINARYUNSUPPORTED', [oid], parse_binary_unsupported)
+
+
+def parse_binary_array(value, length, cursor):
+    """Typecast an array in binary format to a (possibly nested) list.
+
+    The items are typecast using the binary typecaster registered for the
+    element type specified in the array header.
+
+    """
+    if value is None:
+        return None
+
+    ndims, has_null, elem_oid = _unpack_array_head(value)
+    if ndims == 0:
+        return []
+
+    dims = []
+    pos = 12
+    for i in xrange(ndims):
+        dims.append(_unpack_array_dim(value, pos)[0])
+        pos += 8
+
+    caster = cursor._get_binary_cast(elem_oid)
+
+    items = []
+    for i in xrange(reduce(operator.mul, dims)):
+        item_length = _unpack_int4_from(value, pos)[0]
+        pos += 4
+        if item_length < 0:
+            items.append(typecast(caster, None, 0, cursor))
+        else:
+            items.append(typecast(
+                caster, value[pos:pos + item_length], item_length, cursor))
+            pos += item_length
+
+    # Reshape the flat list of items according to the array dimensions
+    for dim in reversed(dims[1:]):
+        items = [items[i:i + dim] for i in xrange(0, len(items), dim)]
+    return items
+
+
+def _default_binary_type(name, oids, caster):
+    """Shortcut to register internal binary types"""
+    type_obj = Type(name, oids, caster)
+    for oid in oids:
+        binary_types[oid] = type_obj
+    return type_obj
+
+
+BINARYINT2 = _default_binary_type('BINARYINT2', [21], parse_binary_int2)
+BINARYINT4 = _default_binary_type('BINARYINT4', [23], parse_binary_int4)
+BINARYINT8 = _default_binary_type('BINARYINT8', [20], parse_binary_int8)
+BINARYOID = _default_binary_type('BINARYOID', [26], parse_binary_oid)
+BINARYFLOAT4 = _default_binary_type(
+    'BINARYFLOAT4', [700], parse_binary_float4)
+BINARYFLOAT8 = _default_binary_type(
+    'BINARYFLOAT8', [701], parse_binary_float8)
+BINARYBOOLEAN = _default_binary_type(
+    'BINARYBOOLEAN', [16], parse_binary_boolean)
+BINARYNUMERIC = _default_binary_type(
+    'BINARYNUMERIC', [1700], parse_binary_numeric)
+BINARYDATE = _default_binary_type('BINARYDATE', [1082], parse_binary_date)
+BINARYTIME = _default_binary_type('BINARYTIME', [1083], parse_binary_time)
+BINARYTIMETZ = _default_binary_type(
+    'BINARYTIMETZ', [1266], parse_binary_timetz)
+BINARYTIMESTAMP = _default_binary_type(
+    'BINARYTIMESTAMP', [1114], parse_binary_timestamp)
+BINARYTIMESTAMPTZ = _default_binary_type(
+    'BINARYTIMESTAMPTZ', [1184], parse_binary_timestamptz)
+BINARYINTERVAL = _default_binary_type(
+    'BINARYINTERVAL', [1186], parse_binary_interval)
+BINARYUUID = _default_binary_type('BINARYUUID', [2950], parse_binary_uuid)
+BINARYBYTEA = _default_binary_type('BINARYBYTEA', [17], parse_binary_bytea)
+BINARYSTRING = _default_binary_type(
+    'BINARYSTRING', [19, 18, 25, 1042, 1043], parse_binary_string)
+
+BINARYARRAY = _default_binary_type('BINARYARRAY', [
+    1005, 1007, 1016, 1028, 1021, 1022, 1000, 1231, 1182, 1183, 1115, 1185,
+    1187, 2951, 1001, 1003, 1002, 1009, 1014, 1015, 1270, 199, 143, 3807],
+    parse_binary_array)
@@ -46,6 +46,27 @@ def pq_get_last_result(pgconn):
     return pgres
 
 
+def pq_get_results(pgconn):
+    """Return the list of all the results of the query sent
+
+    Stop at a COPY result: the following ones are only available after the
+    data transfer.
+
+    """
+    results = []
+    while True:
+        pgres = libpq.PQgetResult(pgconn)
+        if not pgres:
+            break
+
+        results.append(pgres)
+        if libpq.PQresultStatus(pgres) in (
+                libpq.PGRES_COPY_IN, libpq.PGRES_COPY_OUT):
+            break
+
+    return results
+
+
 def quote_string(conn, value):
     obj = QuotedString(value)
     obj.prepare(conn)
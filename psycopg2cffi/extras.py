@@ -31,6 +31,7 @@ import os as _os
 import sys as _sys
 import time as _time
 import re as _re
+from collections import namedtuple as _namedtuple
 import six
 
 try:
@@ -1040,7 +1041,7 @@ def execute_batch(cur, sql, argslist, page_size=100):
 
     """
     for page in _paginate(argslist, page_size=page_size):
-        sqls = [cur.mogrify(sql, args) for args in page]
+        sqls = cur._mogrify_many(sql, page)
         cur.execute(b";".join(sqls))
 
 
@@ -1116,8 +1117,8 @@ def execute_values(cur, sql, argslist, template=None, page_size=100, fetch=False
         if template is None:
             template = b'(' + b','.join([b'%s'] * len(page[0])) + b')'
         parts = pre[:]
-        for args in page:
-            parts.append(cur.mogrify(template, args))
+        for value in cur._mogrify_many(template, page):
+            parts.append(value)
             parts.append(b',')
         parts[-1:] = post
         cur.execute(b''.join(parts))
@@ -1127,12 +1128,193 @@ def execute_values(cur, sql, argslist, template=None, page_size=100, fetch=False
     return result
 
 
+CopyStats = _namedtuple('CopyStats',
+    ['rows', 'bytes', 'seconds', 'rows_per_second', 'workers'])
+CopyWorkerStats = _namedtuple('CopyWorkerStats',
+    ['rows', 'bytes', 'chunks', 'seconds'])
+
+
+def parallel_copy(pool, sql, source, workers=4, chunk_size=8 * 1024 * 1024):
+    r"""Load data with :sql:`COPY FROM STDIN` over several connections.
+
+    :param pool: the `~psycopg2cffi.pool.ThreadedConnectionPool` to take the
+        connections from. It must be able to provide *workers* connections.
+
+    :param sql: the :sql:`COPY ... FROM STDIN` statement to execute, in text
+        or CSV format. Example: ``"COPY mytable FROM STDIN (FORMAT csv)"``.
+
+    :param source: the data to load. It can be a file-like object, whose
+        content is split in chunks on line boundaries, or an iterable. The
+        items of the iterable can be lines (strings or bytes, terminated by a
+        newline), or sequences of values, converted as in
+        `cursor.copy_records()` (only with the text format).
+
+    :param workers: the number of connections loading the data concurrently.
+
+    :param chunk_size: the approximate size in bytes of the chunks of data
+        passed to the connections.
+
+    The data is read and split in the calling thread; every chunk is loaded
+    by the first connection available with `~cursor.copy_expert()`. Chunks
+    are split at newlines, so records must not contain newlines (e.g. in
+    quoted CSV fields), and must not depend on each other (no header line).
+
+    Every chunk is loaded and committed in its own transaction: holding
+    the data of a connection uncommitted until the end could block the
+    other ones, e.g. on conflicting unique keys. If a chunk fails to load no
+    other chunk is loaded and the first error is raised; the chunks already
+    committed are not rolled back.
+
+    Return a `CopyStats` with the total number of rows and bytes loaded, the
+    time taken, the loading rate and a `CopyWorkerStats` per connection, with
+    the number of rows, bytes and chunks loaded and the time spent copying.
+
+    """
+    import threading
+    from six.moves import queue
+    from psycopg2cffi._impl.pgcopy import TextCopyEncoder
+
+    start = _time.time()
+    conns = []
+    try:
+        for i in range(workers):
+            conns.append(pool.getconn())
+
+        conn = conns[0]
+        encoding = _ext.encodings[conn.encoding]
+        if hasattr(source, 'read'):
+            chunks = _copy_file_chunks(source, chunk_size, encoding)
+        else:
+            chunks = _copy_iter_chunks(
+                source, chunk_size, encoding, TextCopyEncoder(conn).encode)
+
+        todo = queue.Queue(maxsize=workers * 2)
+        failed = threading.Event()
+        errors = []
+        stats = [None] * workers
+        threads = []
+        for i, conn in enumerate(conns):
+            t = threading.Thread(target=_copy_worker,
+                args=(conn, sql, todo, failed, errors, stats, i))
+            t.daemon = True
+            t.start()
+            threads.append(t)
+
+        try:
+            for chunk in chunks:
+                if failed.is_set():
+                    break
+                todo.put(chunk)
+        except BaseException:
+            errors.insert(0, _sys.exc_info())
+            failed.set()
+        finally:
+            for t in threads:
+                todo.put(None)
+            for t in threads:
+                t.join()
+
+        if errors:
+            six.reraise(*errors[0])
+
+    finally:
+        for conn in conns:
+            pool.putconn(conn)
+
+    seconds = _time.time() - start
+    rows = sum(s.rows for s in stats)
+    return CopyStats(rows=rows, bytes=sum(s.bytes for s in stats),
+        seconds=seconds, rows_per_second=rows / seconds if seconds else 0.0,
+        workers=stats)
+
+
+def _copy_worker(conn, sql, todo, failed, errors, stats, i):
+    """Load the chunks of data in the queue *todo* until a None"""
+    curs = conn.cursor()
+    rows = nbytes = chunks = 0
+    seconds = 0.0
+    while True:
+        chunk = todo.get()
+        if chunk is None:
+            break
+        if failed.is_set():
+            continue
+
+        start = _time.time()
+        try:
+            curs.copy_expert(sql, [chunk])
+            conn.commit()
+        except BaseException:
+            errors.append(_sys.exc_info())
+            failed.set()
+            conn.rollback()
+            continue
+        seconds += _time.time() - start
+        rows += max(curs.rowcount, 0)
+        nbytes += len(chunk)
+        chunks += 1
+
+    curs.close()
+    stats[i] = CopyWorkerStats(
+        rows=rows, bytes=nbytes, chunks=chunks, seconds=seconds)
+
+
+def _copy_file_chunks(f, size, encoding):
+    """Read a file in chunks of about *size* ending at a newline"""
+    while True:
+        data = f.read(size)
+        if not data:
+            return
+        if data[-1:] not in ('\n', b'\n'):
+            data += f.readline()
+        if isinstance(data, six.text_type):
+            data = data.encode(encoding)
+        yield data
+
+
+def _copy_iter_chunks(items, size, encoding, encode):
+    """Join lines or records into chunks of about *size*"""
+    parts = []
+    nbytes = 0
+    for item in items:
+        if isinstance(item, six.text_type):
+            item = item.encode(encoding)
+        elif not isinstance(item, six.binary_type):
+            item = encode(item)
+        parts.append(item)
+        nbytes += len(item)
+        if nbytes >= size:
+            yield b''.join(parts)
+            parts = []
+            nbytes = 0
+
+    if parts:
+        yield b''.join(parts)
+
+
+_split_cache = {}
+_SPLIT_CACHE_SIZE = 128
+
+
 def _split_sql(sql):
     """Split *sql* on a single ``%s`` placeholder.
 
     Split on the %s, perform %% replacement and return pre, post lists of
-    snippets.
+    snippets. The lists are cached: the caller must not modify them.
     """
+    try:
+        return _split_cache[sql]
+    except KeyError:
+        pass
+
+    rv = _split_sql_nocache(sql)
+    if len(_split_cache) >= _SPLIT_CACHE_SIZE:
+        _split_cache.clear()
+    _split_cache[sql] = rv
+    return rv
+
+
+def _split_sql_nocache(sql):
     curr = pre = []
     post = []
     tokens = _re.split(br'(%.)', sql)
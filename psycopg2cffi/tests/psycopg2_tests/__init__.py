@@ -30,6 +30,7 @@ from psycopg2cffi.tests.psycopg2_tests.testutils import unittest
 
 from psycopg2cffi.tests.psycopg2_tests import (
         test_async,
+        test_binary,
         test_bugX000,
         test_bug_gc,
         test_bug_inf_fetch_loop,
@@ -43,8 +44,12 @@ from psycopg2cffi.tests.psycopg2_tests import (
         test_lobject,
         test_module,
         test_notify,
+        test_numpy,
+        test_prepared,
         test_psycopg2_dbapi20,
         test_quote,
+        test_server_binding,
+        test_streaming,
         test_transaction,
         test_types_basic,
         test_types_extras,
@@ -69,6 +74,7 @@ def test_suite():
 
     suite = unittest.TestSuite()
     suite.addTest(test_async.test_suite())
+    suite.addTest(test_binary.test_suite())
     suite.addTest(test_bugX000.test_suite())
     suite.addTest(test_bug_gc.test_suite())
     suite.addTest(test_cancel.test_suite())
@@ -81,8 +87,12 @@ def test_suite():
     suite.addTest(test_lobject.test_suite())
     suite.addTest(test_module.test_suite())
     suite.addTest(test_notify.test_suite())
+    suite.addTest(test_numpy.test_suite())
+    suite.addTest(test_prepared.test_suite())
     suite.addTest(test_psycopg2_dbapi20.test_suite())
     suite.addTest(test_quote.test_suite())
+    suite.addTest(test_server_binding.test_suite())
+    suite.addTest(test_streaming.test_suite())
     suite.addTest(test_transaction.test_suite())
     suite.addTest(test_types_basic.test_suite())
     suite.addTest(test_types_extras.test_suite())
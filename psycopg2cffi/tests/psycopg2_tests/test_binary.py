@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+#
+# test_binary.py - tests for results in binary format
+
+import uuid
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from psycopg2cffi.tests.psycopg2_tests.testutils import unittest, \
+        ConnectingTestCase
+
+import psycopg2cffi as psycopg2
+from psycopg2cffi import extensions
+
+
+class BinaryResultsTests(ConnectingTestCase):
+
+    def execute(self, query, *args):
+        cur = self.conn.cursor()
+        cur.binary = True
+        cur.execute(query, *args)
+        return cur.fetchone()
+
+    def assertSameAsText(self, query):
+        cur = self.conn.cursor()
+        cur.execute(query)
+        self.assertEqual(self.execute(query), cur.fetchone())
+
+    def test_default(self):
+        cur = self.conn.cursor()
+        self.assertFalse(cur.binary)
+        self.conn.binary = True
+        self.assertTrue(cur.binary)
+        cur.binary = False
+        self.assertFalse(cur.binary)
+        self.assertTrue(self.conn.cursor().binary)
+
+    def test_numbers(self):
+        self.assertEqual(
+            self.execute("select 1::int2, -2::int4, 3000000000::int8, 26::oid"),
+            (1, -2, 3000000000, 26))
+        self.assertEqual(
+            self.execute("select 1.5::float4, -2.25::float8"), (1.5, -2.25))
+
+    def test_boolean(self):
+        self.assertEqual(self.execute("select true, false"), (True, False))
+
+    def test_numeric(self):
+        cur = self.conn.cursor()
+        for value in ['0', '0.000', '1', '-1', '10000', '123.4500', '-0.001',
+                '12345678901234567890.12', '0.00001234', '1e30', 'nan']:
+            query = "select '%s'::numeric" % value
+            cur.execute(query)
+            self.assertEqual(
+                str(self.execute(query)[0]), str(cur.fetchone()[0]))
+        self.assertEqual(
+            str(self.execute("select 1.10::numeric(10,4)")[0]), '1.1000')
+
+    def test_null(self):
+        self.assertEqual(self.execute("select null::int, null::text"),
+            (None, None))
+
+    def test_strings(self):
+        self.assertEqual(
+            self.execute("select 'hello'::text, 'x'::varchar, 'y'::name"),
+            ('hello', 'x', 'y'))
+        cur = self.conn.cursor()
+        cur.binary = True
+        cur.execute("select %s::text", (u'\xe8\u20ac',))
+        self.assertEqual(cur.fetchone()[0], u'\xe8\u20ac')
+
+    def test_dates(self):
+        self.assertEqual(
+            self.execute("select '2020-01-02'::date, "
+                "'2020-01-02 03:04:05.123456'::timestamp, "
+                "'12:34:56.5'::time"),
+            (date(2020, 1, 2), datetime(2020, 1, 2, 3, 4, 5, 123456),
+                time(12, 34, 56, 500000)))
+        self.assertEqual(
+            self.execute("select 'infinity'::date, '-infinity'::timestamp"),
+            (date.max, datetime.min))
+
+    def test_timestamptz(self):
+        value = self.execute(
+            "select '2020-01-02 03:04:05+02'::timestamptz")[0]
+        self.assertEqual(value.utcoffset(), timedelta(0))
+        self.assertEqual(value.replace(tzinfo=None),
+            datetime(2020, 1, 2, 1, 4, 5))
+
+    def test_interval(self):
+        for value in ['1 year 2 mons 3 days 04:05:06.7', '-1 year -2 mons',
+                '-3 days 01:00:00', '00:00:00.000001']:
+            self.assertSameAsText("select '%s'::interval" % value)
+
+    def test_uuid(self):
+        value = 'a0eebc99-9c0b-4ef8-bb6d-6bb9bd380a11'
+        self.assertEqual(self.execute("select '%s'::uuid" % value)[0],
+            uuid.UUID(value))
+
+    def test_bytea(self):
+        value = self.execute("select '\\x00ff0a'::bytea")[0]
+        self.assertEqual(bytes(value), b'\x00\xff\n')
+
+    def test_arrays(self):
+        self.assertEqual(
+            self.execute("select array[1, null, 3], "
+                "array[[1, 2], [3, 4]]::int8[], '{}'::int[], "
+                "array['a', null], array[1.5]::numeric[]"),
+            ([1, None, 3], [[1, 2], [3, 4]], [], ['a', None],
+                [Decimal('1.5')]))
+
+    def test_timetz(self):
+        for value in ['12:34:56.5+02', '00:00:00-05:30', '23:59:59+00',
+                '01:02:03+04:05:40']:
+            self.assertSameAsText("select '%s'::timetz" % value)
+        self.assertSameAsText(
+            "select array['12:00+01', null]::timetz[]")
+
+    def test_json(self):
+        self.assertSameAsText(
+            """select '{"a": [1, null]}'::json, '{"a": 1}'::jsonb, """
+            """array['{"b": 2}']::json[], array['[true]']::jsonb[], """
+            """null::json, null::jsonb""")
+        self.assertEqual(self.execute("""select '{"a": 1}'::jsonb""")[0],
+            {'a': 1})
+
+    def test_registered_text_caster(self):
+        cur = self.conn.cursor()
+        cur.binary = True
+        t = extensions.new_type((3802,), "JSONBTEXT",
+            lambda value, cur: value and 'x' + value)
+        extensions.register_type(t, cur)
+        cur.execute("""select '{"a": 1}'::jsonb, 'foo'::unknown""")
+        self.assertEqual(cur.fetchone(), ('x{"a": 1}', 'foo'))
+
+    def test_unsupported_type(self):
+        cur = self.conn.cursor()
+        cur.binary = True
+        cur.execute("select null::point, '(1,2)'::point")
+        self.assertRaises(psycopg2.NotSupportedError, cur.fetchone)
+        cur.execute("select null::point")
+        self.assertEqual(cur.fetchone(), (None,))
+
+    def test_named_cursor(self):
+        cur = self.conn.cursor('binary')
+        cur.binary = True
+        cur.execute("select generate_series(1, 5), 1.5::numeric")
+        self.assertEqual(cur.fetchone(), (1, Decimal('1.5')))
+        self.assertEqual(cur.fetchmany(2),
+            [(2, Decimal('1.5')), (3, Decimal('1.5'))])
+        self.assertEqual(cur.fetchall(),
+            [(4, Decimal('1.5')), (5, Decimal('1.5'))])
+
+    def test_description(self):
+        cur = self.conn.cursor()
+        cur.binary = True
+        cur.execute("select 1::int4 as a, 'x'::text as b")
+        self.assertEqual([c.name for c in cur.description], ['a', 'b'])
+        self.assertEqual([c.type_code for c in cur.description], [23, 25])
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+if __name__ == "__main__":
+    unittest.main()
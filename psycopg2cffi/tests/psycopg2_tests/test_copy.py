@@ -22,6 +22,7 @@
 # FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
 # License for more details.
 
+import io
 import sys
 import string
 from six.moves import cStringIO as StringIO
@@ -31,8 +32,11 @@ from six.moves import xrange, zip as izip
 from psycopg2cffi.tests.psycopg2_tests.testutils import unittest, \
         decorate_all_tests, skip_if_no_iobase, skip_copy_if_green, \
         ConnectingTestCase
-from psycopg2cffi import extensions
+import psycopg2cffi as psycopg2
+from psycopg2cffi import extensions, extras
 from psycopg2cffi._impl import exceptions
+from psycopg2cffi.pool import ThreadedConnectionPool
+from psycopg2cffi.tests.psycopg2_tests.testconfig import dsn
 
 
 if sys.version_info[0] < 3:
@@ -298,10 +302,406 @@ class CopyTests(ConnectingTestCase):
         curs.execute("select count(*) from manycols;")
         self.assertEqual(curs.fetchone()[0], 2)
 
+    def test_copy_binary_files(self):
+        from psycopg2cffi._impl import cursor as _cursor
+        curs = self.conn.cursor()
+        curs.execute("insert into tcopy (data) "
+            "select repeat(chr(65 + x % 26), x * 10) "
+            "from generate_series(1, 1000) x")
+        curs.execute("insert into tcopy (data) values (repeat('z', %s))",
+            (_cursor._COPY_MAX_CHUNK + 10,))
+
+        out = io.BytesIO()
+        curs.copy_expert("copy tcopy to stdout", out)
+        self.assertEqual(curs.rowcount, 1001)
+        data = out.getvalue()
+        self.assertTrue(len(data) > _cursor._COPY_MAX_CHUNK * 2)
+
+        curs.execute("delete from tcopy")
+        reads = []
+
+        class Reader(io.BytesIO):
+            def readinto(self, b):
+                reads.append(len(b))
+                return io.BytesIO.readinto(self, b)
+
+        curs.copy_expert("copy tcopy from stdin", Reader(data), size=1000)
+        self.assertEqual(curs.rowcount, 1001)
+        self.assertEqual(reads[:3], [1000, 2000, 4000])
+        self.assertEqual(max(reads), _cursor._COPY_MAX_CHUNK)
+
+        out2 = io.BytesIO()
+        curs.copy_expert("copy tcopy to stdout", out2)
+        self.assertEqual(out2.getvalue(), data)
+
+    def test_copy_iter(self):
+        from psycopg2cffi._impl import cursor as _cursor
+        curs = self.conn.cursor()
+        it = curs.copy_iter(
+            "copy (select generate_series(1, 3), 'x') to stdout", lines=True)
+        self.assertEqual(list(it), [b'1\tx\n', b'2\tx\n', b'3\tx\n'])
+        self.assertEqual(curs.rowcount, 3)
+
+        it = curs.copy_iter(
+            "copy (select '\u20ac' from generate_series(1, 100000)) "
+            "to stdout", decode=True)
+        chunks = list(it)
+        self.assertTrue(len(chunks) > 1)
+        self.assertTrue(len(chunks[0].encode(self.conn._py_enc))
+            <= _cursor._COPY_MAX_CHUNK + 10)
+        self.assertEqual(''.join(chunks), '\u20ac\n' * 100000)
+
+    def test_copy_iter_close(self):
+        curs = self.conn.cursor()
+        it = curs.copy_iter(
+            "copy (select generate_series(1, 100000)) to stdout", lines=True)
+        self.assertEqual(next(it), b'1\n')
+        it.close()
+        self.assertEqual(curs.rowcount, 100000)
+        curs.execute("select 1")
+        self.assertEqual(curs.fetchone(), (1,))
+
+        it = curs.copy_iter(
+            "copy (select generate_series(1, 100000)) to stdout")
+        del it
+        curs.execute("select 1")
+        self.assertEqual(curs.fetchone(), (1,))
+
+    def test_copy_iter_errors(self):
+        curs = self.conn.cursor()
+        self.assertRaises(exceptions.ProgrammingError,
+            curs.copy_iter, "select 1")
+        curs.execute("select 1")
+        self.assertEqual(curs.fetchone(), (1,))
+        self.assertRaises(exceptions.ProgrammingError,
+            curs.copy_iter, "copy tcopy from stdin")
+        self.conn.rollback()
+
+        it = curs.copy_iter("copy (select 1 / (x - 3) "
+            "from generate_series(1, 5) x) to stdout", lines=True)
+        self.assertRaises(exceptions.OperationalError, list, it)
+        self.conn.rollback()
+        curs.execute("select 1")
+        self.assertEqual(curs.fetchone(), (1,))
+
+    def test_copy_from_iterable(self):
+        curs = self.conn.cursor()
+        curs.copy_expert("copy tcopy from stdin",
+            iter([b'1\ta\n', bytearray(b'2\tb\n'), u'3\t\u20ac\n']))
+        curs.copy_from(("%d\tz\n" % i for i in range(4, 6)), "tcopy")
+        curs.execute("select * from tcopy order by id")
+        self.assertEqual(curs.fetchall(),
+            [(1, 'a'), (2, 'b'), (3, '\u20ac'), (4, 'z'), (5, 'z')])
+
+    def test_copy_iter_to_iterable(self):
+        curs = self.conn.cursor()
+        curs.execute("insert into tcopy (data) "
+            "select 'x' || x from generate_series(1, 1000) x")
+        self.conn.commit()
+        conn2 = self.connect()
+        curs2 = conn2.cursor()
+        curs2.execute("create temp table tcopy2 (id int, data text)")
+        curs2.copy_expert("copy tcopy2 from stdin",
+            curs.copy_iter("copy tcopy to stdout"))
+        self.assertEqual(curs2.rowcount, 1000)
+        curs2.execute("select * from tcopy2 order by id")
+        curs.execute("select * from tcopy order by id")
+        self.assertEqual(curs2.fetchall(), curs.fetchall())
+        conn2.close()
+
+    def test_copy_rows(self):
+        from datetime import date
+        from decimal import Decimal
+        curs = self.conn.cursor()
+        query = ("select x, x::int8 * 10000000000, x / 4.0, x * 1.5::float8, "
+            "E'a\\\\b\\t\\n\\r' || x, '2020-01-01'::date + x, "
+            "null::text, array[x, null], '' "
+            "from generate_series(1, %s) x;")
+        curs.execute(query, (3,))
+        rows = curs.fetchall()
+        self.assertEqual(rows[0], (1, 10000000000, Decimal('0.25'), 1.5,
+            'a\\b\t\n\r1', date(2020, 1, 2), None, [1, None], ''))
+        for binary in (False, True):
+            self.assertEqual(
+                list(curs.copy_rows(query, (3,), binary=binary)), rows)
+
+    def test_copy_rows_typecasters(self):
+        curs = self.conn.cursor()
+        t = extensions.new_type((23,), "DOUBLEINT",
+            lambda s, cur: int(s) * 2 if s is not None else None)
+        extensions.register_type(t, curs)
+        self.assertEqual(list(curs.copy_rows(
+            "select x from generate_series(1, 3) x")), [(2,), (4,), (6,)])
+        self.assertEqual(list(curs.copy_rows(
+            "select x::int8 from generate_series(1, 3) x")),
+            [(1,), (2,), (3,)])
+
+    def test_copy_rows_stream(self):
+        curs = self.conn.cursor()
+        it = curs.copy_rows("select x from generate_series(1, 1000000) x")
+        self.assertEqual(next(it), (1,))
+        self.assertEqual(next(it), (2,))
+        it.close()
+        curs.execute("select 1")
+        self.assertEqual(curs.fetchone(), (1,))
+
+    def test_copy_rows_errors(self):
+        curs = self.conn.cursor()
+        self.assertRaises(exceptions.ProgrammingError,
+            curs.copy_rows, "select nosuchcol")
+        self.conn.rollback()
+        self.assertRaises(exceptions.ProgrammingError, curs.copy_rows, " ;")
+
+    def test_copy_records(self):
+        curs = self.conn.cursor()
+        data = [(i, "line %d\twith\\special\nchars\r\u20ac" % i)
+            for i in xrange(1000)]
+        curs.copy_records("tcopy", None, iter(data), size=1000)
+        curs.execute("select id, data from tcopy order by id")
+        self.assertEqual(curs.fetchall(), data)
+
+    def test_copy_records_types(self):
+        from datetime import date, timedelta
+        from decimal import Decimal
+        curs = self.conn.cursor()
+        curs.execute("""
+            CREATE TEMPORARY TABLE tcopy_types (
+                b bool, n numeric, f float8, d date, i interval,
+                ba bytea, a text[], ia int[], nul text)""")
+        row = (True, Decimal('1.50'), float('inf'), date(2020, 1, 2),
+            timedelta(1, 2), b'\x00\\\t\xff',
+            ['a"b', None, 'c\\d', ''], [[1, 2], [3, None]], None)
+        curs.copy_records("tcopy_types", None, [row])
+        curs.execute("select * from tcopy_types")
+        res = curs.fetchone()
+        self.assertEqual(res[:5], row[:5])
+        self.assertEqual(bytes(res[5]), row[5])
+        self.assertEqual(res[6:], row[6:])
+
+    def test_copy_records_cols(self):
+        curs = self.conn.cursor()
+        curs.copy_records("tcopy", ['data'], [('a',), ('b',)])
+        self.assertEqual(curs.rowcount, 2)
+        curs.execute("select data from tcopy order by id")
+        self.assertEqual(curs.fetchall(), [('a',), ('b',)])
+
+    def test_copy_records_error(self):
+        self.conn.commit()
+        self.conn.autocommit = True
+        curs = self.conn.cursor()
+        self.assertRaises(exceptions.ProgrammingError,
+            curs.copy_records, "tcopy", None, [(1, 'a'), (2, object())])
+
+        def rows():
+            yield (1, 'a')
+            raise ZeroDivisionError()
+
+        self.assertRaises(ZeroDivisionError,
+            curs.copy_records, "tcopy", None, rows())
+        curs.execute("select count(*) from tcopy")
+        self.assertEqual(curs.fetchone(), (0,))
+
+    def test_copy_records_binary(self):
+        from datetime import date, datetime, time, timedelta
+        from decimal import Decimal
+        from uuid import UUID
+        curs = self.conn.cursor()
+        curs.execute("""
+            CREATE TEMPORARY TABLE tcopy_binary (
+                b bool, s int2, i int4, l int8, f4 float4, f8 float8,
+                n numeric, d date, t time, ts timestamp, iv interval,
+                u uuid, ba bytea, tx text, ia int4[], ta text[])""")
+        row = (True, -3, 2 ** 31 - 1, -2 ** 63, 1.5, 1e300,
+            Decimal('-123456789.000012345'), date(1999, 12, 31),
+            time(23, 59, 59, 999999), datetime(2020, 2, 29, 12, 0, 0, 5),
+            timedelta(-3, 5, 7), UUID('12345678123456781234567812345678'),
+            b'\x00\xff', u'\u20ac\t\\', [[1, None], [3, 4]],
+            ['a', None, ''])
+        curs.copy_records("tcopy_binary", None, [row, (None,) * 16],
+            binary=True)
+        self.assertEqual(curs.rowcount, 2)
+        curs.execute("select * from tcopy_binary")
+        rows = curs.fetchall()
+        self.assertEqual(rows[0][:11], row[:11])
+        self.assertEqual(rows[0][11], str(row[11]))
+        self.assertEqual(bytes(rows[0][12]), row[12])
+        self.assertEqual(rows[0][13:], row[13:])
+        self.assertEqual(rows[1], (None,) * 16)
+
+    def test_copy_records_binary_numeric(self):
+        from decimal import Decimal
+        curs = self.conn.cursor()
+        curs.execute("CREATE TEMPORARY TABLE tcopy_num (n numeric)")
+        nums = ['0', '1.50', '1E+5', 'NaN', '0.0001', '99999999', '1E-20',
+            '-12345.6789']
+        curs.copy_records("tcopy_num", None,
+            [(Decimal(n),) for n in nums] + [(10 ** 30,), (1.25,)],
+            binary=True)
+        curs.execute("select n::text from tcopy_num")
+        self.assertEqual([r[0] for r in curs.fetchall()], ['0', '1.50',
+            '100000', 'NaN', '0.0001', '99999999', '0.00000000000000000001',
+            '-12345.6789', '1' + '0' * 30, '1.25'])
+
+    def test_copy_records_binary_cols(self):
+        curs = self.conn.cursor()
+        curs.copy_records("tcopy", ['data'], [('a',), ('b',)], binary=True)
+        curs.execute("select data from tcopy order by id")
+        self.assertEqual(curs.fetchall(), [('a',), ('b',)])
+        self.assertRaises(exceptions.ProgrammingError,
+            curs.copy_records, "tcopy", ['data'], [('a', 'b')], binary=True)
+
+    def test_copy_records_binary_state(self):
+        # The columns types are obtained without executing a query
+        states = []
+        for binary in (False, True):
+            curs = self.conn.cursor()
+            curs.execute("select 1 as x")
+            curs.copy_records("tcopy", None, [(int(binary), 'a')],
+                binary=binary)
+            states.append((curs.query, curs.description, curs.rowcount))
+        self.assertEqual(states[0], states[1])
+        self.assertEqual(states[1][0], b"select 1 as x")
+
+    def test_copy_records_binary_errors(self):
+        from datetime import datetime
+        from psycopg2cffi.tz import FixedOffsetTimezone
+        curs = self.conn.cursor()
+        curs.execute("""
+            CREATE TEMPORARY TABLE tcopy_err (
+                id int, b bytea, t text, ts timestamptz)""")
+        self.conn.commit()
+        for row, column in [
+                ((1, 5, None, None), 'b'),
+                ((1, u'x', None, None), 'b'),
+                ((1, None, 5, None), 't'),
+                ((u'1', None, None, None), 'id'),
+                ((2 ** 40, None, None, None), 'id'),
+                ((1, None, None, datetime(2020, 1, 1)), 'ts')]:
+            try:
+                curs.copy_records("tcopy_err", None, [row], binary=True)
+            except exceptions.DataError as e:
+                self.assertTrue('"%s"' % column in str(e), str(e))
+            else:
+                self.fail("no error raised for %r" % (row,))
+            self.conn.rollback()
+            curs.execute("select count(*) from tcopy_err")
+            self.assertEqual(curs.fetchone(), (0,))
+
+        ts = datetime(2020, 1, 1, 12, tzinfo=FixedOffsetTimezone(60))
+        curs.copy_records("tcopy_err", None,
+            [(1, bytearray(b'ab'), b'cd', ts),
+                (2, memoryview(b'ef'), u'gh', None)], binary=True)
+        curs.execute("select b, t, ts from tcopy_err order by id")
+        rows = curs.fetchall()
+        self.assertEqual([(bytes(r[0]), r[1]) for r in rows],
+            [(b'ab', 'cd'), (b'ef', 'gh')])
+        self.assertEqual(rows[0][2], ts)
+
+    def test_binary_decoder(self):
+        curs = self.conn.cursor()
+        curs.execute("insert into tcopy (data) "
+            "select case when x % 3 = 0 then null else 'x' || x end "
+            "from generate_series(1, 100) x")
+        curs.execute("select * from tcopy limit 0")
+        oids = [col.type_code for col in curs.description]
+        decoder = extensions.BinaryCopyDecoder(oids, curs)
+        curs.copy_expert(
+            "copy tcopy to stdout (format binary)", decoder)
+        self.assertTrue(decoder.done)
+        curs.execute("select * from tcopy")
+        rows = curs.fetchall()
+        self.assertEqual(decoder.rows, rows)
+
+        data = io.BytesIO()
+        curs.copy_expert("copy tcopy to stdout (format binary)", data)
+        data = data.getvalue()
+        decoder = extensions.BinaryCopyDecoder(oids, curs)
+        parsed = []
+        for i in xrange(0, len(data), 7):
+            parsed.extend(decoder.feed(data[i:i + 7]))
+        self.assertEqual(parsed, rows)
+        self.assertTrue(decoder.done)
+
 
 decorate_all_tests(CopyTests, skip_copy_if_green)
 
 
+class ParallelCopyTests(ConnectingTestCase):
+
+    def setUp(self):
+        ConnectingTestCase.setUp(self)
+        curs = self.conn.cursor()
+        curs.execute("drop table if exists tpcopy")
+        curs.execute("create table tpcopy (id int primary key, data text)")
+        self.conn.commit()
+        self.pool = ThreadedConnectionPool(1, 3, dsn)
+
+    def tearDown(self):
+        self.pool.closeall()
+        self.conn.rollback()
+        self.conn.cursor().execute("drop table if exists tpcopy")
+        self.conn.commit()
+        ConnectingTestCase.tearDown(self)
+
+    def check_data(self, n):
+        curs = self.conn.cursor()
+        curs.execute("select count(*), count(distinct id), "
+            "bool_and(data = 'x' || id) from tpcopy")
+        self.assertEqual(curs.fetchone(), (n, n, n and True or None))
+
+    def test_file(self):
+        f = io.BytesIO(b''.join(
+            b'%d,x%d\n' % (i, i) for i in xrange(10000)))
+        stats = extras.parallel_copy(self.pool,
+            "copy tpcopy from stdin (format csv)", f, workers=3,
+            chunk_size=1000)
+        self.check_data(10000)
+        self.assertEqual(stats.rows, 10000)
+        self.assertEqual(stats.bytes, len(f.getvalue()))
+        self.assertEqual(len(stats.workers), 3)
+        self.assertEqual(sum(w.rows for w in stats.workers), 10000)
+        self.assertTrue(sum(w.chunks for w in stats.workers) > 10)
+
+    def test_text_file(self):
+        f = io.StringIO(''.join('%d\tx%d\n' % (i, i) for i in xrange(100)))
+        stats = extras.parallel_copy(self.pool, "copy tpcopy from stdin", f,
+            workers=2, chunk_size=100)
+        self.check_data(100)
+        self.assertEqual(stats.rows, 100)
+
+    def test_iterables(self):
+        extras.parallel_copy(self.pool, "copy tpcopy from stdin",
+            ('%d\tx%d\n' % (i, i) for i in xrange(50)), workers=3,
+            chunk_size=100)
+        extras.parallel_copy(self.pool, "copy tpcopy from stdin",
+            ((i, 'x%d' % i) for i in xrange(50, 100)), workers=3,
+            chunk_size=100)
+        self.check_data(100)
+
+    def test_error(self):
+        rows = [(i, 'x%d' % i) for i in xrange(1000)] + [(0, 'x0')]
+        self.assertRaises(psycopg2.OperationalError, extras.parallel_copy,
+            self.pool, "copy tpcopy from stdin", rows, workers=3,
+            chunk_size=1000)
+
+        def rows():
+            for i in xrange(1000, 2000):
+                yield (i, 'x%d' % i)
+            raise ZeroDivisionError
+
+        self.assertRaises(ZeroDivisionError, extras.parallel_copy,
+            self.pool, "copy tpcopy from stdin", rows(), workers=3,
+            chunk_size=1000)
+
+        # the connections are back in the pool, and usable
+        curs = self.conn.cursor()
+        curs.execute("truncate tpcopy")
+        self.conn.commit()
+        extras.parallel_copy(self.pool, "copy tpcopy from stdin",
+            [(1, 'x1')], workers=3)
+        self.check_data(1)
+
+
 def test_suite():
     return unittest.TestLoader().loadTestsFromName(__name__)
 
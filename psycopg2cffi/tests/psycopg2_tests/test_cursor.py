@@ -23,6 +23,8 @@
 # License for more details.
 
 import time
+from array import array
+from decimal import Decimal
 import sys
 import six
 
@@ -32,7 +34,7 @@ from psycopg2cffi.extensions import b
 from psycopg2cffi.tests.psycopg2_tests.testutils import unittest, \
         skip_before_postgres, skip_if_no_namedtuple, _u, \
         skip_if_no_getrefcount, ConnectingTestCase
-from psycopg2cffi._impl.cursor import _combine_cmd_params
+from psycopg2cffi._impl.cursor import _combine_cmd_params, _parse_cmd
 
 
 class CursorTests(ConnectingTestCase):
@@ -59,6 +61,123 @@ class CursorTests(ConnectingTestCase):
             cur.executemany, "insert into test_exc values (%s)", buggygen())
         cur.close()
 
+    def test_executemany_rowcount(self):
+        cur = self.conn.cursor()
+        cur.execute("create temp table test_many (id int, data text)")
+        cur.executemany("insert into test_many values (%s, %s);",
+            [(i, str(i)) for i in range(100)])
+        self.assertEqual(cur.rowcount, 100)
+        self.assertEqual(cur.statusmessage, 'INSERT 0 1')
+        self.assertEqual(cur.query, b"insert into test_many values (99, '99');")
+        cur.executemany("update test_many set data = 'x' where id < %s",
+            [(10,), (20,)])
+        self.assertEqual(cur.rowcount, 30)
+        cur.executemany("delete from test_many where id = %s", [])
+        self.assertEqual(cur.rowcount, 0)
+        cur.execute("select count(*) from test_many")
+        self.assertEqual(cur.fetchone(), (100,))
+
+    def test_executemany_error(self):
+        cur = self.conn.cursor()
+        cur.execute("create temp table test_many (id int primary key)")
+        self.conn.commit()
+        try:
+            cur.executemany("insert into test_many values (%s)",
+                [(1,), (2,), (1,), (3,)])
+        except psycopg2.IntegrityError as e:
+            self.assertEqual(e.params_index, 2)
+        else:
+            self.fail("no error raised")
+        self.assertEqual(cur.query, b"insert into test_many values (1)")
+        self.conn.rollback()
+
+        # An error from the statements already sent comes first
+        def params():
+            yield (1,)
+            yield (1,)
+            raise ZeroDivisionError
+        self.assertRaises(psycopg2.IntegrityError, cur.executemany,
+            "insert into test_many values (%s)", params())
+        self.conn.rollback()
+
+        cur.execute("select count(*) from test_many")
+        self.assertEqual(cur.fetchone(), (0,))
+
+    def test_executemany_multiple_statements(self):
+        cur = self.conn.cursor()
+        cur.execute("create temp table test_many (id int)")
+        cur.executemany("insert into test_many values (%s); "
+            "insert into test_many values (%s * 10)", [(1, 1), (2, 2)])
+        cur.execute("select id from test_many order by id")
+        self.assertEqual(cur.fetchall(), [(1,), (2,), (10,), (20,)])
+
+    def test_executemany_autocommit(self):
+        self.conn.autocommit = True
+        cur = self.conn.cursor()
+        cur.execute("create temp table test_many (id int primary key)")
+        try:
+            cur.executemany("insert into test_many values (%s)",
+                [(1,), (1,), (2,)])
+        except psycopg2.IntegrityError as e:
+            self.assertEqual(e.params_index, 1)
+        else:
+            self.fail("no error raised")
+        cur.execute("select id from test_many")
+        self.assertEqual(cur.fetchall(), [(1,)])
+
+    def test_executemany_empty(self):
+        # No transaction is started if there is nothing to execute
+        from psycopg2cffi.extensions import STATUS_READY, \
+            TRANSACTION_STATUS_IDLE
+        cur = self.conn.cursor()
+        cur.executemany("select %s", [])
+        cur.executemany("select %s", iter([]))
+        self.assertEqual(cur.rowcount, 0)
+        self.assertEqual(self.conn.status, STATUS_READY)
+        self.assertEqual(self.conn.get_transaction_status(),
+            TRANSACTION_STATUS_IDLE)
+
+    def test_rewrite_inserts_default(self):
+        self.assertFalse(self.conn.rewrite_inserts)
+        self.assertFalse(self.conn.cursor().rewrite_inserts)
+        self.conn.rewrite_inserts = True
+        self.assertTrue(self.conn.cursor().rewrite_inserts)
+
+    def test_rewrite_inserts(self):
+        from psycopg2cffi._impl import cursor as _cursor
+        cur = self.conn.cursor()
+        cur.rewrite_inserts = True
+        cur.execute("create temp table test_many (id int, data text)")
+        rows = [(i, "x%%'%d" % i) for i in range(10)]
+        orig = _cursor._INSERT_PAGE_ROWS
+        _cursor._INSERT_PAGE_ROWS = 4
+        try:
+            cur.executemany(
+                "insert into test_many (id, data) values (%(id)s, %(data)s)",
+                [{'id': i, 'data': d} for i, d in rows])
+        finally:
+            _cursor._INSERT_PAGE_ROWS = orig
+        self.assertEqual(cur.rowcount, 10)
+        self.assertEqual(cur.query, b"insert into test_many (id, data) "
+            b"values (8, 'x%''8'),(9, 'x%''9')")
+        cur.execute("select id, data from test_many order by id")
+        self.assertEqual(cur.fetchall(), rows)
+
+        cur.executemany("insert into test_many values (%s, 'y')", [])
+        self.assertEqual(cur.rowcount, 0)
+
+    def test_rewrite_inserts_not_values(self):
+        cur = self.conn.cursor()
+        cur.rewrite_inserts = True
+        cur.execute("create temp table test_many (id int primary key)")
+        cur.executemany("insert into test_many values (%s) "
+            "on conflict do nothing", [(1,), (1,), (2,)])
+        self.assertEqual(cur.rowcount, 2)
+        cur.executemany("insert into test_many select %s", [(3,), (4,)])
+        self.assertEqual(cur.rowcount, 2)
+        cur.execute("select count(*) from test_many")
+        self.assertEqual(cur.fetchone(), (4,))
+
     def test_mogrify_unicode(self):
         conn = self.conn
         cur = conn.cursor()
@@ -99,6 +218,22 @@ class CursorTests(ConnectingTestCase):
                 _combine_cmd_params(b"SELECT '%%%%', %s", ('%d',), None),
                 b"SELECT '%%', '%d'")
 
+    def test_parse_cache(self):
+        cur = self.conn.cursor()
+        query = b"select %(a)s, %(b)s, '%%' -- test_parse_cache"
+        self.assertEqual(cur.mogrify(query, {'a': 1, 'b': 'x'}),
+            b"select 1, 'x', '%' -- test_parse_cache")
+        parsed = _parse_cmd(query, self.conn)
+        self.assertTrue(_parse_cmd(query, self.conn) is parsed)
+        self.assertEqual(cur.mogrify(query, {'a': 2, 'b': None}),
+            b"select 2, NULL, '%' -- test_parse_cache")
+
+        # errors are raised every time
+        for i in range(2):
+            self.assertRaises(ValueError,
+                cur.mogrify, "select %s, %(a)s", {'a': 1})
+            self.assertRaises(KeyError, cur.mogrify, query, {'a': 1})
+
     def test_mogrify_decimal_explodes(self):
         # issue #7: explodes on windows with python 2.5 and psycopg 2.2.2
         try:
@@ -329,6 +464,99 @@ class CursorTests(ConnectingTestCase):
         for i, rec in enumerate(curs):
             self.assertEqual(i + 1, curs.rownumber)
 
+    def test_named_cursor_read_ahead(self):
+        curs = self.conn.cursor('tmp')
+        curs.itersize = 3
+        curs.execute("select x, clock_timestamp() "
+            "from generate_series(1, 4) x")
+        rows = [curs.fetchone()]
+        time.sleep(0.2)
+        rows.append(curs.fetchone())
+        self.assert_((rows[1][1] - rows[0][1]).microseconds * 1e-6 < 0.1,
+            "named cursor records fetched in 2 roundtrips")
+        self.assertEqual(curs.rownumber, 2)
+        rows.extend(curs.fetchmany(2))
+        self.assertEqual([r[0] for r in rows], [1, 2, 3, 4])
+        self.assertEqual(curs.fetchone(), None)
+
+    def test_named_cursor_fetch_buffered(self):
+        curs = self.conn.cursor('tmp')
+        curs.itersize = 4
+        curs.execute('select generate_series(1, 10)')
+        self.assertEqual(curs.fetchone(), (1,))
+        self.assertEqual(curs.fetchmany(2), [(2,), (3,)])
+        self.assertEqual(curs.fetchmany(3), [(4,), (5,), (6,)])
+        self.assertEqual(curs.fetchone(), (7,))
+        self.assertEqual(curs.fetchall(), [(8,), (9,), (10,)])
+        self.assertEqual(curs.fetchmany(2), [])
+        self.assertEqual(curs.fetchone(), None)
+
+    def test_named_cursor_scroll_buffered(self):
+        curs = self.conn.cursor('tmp', scrollable=True)
+        curs.itersize = 5
+        curs.execute('select generate_series(1, 20)')
+        self.assertEqual(curs.fetchone(), (1,))
+        curs.scroll(2)
+        self.assertEqual(curs.fetchone(), (4,))
+        curs.scroll(7)
+        self.assertEqual(curs.fetchone(), (12,))
+        curs.scroll(-3)
+        self.assertEqual(curs.fetchone(), (10,))
+        curs.scroll(0, mode='absolute')
+        self.assertEqual(curs.fetchone(), (1,))
+
+        # the last read-ahead reached the end of the result
+        curs.itersize = 50
+        self.assertEqual(curs.fetchmany(2), [(2,), (3,)])
+        curs.scroll(-2)
+        self.assertEqual(curs.fetchone(), (2,))
+        self.assertEqual(len(curs.fetchall()), 18)
+        curs.scroll(-2)
+        self.assertEqual(curs.fetchone(), (20,))
+
+    def test_nextset_default(self):
+        curs = self.conn.cursor()
+        self.assertRaises(psycopg2.ProgrammingError, curs.nextset)
+        self.assertFalse(curs.multiple_results)
+        curs.execute("select 1; select 2")
+        self.assertEqual(curs.fetchall(), [(2,)])
+        self.assertEqual(curs.nextset(), None)
+
+    def test_nextset(self):
+        curs = self.conn.cursor()
+        curs.multiple_results = True
+        curs.execute("""select 1 as a, 2 as b;
+            create temp table test_nextset (id int);
+            insert into test_nextset select generate_series(1, 3);
+            select id from test_nextset order by id""")
+        self.assertEqual([d.name for d in curs.description], ['a', 'b'])
+        self.assertEqual(curs.rowcount, 1)
+        self.assertEqual(curs.fetchone(), (1, 2))
+        self.assert_(curs.nextset())
+        self.assertEqual(curs.description, None)
+        self.assertEqual(curs.statusmessage, 'CREATE TABLE')
+        self.assert_(curs.nextset())
+        self.assertEqual(curs.rowcount, 3)
+        self.assertEqual(curs.statusmessage, 'INSERT 0 3')
+        self.assert_(curs.nextset())
+        self.assertEqual(curs.description[0].name, 'id')
+        self.assertEqual(curs.fetchall(), [(1,), (2,), (3,)])
+        self.assertEqual(curs.nextset(), None)
+        self.assertEqual(curs.nextset(), None)
+
+        curs.execute("select 1; select 2")
+        curs.execute("select 3")
+        self.assertEqual(curs.fetchone(), (3,))
+        self.assertEqual(curs.nextset(), None)
+
+    def test_nextset_error(self):
+        curs = self.conn.cursor()
+        curs.multiple_results = True
+        self.assertRaises(psycopg2.DataError, curs.execute,
+            "select 1; select 1 / 0; select 2")
+        self.assertEqual(curs.nextset(), None)
+        self.conn.rollback()
+
     @skip_if_no_namedtuple
     def test_namedtuple_description(self):
         curs = self.conn.cursor()
@@ -428,6 +656,62 @@ class CursorTests(ConnectingTestCase):
         self.assertRaises((IndexError, psycopg2.ProgrammingError),
             cur.scroll, 10, mode='absolute')
 
+    def test_fetch_many_blocks(self):
+        cur = self.conn.cursor()
+        cur.execute("""select x, case when x % 3 = 0 then x / 2.0::float8 end,
+            x::text from generate_series(1, 5000) x""")
+        self.assertEqual(cur.fetchone(), (1, None, '1'))
+        rows = cur.fetchall()
+        self.assertEqual(len(rows), 4999)
+        self.assertEqual(rows[-1], (5000, None, '5000'))
+        self.assertEqual(rows[4000], (4002, 2001.0, '4002'))
+        self.assertEqual(cur.rownumber, 5000)
+
+    def test_fetchcolumns(self):
+        cur = self.conn.cursor()
+        cur.execute("""select x::int2, x::int4, x::int8 * 10000000000,
+            (x / 2.0)::float4, x / 4.0::float8, x::text, x::numeric
+            from generate_series(1, 3) x""")
+        cols = cur.fetchcolumns()
+        self.assertEqual(len(cols), 7)
+        for col in cols[:5]:
+            self.assertTrue(isinstance(col, array), type(col))
+        self.assertEqual([c.tolist() for c in cols[:5]], [
+            [1, 2, 3], [1, 2, 3], [10000000000, 20000000000, 30000000000],
+            [0.5, 1.0, 1.5], [0.25, 0.5, 0.75]])
+        self.assertEqual(cols[5], ['1', '2', '3'])
+        self.assertEqual(cols[6], [Decimal(1), Decimal(2), Decimal(3)])
+        self.assertEqual(cur.rownumber, 3)
+        self.assertEqual([len(c) for c in cur.fetchcolumns()], [0] * 7)
+
+    def test_fetchcolumns_nulls(self):
+        cur = self.conn.cursor()
+        cur.execute("select * from (values (1, 'a'), (null, null), (3, 'c'))"
+            " x (a, b)")
+        self.assertEqual(cur.fetchcolumns(), [[1, None, 3], ['a', None, 'c']])
+
+    def test_fetchcolumns_size(self):
+        cur = self.conn.cursor()
+        cur.execute("select generate_series(1, 5)")
+        self.assertEqual(cur.fetchone(), (1,))
+        self.assertEqual([c.tolist() for c in cur.fetchcolumns(2)], [[2, 3]])
+        self.assertEqual([c.tolist() for c in cur.fetchcolumns(10)],
+            [[4, 5]])
+        self.assertEqual(cur.fetchone(), None)
+
+    def test_fetchcolumns_named(self):
+        cur = self.conn.cursor('test_fetchcolumns')
+        cur.execute("select generate_series(1, 5), 'x'::text")
+        self.assertEqual(cur.fetchcolumns(2), [array('i', [1, 2]), ['x'] * 2])
+        self.assertEqual(cur.fetchone(), (3, 'x'))
+        self.assertEqual(cur.fetchcolumns(), [array('i', [4, 5]), ['x'] * 2])
+
+    def test_fetchcolumns_no_result(self):
+        cur = self.conn.cursor()
+        self.assertRaises(psycopg2.ProgrammingError, cur.fetchcolumns)
+        cur.execute("create temp table test_fetchcolumns (id int)")
+        self.assertRaises(psycopg2.ProgrammingError, cur.fetchcolumns)
+
 
 def test_suite():
     return unittest.TestLoader().loadTestsFromName(__name__)
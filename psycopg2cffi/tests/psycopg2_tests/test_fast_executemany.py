@@ -219,6 +219,31 @@ class TestExecuteValues(FastExecuteTestMixin, testutils.ConnectingTestCase):
         self.assertRaises(ValueError, psycopg2.extras.execute_values, cur,
             "insert %f %s", [])
 
+    def test_escaped_strings(self):
+        cur = self.conn.cursor()
+        data = [u"a\\b", u"it's", u"\\'", u"\u20ac\\", u"plain", None]
+        args = [(i, data[i % len(data)], date(2020, 1, 1 + i % 28))
+            for i in range(250)]
+        psycopg2.extras.execute_values(cur,
+            "insert into testfast (id, data, date) values %s", args,
+            page_size=100)
+        self.assertEqual(cur.mogrify("%s", (u"it's\\",)),
+            cur._mogrify_many("%s", [(u"it's\\",)])[0])
+
+        cur.execute("select id, data, date from testfast order by id")
+        self.assertEqual(cur.fetchall(), args)
+
+    def test_escaped_strings_latin1(self):
+        # Changing encoding rolls back the table creation
+        self.conn.set_client_encoding('LATIN1')
+        cur = self.conn.cursor()
+        cur.execute("create table testfast (id int primary key, data text)")
+        args = [(i, u"\xe8\\" if i % 2 else u"\xe8'") for i in range(10)]
+        psycopg2.extras.execute_values(cur,
+            "insert into testfast (id, data) values %s", args)
+        cur.execute("select id, data from testfast order by id")
+        self.assertEqual(cur.fetchall(), args)
+
     def test_percent_escape(self):
         cur = self.conn.cursor()
         psycopg2.extras.execute_values(cur,
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+#
+# test_numpy.py - tests for fetching results into NumPy arrays
+
+from psycopg2cffi.tests.psycopg2_tests.testutils import unittest, \
+        ConnectingTestCase, decorate_all_tests, skip_if_no_numpy
+from psycopg2cffi import extensions
+
+try:
+    import numpy
+except ImportError:
+    pass
+
+
+class FetchNumpyTests(ConnectingTestCase):
+
+    def fetch(self, query, binary=False, **kwargs):
+        cur = self.conn.cursor()
+        cur.binary = binary
+        cur.execute(query)
+        return cur.fetchnumpy(**kwargs)
+
+    def test_numbers(self):
+        for binary in (False, True):
+            cols = self.fetch("""select x::int2, -x::int4,
+                x::int8 * 10000000000, (x / 2.0)::float4, x / 4.0::float8,
+                x % 2 = 0 from generate_series(1, 3) x""", binary)
+            self.assertEqual([c.dtype.name for c in cols], ['int16', 'int32',
+                'int64', 'float32', 'float64', 'bool'])
+            self.assertEqual([c.tolist() for c in cols], [
+                [1, 2, 3], [-1, -2, -3],
+                [10000000000, 20000000000, 30000000000],
+                [0.5, 1.0, 1.5], [0.25, 0.5, 0.75], [False, True, False]])
+
+    def test_special_floats(self):
+        for binary in (False, True):
+            col = self.fetch("select x::float8 from unnest("
+                "array['nan', 'infinity', '-infinity', '1e300']) x", binary)[0]
+            self.assertTrue(numpy.isnan(col[0]))
+            self.assertEqual(col[1:].tolist(),
+                [float('inf'), float('-inf'), 1e300])
+
+    def test_dates(self):
+        query = """select '2020-01-02'::date, '1900-03-04 05:06:07.5'::timestamp,
+            '2020-01-02 03:04:05.123456+02:30'::timestamptz,
+            '0044-03-15 BC'::date, 'infinity'::timestamp"""
+        self.conn.cursor().execute("set timezone to 'UTC'")
+        for binary in (False, True):
+            cols = self.fetch(query, binary)
+            self.assertEqual(cols[0][0], numpy.datetime64('2020-01-02'))
+            self.assertEqual(cols[1][0],
+                numpy.datetime64('1900-03-04T05:06:07.500000'))
+            self.assertEqual(cols[2][0],
+                numpy.datetime64('2020-01-02T00:34:05.123456'))
+            self.assertEqual(cols[3][0], numpy.datetime64('-0043-03-15'))
+            self.assertEqual(cols[4][0].astype('int64'),
+                numpy.iinfo('int64').max)
+
+    def test_nulls(self):
+        for binary in (False, True):
+            cols = self.fetch("select * from (values (1, 'a'), (null, null), "
+                "(3, 'c')) x (a, b)", binary)
+            self.assertTrue(isinstance(cols[0], numpy.ma.MaskedArray))
+            self.assertEqual(cols[0].tolist(), [1, None, 3])
+            self.assertEqual(cols[0].mask.tolist(), [False, True, False])
+            self.assertEqual(cols[1].dtype, object)
+            self.assertEqual(cols[1].tolist(), ['a', None, 'c'])
+
+    def test_objects(self):
+        cols = self.fetch("select array[x, x], x::numeric "
+            "from generate_series(1, 2) x")
+        self.assertEqual(cols[0].shape, (2,))
+        self.assertEqual(cols[0].tolist(), [[1, 1], [2, 2]])
+        self.assertEqual([str(x) for x in cols[1]], ['1', '2'])
+
+    def test_structured(self):
+        arr = self.fetch("select x as a, x / 2.0::float8 as b, 'x' as c "
+            "from generate_series(1, 3) x", structured=True)
+        self.assertFalse(isinstance(arr, numpy.ma.MaskedArray))
+        self.assertEqual(arr.dtype.names, ('a', 'b', 'c'))
+        self.assertEqual(arr['a'].tolist(), [1, 2, 3])
+        self.assertEqual(arr[1].tolist(), (2, 1.0, 'x'))
+
+        arr = self.fetch("select * from (values (1, 1.5::float8), "
+            "(2, null)) x (a, b)", structured=True)
+        self.assertTrue(isinstance(arr, numpy.ma.MaskedArray))
+        self.assertEqual(arr['b'].tolist(), [1.5, None])
+        self.assertEqual(arr['a'].tolist(), [1, 2])
+
+    def test_size(self):
+        cur = self.conn.cursor('test_fetchnumpy')
+        cur.execute("select generate_series(1, 5)")
+        self.assertEqual(cur.fetchnumpy(2)[0].tolist(), [1, 2])
+        self.assertEqual(cur.fetchone(), (3,))
+        self.assertEqual(cur.fetchnumpy()[0].tolist(), [4, 5])
+        self.assertEqual(len(cur.fetchnumpy()[0]), 0)
+
+    def test_size_structured(self):
+        cur = self.conn.cursor('test_fetchnumpy')
+        cur.itersize = 2
+        cur.execute("select x, nullif(x, 4) from generate_series(1, 5) x")
+        self.assertEqual(cur.fetchone(), (1, 1))
+        arr = cur.fetchnumpy(structured=True)
+        self.assertEqual(arr['x'].tolist(), [2, 3, 4, 5])
+        self.assertEqual(arr['nullif'].tolist(), [2, 3, None, 5])
+
+decorate_all_tests(FetchNumpyTests, skip_if_no_numpy)
+
+
+class NumericArrayTests(ConnectingTestCase):
+
+    def fetch(self, query, oid, base):
+        cur = self.conn.cursor()
+        extensions.register_type(extensions.new_array_type(
+            (oid,), "NUMARRAY", base, container='numpy'), cur)
+        cur.execute(query)
+        return cur.fetchone()[0]
+
+    def test_types(self):
+        for oid, typ, base, dtype in [
+                (1005, 'int2', extensions.INTEGER, 'int16'),
+                (1007, 'int4', extensions.INTEGER, 'int32'),
+                (1016, 'int8', extensions.LONGINTEGER, 'int64'),
+                (1021, 'float4', extensions.FLOAT, 'float32'),
+                (1022, 'float8', extensions.FLOAT, 'float64')]:
+            arr = self.fetch("select '{1,-2,3}'::%s[]" % typ, oid, base)
+            self.assert_(isinstance(arr, numpy.ndarray))
+            self.assertEqual(arr.dtype.name, dtype)
+            self.assertEqual(arr.tolist(), [1, -2, 3])
+
+    def test_shape(self):
+        arr = self.fetch("select '{{1.5,2},{3,4},{5,6}}'::float8[]",
+            1022, extensions.FLOAT)
+        self.assertEqual(arr.shape, (3, 2))
+        self.assertEqual(arr.tolist(), [[1.5, 2], [3, 4], [5, 6]])
+        arr = self.fetch("select '{}'::float8[]", 1022, extensions.FLOAT)
+        self.assertEqual(arr.shape, (0,))
+
+    def test_nulls(self):
+        arr = self.fetch("select '{{1,NULL},{NULL,4}}'::int8[]",
+            1016, extensions.LONGINTEGER)
+        self.assert_(isinstance(arr, numpy.ma.MaskedArray))
+        self.assertEqual(arr.tolist(), [[1, None], [None, 4]])
+
+    def test_special_floats(self):
+        arr = self.fetch(
+            "select '{NaN,Infinity,-Infinity,1e300}'::float8[]",
+            1022, extensions.FLOAT)
+        self.assertTrue(numpy.isnan(arr[0]))
+        self.assertEqual(arr[1:].tolist(),
+            [float('inf'), float('-inf'), 1e300])
+
+    def test_column(self):
+        cur = self.conn.cursor()
+        extensions.register_type(extensions.new_array_type(
+            (1022,), "NUMARRAY", extensions.FLOAT, container='numpy'), cur)
+        cur.execute("select array[x, x * 2.0::float8], null::float8[] "
+            "from generate_series(1, 3) x")
+        rows = cur.fetchall()
+        self.assertEqual([r[0].tolist() for r in rows],
+            [[1, 2], [2, 4], [3, 6]])
+        self.assertEqual(rows[0][1], None)
+
+decorate_all_tests(NumericArrayTests, skip_if_no_numpy)
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+#
+# test_prepared.py - tests for the connection prepared statements cache
+
+from psycopg2cffi.tests.psycopg2_tests.testutils import unittest, \
+        ConnectingTestCase
+
+import psycopg2cffi as psycopg2
+
+
+class PreparedStatementsTests(ConnectingTestCase):
+
+    def setUp(self):
+        ConnectingTestCase.setUp(self)
+        self.conn.server_binding = True
+        self.conn.prepare_threshold = 2
+
+    def prepared(self):
+        cur = self.conn.cursor()
+        cur.server_binding = False
+        cur.execute("select statement from pg_prepared_statements "
+            "where name like '\\_psycopg2cffi\\_%' order by statement")
+        return [r[0] for r in cur.fetchall()]
+
+    def test_default(self):
+        conn = self.connect()
+        self.assertEqual(conn.prepare_threshold, 5)
+        self.assertEqual(conn.prepared_hits, 0)
+        self.assertEqual(conn.prepared_misses, 0)
+
+    def test_threshold(self):
+        cur = self.conn.cursor()
+        for i in range(5):
+            cur.execute("select %s + 1", (i,))
+            self.assertEqual(cur.fetchone(), (i + 1,))
+            self.assertEqual(self.prepared(),
+                ["select $1 + 1"] if i >= 2 else [])
+        self.assertEqual(self.conn.prepared_misses, 3)
+        self.assertEqual(self.conn.prepared_hits, 2)
+
+    def test_types_in_key(self):
+        cur = self.conn.cursor()
+        for i in range(3):
+            cur.execute("select %s", (i,))
+        self.assertEqual(self.conn.prepared_misses, 3)
+        cur.execute("select %s", (2 ** 40,))
+        self.assertEqual(cur.fetchone(), (2 ** 40,))
+        self.assertEqual(self.conn.prepared_misses, 4)
+        cur.execute("select %s", (1,))
+        self.assertEqual(self.conn.prepared_hits, 1)
+
+    def test_disabled(self):
+        self.conn.prepare_threshold = None
+        cur = self.conn.cursor()
+        for i in range(5):
+            cur.execute("select %s", (i,))
+        self.assertEqual(self.prepared(), [])
+        self.assertEqual(self.conn.prepared_hits, 0)
+
+    def test_binary_without_params(self):
+        self.conn.prepare_threshold = 0
+        cur = self.conn.cursor()
+        cur.binary = True
+        cur.execute("select 42")
+        self.assertEqual(cur.fetchone(), (42,))
+        self.assertEqual(self.prepared(), ["select 42"])
+
+    def test_evict(self):
+        self.conn.prepare_threshold = 0
+        self.conn.prepared_max = 2
+        cur = self.conn.cursor()
+        for q in ["select %s", "select %s + 1", "select %s", "select %s + 2"]:
+            cur.execute(q, (1,))
+        self.assertEqual(self.prepared(), ["select $1", "select $1 + 2"])
+
+    def test_reset(self):
+        self.conn.prepare_threshold = 0
+        cur = self.conn.cursor()
+        cur.execute("select %s", (1,))
+        self.conn.reset()
+        self.assertEqual(self.prepared(), [])
+        cur.execute("select %s", (1,))
+        self.assertEqual(cur.fetchone(), (1,))
+
+    def test_stale_plan(self):
+        self.conn.prepare_threshold = 0
+        cur = self.conn.cursor()
+        cur.execute("create table test_stale (id int)")
+        cur.execute("select * from test_stale where id = %s", (1,))
+        cur.execute("select * from test_stale where %s", (True,))
+        cur.execute("alter table test_stale add data text")
+        self.assertRaises(psycopg2.NotSupportedError, cur.execute,
+            "select * from test_stale where id = %s", (1,))
+        self.conn.rollback()
+
+        cur.execute("create table test_stale (id int, data text)")
+        cur.execute("insert into test_stale values (1, 'a')")
+        cur.execute("select * from test_stale where id = %s", (1,))
+        self.assertEqual(cur.fetchall(), [(1, 'a')])
+        self.assertEqual(self.prepared(),
+            ["select * from test_stale where id = $1"])
+
+    def test_discard_all(self):
+        self.conn.prepare_threshold = 0
+        self.conn.autocommit = True
+        cur = self.conn.cursor()
+        cur.execute("select %s", (1,))
+        cur.execute("discard all")
+        cur.execute("select %s", (2,))
+        self.assertEqual(cur.fetchone(), (2,))
+        self.assertEqual(self.prepared(), ["select $1"])
+
+    def test_deallocate_all(self):
+        self.conn.prepare_threshold = 0
+        cur = self.conn.cursor()
+        cur.execute("select %s", (1,))
+        cur.execute("deallocate all")
+        cur.execute("select %s", (2,))
+        self.assertEqual(cur.fetchone(), (2,))
+        self.assertEqual(self.prepared(), ["select $1"])
+
+    def test_deallocated_statement(self):
+        self.conn.prepare_threshold = 0
+        cur = self.conn.cursor()
+        cur.execute("select %s", (1,))
+        cur.execute("select %s + 1", (1,))
+        cur2 = self.conn.cursor()
+        cur2.server_binding = False
+        cur2.execute("select name from pg_prepared_statements "
+            "where statement = 'select $1'")
+        cur2.execute("deallocate %s" % cur2.fetchone()[0])
+        self.assertRaises(psycopg2.OperationalError, cur.execute,
+            "select %s", (1,))
+        self.conn.rollback()
+
+        # The statements are prepared again: only the existing one is
+        # deallocated
+        cur.execute("select %s", (2,))
+        self.assertEqual(cur.fetchone(), (2,))
+        cur.execute("select %s + 1", (2,))
+        self.assertEqual(cur.fetchone(), (3,))
+        self.assertEqual(self.prepared(), ["select $1", "select $1 + 1"])
+
+    def test_failed_transaction(self):
+        self.conn.prepare_threshold = 0
+        cur = self.conn.cursor()
+        self.assertRaises(psycopg2.ProgrammingError, cur.execute,
+            "select nosuchcol")
+        self.assertRaises(psycopg2.InternalError, cur.execute,
+            "select %s", (1,))
+        self.conn.rollback()
+        cur.execute("select %s", (1,))
+        self.assertEqual(cur.fetchone(), (1,))
+        self.assertEqual(self.prepared(), ["select $1"])
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -171,6 +171,54 @@ class TestQuotedString(ConnectingTestCase):
         self.assertEqual(q.encoding, 'utf_8')
 
 
+class TestScalarQuoting(ConnectingTestCase):
+    def check(self, obj):
+        adapter = extensions.adapt(obj)
+        if hasattr(adapter, 'prepare'):
+            adapter.prepare(self.conn)
+        self.assertEqual(
+            self.conn.cursor().mogrify("%s", (obj,)), adapter.getquoted())
+
+    def test_same_as_adapters(self):
+        for obj in [True, False, 0, 42, -42, 2 ** 70, -2 ** 70,
+                1.5, -1.5, -0.0, 1e300, float('nan'), float('-inf'),
+                '', 'x', "it's", 'back\\slash', 'nul\x00byte']:
+            self.check(obj)
+
+    def test_encodings(self):
+        for enc in ['UTF8', 'LATIN1', 'SJIS']:
+            self.conn.set_client_encoding(enc)
+            for obj in ["'ascii'", _u(b'caf\xc3\xa9'), _u(b'\xe2\x82\xac'),
+                    _u(b"\xc3\xa9'\\")]:
+                try:
+                    obj.encode(extensions.encodings[enc])
+                except UnicodeEncodeError:
+                    continue
+                self.check(obj)
+
+    def test_subclasses(self):
+        class MyInt(int):
+            def __str__(self):
+                return '-7'
+
+        class MyStr(str):
+            pass
+
+        self.check(MyInt(7))
+        self.check(MyStr("it's"))
+
+    def test_custom_adapter(self):
+        extensions.register_adapter(int,
+            lambda i: extensions.AsIs('%d::int8' % i))
+        try:
+            self.assertEqual(
+                self.conn.cursor().mogrify("%s", (1,)), b'1::int8')
+        finally:
+            del extensions.adapters[int, extensions.ISQLQuote]
+            extensions.register_adapter(int, extensions.Int)
+        self.assertEqual(self.conn.cursor().mogrify("%s", (1,)), b'1')
+
+
 def test_suite():
     return unittest.TestLoader().loadTestsFromName(__name__)
 
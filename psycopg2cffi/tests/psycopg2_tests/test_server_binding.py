@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+#
+# test_server_binding.py - tests for parameters bound server-side
+
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from psycopg2cffi.tests.psycopg2_tests.testutils import unittest, \
+        ConnectingTestCase
+
+import psycopg2cffi as psycopg2
+from psycopg2cffi import extensions, tz
+
+
+class ServerBindingTests(ConnectingTestCase):
+
+    def setUp(self):
+        ConnectingTestCase.setUp(self)
+        self.conn.server_binding = True
+
+    def execute(self, query, params):
+        cur = self.conn.cursor()
+        cur.execute(query, params)
+        return cur.fetchone()
+
+    def test_default(self):
+        conn = self.connect()
+        self.assertFalse(conn.server_binding)
+        self.assertFalse(conn.cursor().server_binding)
+        cur = self.conn.cursor()
+        self.assertTrue(cur.server_binding)
+        cur.server_binding = False
+        self.assertFalse(cur.server_binding)
+
+    def test_query(self):
+        cur = self.conn.cursor()
+        cur.execute("select %s, %s, '%%s'", (1, 'x'))
+        self.assertEqual(cur.query, b"select $1, $2, '%s'")
+        self.assertEqual(cur.fetchone(), (1, 'x', '%s'))
+
+    def test_named(self):
+        cur = self.conn.cursor()
+        cur.execute("select %(a)s, %(b)s, %(a)s", {'a': 10, 'b': 20})
+        self.assertEqual(cur.query, b"select $1, $2, $1")
+        self.assertEqual(cur.fetchone(), (10, 20, 10))
+
+    def test_numbers(self):
+        self.assertEqual(
+            self.execute("select %s, %s, %s, %s",
+                (1, -2 ** 40, 10 ** 30, Decimal('1.50'))),
+            (1, -2 ** 40, 10 ** 30, Decimal('1.50')))
+        self.assertEqual(
+            self.execute("select pg_typeof(%s)::text, pg_typeof(%s)::text, "
+                "pg_typeof(%s)::text", (1, 2 ** 40, 1.5)),
+            ('integer', 'bigint', 'numeric'))
+        self.assertEqual(
+            self.execute("select %s, %s", (float('inf'), float('-inf'))),
+            (float('inf'), float('-inf')))
+        self.assertEqual(self.execute("select repeat('a', %s)", (3,)),
+            ('aaa',))
+
+    def test_strings(self):
+        s = u"quote ' backslash \\ and \xe8\u20ac"
+        self.assertEqual(self.execute("select %s", (s,)), (s,))
+        self.assertEqual(self.execute("select %s::int", ('42',)), (42,))
+
+    def test_bool_null(self):
+        self.assertEqual(self.execute("select %s, %s, %s::int",
+            (True, False, None)), (True, False, None))
+
+    def test_bytea(self):
+        data = bytes(bytearray(range(256)))
+        for obj in [data, bytearray(data), memoryview(data),
+                psycopg2.Binary(data)]:
+            self.assertEqual(bytes(self.execute("select %s", (obj,))[0]),
+                data)
+
+    def test_dates(self):
+        values = (date(2020, 1, 2), datetime(2020, 1, 2, 3, 4, 5, 6),
+            time(12, 34, 56), timedelta(-1, 5, 7),
+            datetime(2020, 1, 2, 3, 4, tzinfo=tz.FixedOffsetTimezone(0)))
+        self.assertEqual(self.execute("select %s, %s, %s, %s, %s", values),
+            values)
+
+    def test_merged_params(self):
+        cur = self.conn.cursor()
+        cur.execute("select %s, %s = any(%s), 1 in %s",
+            (1, 2, [1, 2, 3], (1, 5)))
+        self.assertEqual(cur.query,
+            b"select $1, $2 = any(ARRAY[1, 2, 3]), 1 in (1, 5)")
+        self.assertEqual(cur.fetchone(), (1, True, True))
+
+    def test_custom_adapter(self):
+        class MyInt(int):
+            pass
+
+        extensions.register_adapter(MyInt,
+            lambda obj: extensions.AsIs(b'(%d * 2)' % obj))
+        try:
+            cur = self.conn.cursor()
+            cur.execute("select %s, %s", (MyInt(3), 3))
+            self.assertEqual(cur.query, b"select (3 * 2), $1")
+            self.assertEqual(cur.fetchone(), (6, 3))
+        finally:
+            del extensions.adapters[(MyInt, extensions.ISQLQuote)]
+
+    def test_errors(self):
+        cur = self.conn.cursor()
+        self.assertRaises(TypeError, cur.execute, "select %s", (1, 2))
+        self.assertRaises(IndexError, cur.execute, "select %s, %s", (1,))
+        self.assertRaises(ValueError, cur.execute, "select %s, %(a)s", (1,))
+        self.assertRaises(KeyError, cur.execute, "select %(a)s", {'b': 1})
+
+    def test_binary_results(self):
+        cur = self.conn.cursor()
+        cur.binary = True
+        cur.execute("select %s + 1, %s", (41, b'\x00\x01'))
+        row = cur.fetchone()
+        self.assertEqual(row[0], 42)
+        self.assertEqual(bytes(row[1]), b'\x00\x01')
+
+    def test_named_cursor(self):
+        cur = self.conn.cursor('named')
+        cur.execute("select generate_series(1, %s)", (3,))
+        self.assertEqual(cur.fetchall(), [(1,), (2,), (3,)])
+
+    def test_executemany(self):
+        cur = self.conn.cursor()
+        cur.execute("create temp table sb (id int, data text)")
+        cur.executemany("insert into sb values (%s, %s)",
+            [(i, str(i)) for i in range(5)])
+        self.assertEqual(cur.rowcount, 5)
+        cur.execute("select sum(id) from sb")
+        self.assertEqual(cur.fetchone()[0], 10)
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+if __name__ == "__main__":
+    unittest.main()
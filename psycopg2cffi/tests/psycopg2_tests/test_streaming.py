@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+#
+# test_streaming.py - tests for cursors in streaming mode
+
+from psycopg2cffi.tests.psycopg2_tests.testutils import unittest, \
+        ConnectingTestCase
+
+import psycopg2cffi as psycopg2
+
+
+class StreamingTests(ConnectingTestCase):
+
+    def cursor(self):
+        cur = self.conn.cursor()
+        cur.streaming = True
+        return cur
+
+    def test_default(self):
+        self.assertFalse(self.conn.cursor().streaming)
+
+    def test_iter(self):
+        cur = self.cursor()
+        cur.execute("select x, x::text from generate_series(1, 5000) x")
+        self.assertEqual(cur.rowcount, -1)
+        self.assertEqual([c.name for c in cur.description], ['x', 'x'])
+        n = 0
+        for row in cur:
+            n += 1
+            self.assertEqual(row, (n, str(n)))
+        self.assertEqual(n, 5000)
+        self.assertEqual(cur.rowcount, 5000)
+        self.assertEqual(cur.statusmessage, 'SELECT 5000')
+
+    def test_fetch(self):
+        cur = self.cursor()
+        cur.execute("select generate_series(1, 10)")
+        self.assertEqual(cur.fetchone(), (1,))
+        self.assertEqual(cur.rownumber, 1)
+        self.assertEqual(cur.fetchmany(3), [(2,), (3,), (4,)])
+        self.assertEqual(cur.rownumber, 4)
+        self.assertEqual(cur.fetchall(), [(i,) for i in range(5, 11)])
+        self.assertEqual(cur.rownumber, 10)
+        self.assertEqual(cur.rowcount, 10)
+        self.assertEqual(cur.fetchone(), None)
+        self.assertEqual(cur.fetchmany(2), [])
+        self.assertEqual(cur.fetchall(), [])
+
+    def test_empty(self):
+        cur = self.cursor()
+        cur.execute("select 1 as x where false")
+        self.assertEqual(cur.description[0].name, 'x')
+        self.assertEqual(cur.rowcount, 0)
+        self.assertEqual(cur.fetchone(), None)
+
+    def test_command(self):
+        cur = self.cursor()
+        cur.execute("create temp table test_streaming (id int)")
+        cur.execute("insert into test_streaming select generate_series(1, 3)")
+        self.assertEqual(cur.rowcount, 3)
+        self.assertEqual(cur.description, None)
+        cur.execute("set datestyle to iso; select count(*) from test_streaming")
+        self.assertEqual(cur.fetchall(), [(3,)])
+
+    def test_params(self):
+        cur = self.cursor()
+        cur.execute("select generate_series(1, %s), %s", (3, 'x'))
+        self.assertEqual(cur.fetchall(), [(1, 'x'), (2, 'x'), (3, 'x')])
+
+        cur.binary = True
+        cur.server_binding = True
+        cur.execute("select generate_series(1, %s), %s", (3, 'x'))
+        self.assertEqual(cur.fetchall(), [(1, 'x'), (2, 'x'), (3, 'x')])
+
+    def test_error(self):
+        cur = self.cursor()
+        cur.execute("select 1 / (5 - x) from generate_series(1, 10) x")
+        self.assertEqual(cur.fetchmany(2), [(0,), (0,)])
+        self.assertRaises(psycopg2.DataError, cur.fetchall)
+        self.conn.rollback()
+        self.assertRaises(psycopg2.DataError, self.cursor().execute,
+            "select 1 / 0")
+
+    def test_error_after_rows(self):
+        cur = self.cursor()
+        cur.execute("select generate_series(1, 3); select 1 / 0")
+        self.assertRaises(psycopg2.DataError, cur.fetchall)
+
+    def test_other_query(self):
+        cur = self.cursor()
+        cur.execute("select generate_series(1, 1000)")
+        self.assertEqual(cur.fetchone(), (1,))
+
+        cur2 = self.conn.cursor()
+        cur2.execute("select 42")
+        self.assertEqual(cur2.fetchone(), (42,))
+        self.assertEqual(cur.fetchone(), None)
+
+        cur.execute("select generate_series(1, 1000)")
+        self.assertEqual(cur.fetchone(), (1,))
+        cur.execute("select generate_series(1, 2)")
+        self.assertEqual(cur.fetchall(), [(1,), (2,)])
+
+        cur.execute("select generate_series(1, 1000)")
+        self.conn.commit()
+        self.assertEqual(cur.fetchone(), None)
+
+    def test_close(self):
+        cur = self.cursor()
+        cur.execute("select generate_series(1, 1000)")
+        cur.close()
+        cur = self.conn.cursor()
+        cur.execute("select 1")
+        self.assertEqual(cur.fetchone(), (1,))
+
+    def test_scroll(self):
+        cur = self.cursor()
+        cur.execute("select generate_series(1, 1000)")
+        self.assertRaises(psycopg2.ProgrammingError, cur.scroll, 1)
+        self.assertRaises(psycopg2.ProgrammingError, cur.fetchcolumns)
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -90,6 +90,85 @@ class TransactionTests(ConnectingTestCase):
         curs.execute('SELECT 1')
         self.assertEqual(curs.fetchone()[0], 1)
 
+    def test_begin_with_first_statement(self):
+        # BEGIN is sent in the same message as the first statement
+        curs = self.conn.cursor()
+        curs.execute(
+            'SELECT transaction_timestamp() = statement_timestamp()')
+        self.assertEqual(curs.fetchone()[0], True)
+        self.assertEqual(self.conn.get_transaction_status(),
+            psycopg2.extensions.TRANSACTION_STATUS_INTRANS)
+        curs.execute('INSERT INTO table2 VALUES (2, 1)')
+        self.conn.rollback()
+        curs.execute('SELECT count(*) FROM table2')
+        self.assertEqual(curs.fetchone()[0], 1)
+
+    def test_begin_syntax_error(self):
+        # BEGIN is not executed if the statement can't be parsed
+        curs = self.conn.cursor()
+        self.assertRaises(psycopg2.ProgrammingError, curs.execute, 'SELEC 1')
+        self.assertEqual(self.conn.status, STATUS_BEGIN)
+        curs.execute('INSERT INTO table2 VALUES (2, 1)')
+        self.conn.rollback()
+        curs.execute('SELECT count(*) FROM table2')
+        self.assertEqual(curs.fetchone()[0], 1)
+        self.conn.rollback()
+
+        curs.streaming = True
+        self.assertRaises(psycopg2.ProgrammingError, curs.execute, 'SELEC 1')
+        self.assertEqual(self.conn.status, STATUS_BEGIN)
+        curs.execute('INSERT INTO table2 VALUES (2, 1)')
+        self.conn.rollback()
+        curs.execute('SELECT count(*) FROM table2')
+        self.assertEqual(curs.fetchone()[0], 1)
+
+    def test_begin_error_position(self):
+        # The BEGIN sent with the query doesn't show in the errors
+        curs = self.conn.cursor()
+        for query in ('select nosuchcol', 'select 1,\n nosuchcol',
+                'select 1' + '\n' * 9 + ', nosuchcol'):
+            self.conn.autocommit = True
+            try:
+                curs.execute(query)
+            except psycopg2.ProgrammingError as e:
+                expected = (e.diag.statement_position, e.pgerror, str(e))
+            self.conn.autocommit = False
+            for streaming in (False, True):
+                curs.streaming = streaming
+                try:
+                    curs.execute(query)
+                except psycopg2.ProgrammingError as e:
+                    self.assertEqual(
+                        (e.diag.statement_position, e.pgerror, str(e)),
+                        expected)
+                else:
+                    self.fail("no error raised")
+                self.conn.rollback()
+
+    def test_begin_extended_protocol(self):
+        curs = self.conn.cursor()
+        curs.server_binding = True
+        curs.execute('INSERT INTO table2 VALUES (%s, %s)', (2, 1))
+        self.assertRaises(psycopg2.IntegrityError, curs.execute,
+            'INSERT INTO table2 VALUES (%s, %s)', (3, 42))
+        self.conn.rollback()
+        curs.executemany('INSERT INTO table2 VALUES (%s, %s)',
+            [(3, 1), (4, 1)])
+        self.conn.rollback()
+        curs.execute('SELECT count(*) FROM table2')
+        self.assertEqual(curs.fetchone()[0], 1)
+
+    def test_empty_transaction(self):
+        curs = self.conn.cursor()
+        curs.execute('SELECT 1')
+        self.conn.commit()
+        self.conn.tpc_begin(self.conn.xid(1, 'gtrid', 'bqual'))
+        self.assertEqual(self.conn.status, STATUS_BEGIN)
+        self.conn.tpc_rollback()
+        self.assertEqual(self.conn.status, STATUS_READY)
+        self.conn.commit()
+        self.assertEqual(self.conn.status, STATUS_READY)
+
 
 class DeadlockSerializationTests(ConnectingTestCase):
     """Test deadlock and serialization failure errors."""
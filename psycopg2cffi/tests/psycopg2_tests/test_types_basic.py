@@ -23,6 +23,7 @@
 # License for more details.
 
 import decimal
+import math
 
 import sys
 import six
@@ -117,6 +118,27 @@ class TypesBasicTests(ConnectingTestCase):
             buf = self.execute("SELECT %s::bytea AS foo", (b,))
             self.assertEqual(s, buf.tobytes())
 
+    @testutils.skip_before_python(3)
+    def testBinaryBuffers(self):
+        s = bytes(range(256)) * 10
+        for obj in [bytearray(s), memoryview(s), memoryview(s)[::3]]:
+            buf = self.execute("SELECT %s::bytea AS foo",
+                (psycopg2.Binary(obj),))
+            self.assertEqual(bytes(obj), buf.tobytes())
+
+    @testutils.skip_before_postgres(9, 0)
+    def testBinaryHexQuoting(self):
+        s = bytes(bytearray([0, 92, 39, 255]))
+        curs = self.conn.cursor()
+        for std, quoted in [('on', b("'\\x005c27ff'::bytea")),
+                ('off', b("E'\\\\x005c27ff'::bytea"))]:
+            curs.execute("SET standard_conforming_strings TO " + std)
+            self.assertEqual(
+                curs.mogrify("%s", (psycopg2.Binary(s),)), quoted)
+            buf = self.execute("SELECT %s::bytea AS foo",
+                (psycopg2.Binary(s),))
+            self.assertEqual(s, bytes(buf))
+
     def testBinaryNone(self):
         b = psycopg2.Binary(None)
         buf = self.execute("SELECT %s::bytea AS foo", (b,))
@@ -327,6 +349,73 @@ class TypesBasicTests(ConnectingTestCase):
         self.assertEqual(a, [2,4,'nada'])
 
 
+    def testArrayQuotedNull(self):
+        a = self.execute(
+            "select array['NULL', null, 'null', 'Null', 'nullx']::text[]")
+        self.assertEqual(a, ['NULL', None, 'null', 'Null', 'nullx'])
+        a = self.execute("select '{NULL,\"NULL\",N\\ULL}'::text[]")
+        self.assertEqual(a, [None, 'NULL', 'NULL'])
+
+    def testNumericArrays(self):
+        a = self.execute("select %s::int8[]",
+            ([-2 ** 63, 2 ** 63 - 1, None, 0],))
+        self.assertEqual(a, [-2 ** 63, 2 ** 63 - 1, None, 0])
+        a = self.execute("select '{{1,2},{3,NULL}}'::int2[]")
+        self.assertEqual(a, [[1, 2], [3, None]])
+        a = self.execute(
+            "select '{1.5,-2.25e-10,NaN,Infinity,-Infinity,NULL}'::float8[]")
+        self.assertEqual(a[:2], [1.5, -2.25e-10])
+        self.assert_(math.isnan(a[2]))
+        self.assertEqual(a[3:], [float('inf'), float('-inf'), None])
+        a = self.execute("select '{0.1}'::float4[]")
+        self.assertEqual(a, [0.1])
+
+    def testArrayLarge(self):
+        a = self.execute("select array_agg(x) from generate_series(1, 5000) x")
+        self.assertEqual(a, list(range(1, 5001)))
+        a = self.execute(
+            "select array_agg(array[x::text, x || ' \"' || x]) "
+            "from generate_series(1, 1000) x")
+        self.assertEqual(a, [[str(x), '%s "%s' % (x, x)]
+            for x in range(1, 1001)])
+
+    def testNumericArrayContainer(self):
+        from array import array
+        curs = self.conn.cursor()
+        for oid, typ, base, itemsize in [
+                (1005, 'int2', extensions.INTEGER, 2),
+                (1007, 'int4', extensions.INTEGER, 4),
+                (1016, 'int8', extensions.LONGINTEGER, 8),
+                (1021, 'float4', extensions.FLOAT, 4),
+                (1022, 'float8', extensions.FLOAT, 8)]:
+            extensions.register_type(extensions.new_array_type(
+                (oid,), "NUMARRAY", base, container='array'), curs)
+            curs.execute("select '{1,-2,3}'::%s[], '{}'::%s[], "
+                "'{{1,2},{3,4}}'::%s[], '{1,NULL}'::%s[]" % ((typ,) * 4))
+            a, empty, nested, nulls = curs.fetchone()
+            self.assert_(isinstance(a, array))
+            self.assertEqual(a.itemsize, itemsize)
+            self.assertEqual(a.tolist(), [1, -2, 3])
+            self.assertEqual(len(empty), 0)
+            self.assertEqual([x.tolist() for x in nested], [[1, 2], [3, 4]])
+            self.assertEqual(nulls, [1, None])
+
+    def testNumericArrayContainerErrors(self):
+        self.assertRaises(ValueError, extensions.new_array_type,
+            (1007,), "NUMARRAY", extensions.INTEGER, container='tuple')
+        self.assertRaises(ValueError, extensions.new_array_type,
+            (1007, 1022), "NUMARRAY", extensions.INTEGER, container='array')
+        self.assertRaises(ValueError, extensions.new_array_type,
+            (1009,), "NUMARRAY", extensions.UNICODE, container='array')
+
+    def testArrayMalformedInteger(self):
+        caster = extensions.new_array_type((), "INTARRAY", extensions.INTEGER)
+        curs = self.conn.cursor()
+        for s in ['', '{', '{1', '1}', '{1}}', '{{1}', '{"1}', '{1}{2}',
+                '{' * 20 + '}' * 20]:
+            self.assertRaises(psycopg2.DataError, caster, b(s), curs)
+
+
 class AdaptSubclassTest(unittest.TestCase):
     def test_adapt_subtype(self):
         from psycopg2cffi.extensions import adapt
@@ -377,6 +466,34 @@ class AdaptSubclassTest(unittest.TestCase):
         finally:
            del extensions.adapters[A, extensions.ISQLQuote]
 
+    def test_adapt_cache_invalidation(self):
+        from psycopg2cffi.extensions import adapt, register_adapter, AsIs
+
+        class A(object): pass
+        class B(A): pass
+
+        self.assertRaises(psycopg2.ProgrammingError, adapt, B())
+        register_adapter(A, lambda a: AsIs("a"))
+        try:
+            self.assertEqual(b("a"), adapt(B()).getquoted())
+            register_adapter(B, lambda a: AsIs("b"))
+            self.assertEqual(b("b"), adapt(B()).getquoted())
+            del extensions.adapters[B, extensions.ISQLQuote]
+            self.assertEqual(b("a"), adapt(B()).getquoted())
+        finally:
+            extensions.adapters.pop((A, extensions.ISQLQuote), None)
+        self.assertRaises(psycopg2.ProgrammingError, adapt, B())
+
+    def test_adapt_conform_cached(self):
+        from psycopg2cffi.extensions import adapt, AsIs
+
+        class A(object):
+            def __conform__(self, proto):
+                return AsIs("conformed")
+
+        for i in range(3):
+            self.assertEqual(b("conformed"), adapt(A()).getquoted())
+
 
 class ByteaParserTest(unittest.TestCase):
     """Unit test for our bytea format parser."""
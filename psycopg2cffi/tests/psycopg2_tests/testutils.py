@@ -205,6 +205,20 @@ def skip_if_no_iobase(f):
     return skip_if_no_iobase_
 
 
+def skip_if_no_numpy(f):
+    """Skip a test if NumPy is not installed."""
+    @wraps(f)
+    def skip_if_no_numpy_(self):
+        try:
+            import numpy
+        except ImportError:
+            return self.skipTest("numpy not available")
+        else:
+            return f(self)
+
+    return skip_if_no_numpy_
+
+
 def skip_before_postgres(*ver):
     """Skip a test on PostgreSQL before a certain version."""
     ver = ver + (0,) * (3 - len(ver))